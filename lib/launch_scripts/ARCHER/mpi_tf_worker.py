@@ -4,31 +4,30 @@
 """
 MPI Task-farm worker script.
 
-Inspired by
-https://raw.githubusercontent.com/jbornschein/mpi4py-examples/master/09-task-pull.py
+The task farm is shared with logan (see lib/python/logan/taskfarm.py).
 """
 
 import sys
 import os
 import json
 import subprocess
-import collections
 import time
 import pickle
 
-from mpi4py import MPI
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, os.pardir, "python"))
+from logan.taskfarm import TaskFarm
 
-# Have the master execute a task as well or not
-MASTER_TASK = True
+# Completed tasks are appended to the journal (flushed per task), which is
+# synced to disk after this many tasks or seconds, whichever comes first.
+# Tasks completed since the last sync may be executed again on resume.
+JOURNAL_SYNC_COUNT = 64
+JOURNAL_SYNC_SECONDS = 10.0
 
-class Tags(object):
-    READY = 0x1
-    DONE  = 0x2
-    EXIT  = 0x4
-    START = 0x8
-
-MPI_Context = collections.namedtuple('MPI_Context',
-                                     ['comm', 'size', 'rank', 'status'])
+# The journal is compacted into the snapshot once it has more entries than
+# the snapshot (and at least this many), so that the cost per task stays
+# constant.
+JOURNAL_COMPACT_MIN = 1024
 
 def exec_process(process):
     cmd = process['cmd']
@@ -51,143 +50,161 @@ def exec_process(process):
 
     return _check_status
 
-def master(mpi_ctx, json_path):
+class ProgressJournal(object):
+    """
+    Set of completed tids, persisted as a snapshot (a pickled set, which
+    exists while the task-farm is running; see tf_submit.py) and an
+    append-only journal of the tids completed since the snapshot, a JSON
+    value per line.
+    """
+    def __init__(self, snapshot_path):
+        self.snapshot_path = snapshot_path
+        self.journal_path = snapshot_path + ".journal"
+        self.complete = set()
+
+        self._journal = None
+        self._journal_count = 0
+        self._unsynced_count = 0
+        self._last_sync = time.time()
+
+    def load(self):
+        """
+        Loads the snapshot and replays the journal, if they exist.
+
+        @return: True if resuming.
+        """
+        resuming = False
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'rb') as snapshot_file:
+                self.complete = pickle.load(snapshot_file)
+            resuming = True
+
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'r') as journal_file:
+                for line in journal_file:
+                    # The last line may be incomplete, if interrupted while
+                    # appending.
+                    if not line.endswith("\n"):
+                        break
+                    self.complete.add(json.loads(line))
+            resuming = True
+
+        return resuming
+
+    def open(self):
+        """
+        Compacts the loaded state, and opens the journal for appending.
+        """
+        self.compact()
+
+    def add(self, tid):
+        self.complete.add(tid)
+        self._journal.write(json.dumps(tid) + "\n")
+        # Survives the master being killed; only syncing to disk is batched.
+        self._journal.flush()
+        self._journal_count += 1
+        self._unsynced_count += 1
+
+        if self._journal_count >= max(JOURNAL_COMPACT_MIN, len(self.complete) - self._journal_count):
+            self.compact()
+        elif self._unsynced_count >= JOURNAL_SYNC_COUNT or \
+                time.time() - self._last_sync >= JOURNAL_SYNC_SECONDS:
+            self.sync()
+
+    def sync(self):
+        if self._journal is not None and self._unsynced_count:
+            os.fsync(self._journal.fileno())
+        self._unsynced_count = 0
+        self._last_sync = time.time()
+
+    def compact(self):
+        """
+        Writes all completed tids to the snapshot, and truncates the
+        journal.
+        """
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, 'wb') as snapshot_file:
+            pickle.dump(self.complete, snapshot_file)
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        os.rename(tmp_path, self.snapshot_path)
+
+        # Entries of the journal are in the snapshot now; entries replayed
+        # again are harmless, should the master be interrupted in between.
+        if self._journal is not None:
+            self._journal.close()
+        self._journal = open(self.journal_path, 'w')
+        self._journal_count = 0
+        self._unsynced_count = 0
+        self._last_sync = time.time()
+
+    def remove(self):
+        """
+        Removes the snapshot and journal once all tasks are complete.
+        """
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        for path in [self.journal_path, self.snapshot_path]:
+            if os.path.exists(path):
+                os.remove(path)
+
+def run_process(process):
+    """
+    Task of the task farm: executes process, and waits for it to finish.
+
+    @return: Exit status, or the error if it could not be executed.
+    """
+    print("* Executing tid {}".format(process['tid']))
+    try:
+        return exec_process(process)()
+    except Exception as e:
+        return str(e)
+
+def master(task_farm, json_path):
     with open(json_path, 'r') as json_file:
         processes = json.load(json_file)
 
     root_directory = os.path.dirname(json_path)
     runningfile_name = os.path.join(root_directory, ".running")
 
-    processes_iter = iter(processes)
-    processes_running = {}
-    if os.path.exists(runningfile_name):
+    journal = ProgressJournal(runningfile_name)
+    if journal.load():
         # Resume from snapshot
-        print("!! Resuming from snapshot !!")
-        with open(runningfile_name, 'rb') as runningfile:
-            processes_complete = pickle.load(runningfile)
-    else:
-        processes_complete = set()
-
-    def next_process():
-        while True:
-            p = next(processes_iter)
-            if p['tid'] not in processes_complete:
-                return p
+        print("!! Resuming from snapshot ({} tasks complete) !!".format(
+            len(journal.complete)))
+    journal.open()
 
-    def snapshot_progress():
-        with open(runningfile_name, 'wb') as runningfile:
-            pickle.dump(processes_complete, runningfile)
+    processes = [p for p in processes if p['tid'] not in journal.complete]
 
-    worker_count = mpi_ctx.size - 1
-    worker_exit_count = 0
+    def on_result(index, result):
+        print("| Task tid {} finished with result: {}".format(
+            processes[index]['tid'], result))
+        journal.add(processes[index]['tid'])
 
     print("---[ Master starting with {} workers @ {} ]---".format(
-        worker_count, time.strftime("%Y-%m-%dT%H:%M:%S%z")))
-
-    check_status = None
-    while worker_exit_count < worker_count:
-        if MASTER_TASK:
-            # Master should also execute a task.
-            #
-            # The master will sit idle after finishing its task until an MPI
-            # message is received again.
-            if check_status is not None and check_status(False) is not None:
-                print("* Master finished task with result: {}".format(check_status()))
-                processes_complete[0].add(processes_running[0])
-                del processes_running[0]
-                check_status = None
-
-            if check_status is None:
-                try:
-                    process = next_process()
-                except StopIteration:
-                    process = None
-
-                if process is not None:
-                    print("* Executing tid {} on master".format(process['tid']))
-                    try:
-                        check_status = exec_process(process)
-                        processes_running[0] = process['tid']
-                    except Exception as e:
-                        print("* Executing task on master failed: {}".format(e))
-                        check_status = None
-                        continue
-
-        # Wait for messages from workers
-        data = mpi_ctx.comm.recv(source=MPI.ANY_SOURCE, tag=MPI.ANY_TAG,
-                                 status=mpi_ctx.status)
-        source = mpi_ctx.status.Get_source()
-        tag = mpi_ctx.status.Get_tag()
-
-        if tag == Tags.READY:
-            try:
-                process = next_process()
-                mpi_ctx.comm.send(process, dest=source, tag=Tags.START)
-                print("+ Sending tid {} to worker {}".format(process['tid'], source))
-                processes_running[source] = process['tid']
-            except StopIteration:
-                mpi_ctx.comm.send(None, dest=source, tag=Tags.EXIT)
-
-        elif tag == Tags.DONE:
-            print("| Worker {} finished task with result: {}".format(
-                source, data))
-            processes_complete.add(processes_running[source])
-            del processes_running[source]
-        elif tag == Tags.EXIT:
-            print("= Worker {} exited with reason: {}".format(
-                source, data))
-            worker_exit_count += 1
-
-        snapshot_progress()
-
-    if check_status is not None:
-        print("* Master finished task with result: {}".format(check_status()))
+        task_farm.size - 1, time.strftime("%Y-%m-%dT%H:%M:%S%z")))
+
+    task_farm.map(run_process, processes, on_result)
 
     print("---[ Master finishing @ {} ]---".format(
         time.strftime("%Y-%m-%dT%H:%M:%S%z")))
 
-    os.remove(runningfile_name)
+    journal.remove()
     return 0
 
-def worker(mpi_ctx):
-    while True:
-        try:
-            mpi_ctx.comm.send(None, dest=0, tag=Tags.READY)
-            process = mpi_ctx.comm.recv(source=0, tag=MPI.ANY_TAG, status=mpi_ctx.status)
-            tag = mpi_ctx.status.Get_tag()
-        except Exception as e:
-            reason = str(e)
-            break
-
-        if tag == Tags.START:
-            try:
-                check_status = exec_process(process)
-                result = check_status()
-            except Exception as e:
-                result = str(e)
-
-            mpi_ctx.comm.send(result, dest=0, tag=Tags.DONE)
-        elif tag == Tags.EXIT:
-            reason = "normal"
-            break
-
-    mpi_ctx.comm.send(reason, dest=0, tag=Tags.EXIT)
+def worker(task_farm):
+    task_farm.map(run_process, None)
     return 0
 
 def main(argv):
     json_path = argv[1]
 
-    comm = MPI.COMM_WORLD
-    mpi_ctx = MPI_Context(
-            comm = comm,
-            size = comm.Get_size(),
-            rank = comm.Get_rank(),
-            status = MPI.Status())
-
-    if mpi_ctx.rank == 0:
-        return master(mpi_ctx, json_path)
+    task_farm = TaskFarm(use_mpi=True)
+    if task_farm.is_root():
+        return master(task_farm, json_path)
     else:
-        return worker(mpi_ctx)
+        return worker(task_farm)
 
 if __name__ == "__main__":
     sys.exit(main(sys.argv))
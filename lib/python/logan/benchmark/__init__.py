@@ -0,0 +1,12 @@
+"""
+Benchmark suite.
+
+Generates synthetic result trees (see generator) and measures the throughput,
+peak memory and render time of the datasource and dataoutput components. The
+results are saved as JSON, to compare them between commits:
+
+    $ bin/logan-bench --size small -o before.json
+    $ bin/logan-bench --size small -o after.json --compare before.json
+
+Runs fully offline.
+"""
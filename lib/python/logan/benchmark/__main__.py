@@ -0,0 +1,5 @@
+import sys
+
+from logan.benchmark import suite
+
+sys.exit(suite.main(sys.argv[1:]))
@@ -0,0 +1,180 @@
+"""
+Synthetic result tree generator.
+
+Generates lancet-style result trees: one directory per run, named by its
+encoded parameters (see encode_json_to_filename), each containing a log file
+("stdout", optionally compressed) of configurable size, line mix and marker
+structure. Generation is deterministic for a given seed.
+
+Example tree:
+
+    root/synthetic/benchmark=b0,rep=0,threads=1/stdout.gz
+    root/synthetic/benchmark=b0,rep=0,threads=2/stdout.gz
+    ...
+"""
+
+import os
+import json
+import random
+import collections
+
+from logan.datasource import COMPRESS_MODULES, encode_json_to_filename
+
+DATAFILE = "stdout"
+
+# Lines starting with the marker separate the iterations of a run.
+MARKER = "=== iteration"
+
+_WORDS = ["alpha", "beta", "gamma", "delta", "epsilon", "zeta", "theta",
+          "kappa", "lambda", "sigma", "omega", "worker", "queue", "flush",
+          "commit", "retry", "barrier", "cache", "evict", "steal"]
+
+def _throughput_line(rng, params):
+    # Scales with threads, with some contention.
+    base = 1000.0 * params['threads'] ** 0.8 * (1 + params['benchmark_index'] * 0.25)
+    return "throughput: {:.2f} ops/s\n".format(base * rng.uniform(0.9, 1.1))
+
+def _latency_line(rng, params):
+    return "latency_us: {:.3f}\n".format(rng.lognormvariate(3.0, 0.5))
+
+def _event_line(rng, params):
+    return "[{:.6f}] tid={} event={}\n".format(
+        rng.uniform(0, 1000), rng.randrange(params['threads']), rng.choice(_WORDS[11:]))
+
+def _noise_line(rng, params):
+    return "{}\n".format(" ".join(rng.choice(_WORDS) for _ in range(rng.randint(4, 16))))
+
+def _long_line(rng, params):
+    return "debug: {}\n".format(" ".join(rng.choice(_WORDS) for _ in range(rng.randint(40, 80))))
+
+LINE_KINDS = collections.OrderedDict([
+    ('throughput', _throughput_line),
+    ('latency'   , _latency_line),
+    ('event'     , _event_line),
+    ('noise'     , _noise_line),
+    ('long'      , _long_line),
+])
+
+DEFAULT_LINE_MIX = "throughput=1,latency=4,event=5,noise=10,long=1"
+
+def parse_line_mix(spec):
+    """
+    @spec: Comma separated kind=weight pairs, e.g. "latency=4,noise=10";
+           kinds are the keys of LINE_KINDS.
+    @return: OrderedDict mapping line kinds to weights.
+    """
+    result = collections.OrderedDict()
+    for entry in spec.split(","):
+        kind, weight = entry.split("=", 1)
+        if kind not in LINE_KINDS:
+            raise Exception("Invalid line kind: {} [Valid options: {}]".format(
+                kind, ", ".join(LINE_KINDS)))
+        result[kind] = float(weight)
+    return result
+
+def run_dirname(params):
+    """
+    @return: Directory name of run with params; decoded by
+             logan.datasource.resultindex.decode_params.
+    """
+    return encode_json_to_filename(json.dumps(params, sort_keys=True))
+
+def generate_run(path, params, lines, line_mix, markers, compress, rng):
+    """
+    Writes the datafile of a single run to directory path.
+
+    @params: Run parameters; benchmark_index and threads are used to generate
+             plausible values.
+    @markers: Number of iterations (marker lines) the lines are split into.
+    @return: Tuple of number of lines and uncompressed bytes written.
+    """
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+    kinds = list(line_mix)
+    cum_weights = []
+    total = 0.0
+    for kind in kinds:
+        total += line_mix[kind]
+        cum_weights.append(total)
+
+    filename = os.path.join(path, DATAFILE)
+    if compress is not None:
+        f = COMPRESS_MODULES[compress].open("{}.{}".format(filename, compress), "wb")
+    else:
+        f = open(filename, "wb")
+
+    written_lines = 0
+    written_bytes = 0
+    chunk = []
+    try:
+        header = "# synthetic {}\n".format(json.dumps(params, sort_keys=True))
+        chunk.append(header)
+        written_lines += 1
+
+        lines_per_marker = max(1, lines // max(1, markers))
+        for i in range(lines):
+            if markers and i % lines_per_marker == 0 and i // lines_per_marker < markers:
+                chunk.append("{} {} ===\n".format(MARKER, i // lines_per_marker + 1))
+                written_lines += 1
+
+            pick = rng.random() * total
+            for kind, cum_weight in zip(kinds, cum_weights):
+                if pick < cum_weight:
+                    break
+            chunk.append(LINE_KINDS[kind](rng, params))
+            written_lines += 1
+
+            if len(chunk) >= 4096:
+                data = "".join(chunk).encode()
+                f.write(data)
+                written_bytes += len(data)
+                chunk = []
+
+        data = "".join(chunk).encode()
+        f.write(data)
+        written_bytes += len(data)
+    finally:
+        f.close()
+
+    return written_lines, written_bytes
+
+def generate_tree(root, benchmarks=2, threads=(1, 2, 4, 8), reps=3, lines=10000,
+                  line_mix=DEFAULT_LINE_MIX, markers=4, compress=None, seed=0,
+                  batch_name="synthetic"):
+    """
+    Generates a result tree in root/batch_name, with one run per combination
+    of benchmark, threads and repetition.
+
+    @line_mix: Line mix as accepted by parse_line_mix.
+    @compress: Compression scheme of datafiles (key of COMPRESS_MODULES), or
+               None.
+    @return: dict with root (the batch directory), runs, lines and bytes
+             (uncompressed) written.
+    """
+    if compress is not None and compress not in COMPRESS_MODULES:
+        raise Exception("Invalid compression scheme: {} [Valid options: {}]".format(
+            compress, ", ".join(COMPRESS_MODULES)))
+
+    line_mix = parse_line_mix(line_mix)
+    batch_root = os.path.join(root, batch_name)
+    summary = {'root' : batch_root, 'runs' : 0, 'lines' : 0, 'bytes' : 0}
+
+    for benchmark_index in range(benchmarks):
+        for thread_count in threads:
+            for rep in range(reps):
+                params = {'benchmark' : "b{}".format(benchmark_index),
+                          'threads' : thread_count, 'rep' : rep}
+                # Independent of the order of generation
+                rng = random.Random("{}:{}".format(seed, run_dirname(params)))
+
+                params_values = dict(params, benchmark_index=benchmark_index)
+                written_lines, written_bytes = generate_run(
+                        os.path.join(batch_root, run_dirname(params)), params_values,
+                        lines, line_mix, markers, compress, rng)
+
+                summary['runs'] += 1
+                summary['lines'] += written_lines
+                summary['bytes'] += written_bytes
+
+    return summary
@@ -0,0 +1,564 @@
+"""
+Benchmarks of the datasource and dataoutput components, on synthetic result
+trees.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import fnmatch
+import logging
+import argparse
+import platform
+import tempfile
+import subprocess
+import collections
+
+import logan
+from logan.datasource import COMPRESS_MODULES, ExtractState, cfopen, \
+        extract_data_from_files, reduce_deep, cache_save_pickle, cache_load_pickle
+from logan.datasource import resultindex, synthetic
+from logan.benchmark import generator
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+_timer = getattr(time, "perf_counter", time.time)
+
+RESULTS_VERSION = 1
+
+SIZES = {
+    'small'  : {'benchmarks' : 2, 'threads' : [1, 2, 4, 8], 'reps' : 2, 'lines' : 5000},
+    'medium' : {'benchmarks' : 2, 'threads' : [1, 2, 4, 8], 'reps' : 3, 'lines' : 20000},
+    'large'  : {'benchmarks' : 4, 'threads' : [1, 2, 4, 8, 16, 32], 'reps' : 5, 'lines' : 100000},
+}
+
+DATAOUTPUTS = ["csv", "latex_table", "table", "columnar", "sqlite", "matplotlib"]
+
+MIB = 1024.0 * 1024.0
+
+class Context(object):
+    """
+    State shared by the benchmarks: arguments, and the generated trees.
+    """
+    def __init__(self, args):
+        self.args = args
+        self.tree_params = {
+            'benchmarks' : args.benchmarks,
+            'threads' : args.threads,
+            'reps' : args.reps,
+            'lines' : args.lines,
+            'line_mix' : args.line_mix,
+            'markers' : args.markers,
+            'seed' : args.seed
+        }
+        self._trees = {}
+        self._data_source = None
+
+    def tree(self, compress):
+        """
+        Generates the tree with datafiles compressed with compress, unless a
+        tree with the same parameters exists in the work directory.
+
+        @return: dict with path (the datasource path), and runs, lines and
+                 bytes of the tree.
+        """
+        if compress in self._trees:
+            return self._trees[compress]
+
+        path = os.path.join(self.args.work_dir, "tree-{}".format(compress or "none"))
+        params_path = os.path.join(path, "params.json")
+        params = dict(self.tree_params, compress=compress)
+
+        summary = None
+        if os.path.exists(params_path):
+            with open(params_path, "r") as f:
+                stored = json.load(f)
+            if stored['params'] == params:
+                summary = stored['summary']
+                logging.info("Reusing tree {}".format(path))
+
+        if summary is None:
+            if os.path.exists(path):
+                shutil.rmtree(path)
+            logging.info("Generating tree {} ...".format(path))
+            start = _timer()
+            summary = generator.generate_tree(path, compress=compress, **self.tree_params)
+            generate_seconds = _timer() - start
+            with open(params_path, "w") as f:
+                json.dump({'params' : params, 'summary' : summary}, f)
+            summary['generate_seconds'] = generate_seconds
+
+        summary['path'] = path
+        self._trees[compress] = summary
+        return summary
+
+    def runs(self, compress):
+        """
+        @return: List of file prefixes of the datafiles of the tree.
+        """
+        tree = self.tree(compress)
+        index = resultindex.ResultIndex(tree['path'])
+        index.refresh(save=False)
+        return [os.path.join(tree['path'], run.path, generator.DATAFILE)
+                for run in index.runs() if generator.DATAFILE in run.datafiles]
+
+    def make_config(self, dataoutputs, out_path, extra_args=()):
+        """
+        @return: LoganConfig for the synthetic datasource of the tree with the
+                 default compression, and dataoutputs. Outputs are always
+                 regenerated (--dout-rebuild), to measure rendering them.
+        """
+        import logan.main
+
+        argv = ["-s", "synthetic", "-S", self.tree(self.args.compress[0])['path'],
+                "-o"] + dataoutputs + ["-O", out_path, "-b", "--dout-rebuild",
+                "--loglevel", logging.getLevelName(logging.getLogger().level)] + \
+               list(extra_args)
+        logan_config = logan.main.LoganConfig(argv)
+        logan.main.load_base_modules()
+        logan.main.register_module_arguments(logan_config,
+                logan_config.get_datasource_module(),
+                logan_config.get_dataoutput_modules())
+        logan_config.parse_args()
+        return logan_config
+
+    def data_source(self):
+        """
+        @return: Processed synthetic DataSource, shared by the dataoutput
+                 benchmarks.
+        """
+        if self._data_source is None:
+            logan_config = self.make_config(["base"], os.path.join(self.args.work_dir, "out"))
+            self._data_source = synthetic.DataSource(logan_config)
+            if not self._data_source.process():
+                raise Exception("Processing synthetic tree failed!")
+        return self._data_source
+
+def measure(f, repeat, memory=True):
+    """
+    Calls f repeat times, and once more with tracemalloc to measure the peak
+    memory.
+
+    @return: Tuple of dict with seconds (best), seconds_median and peak_mib,
+             and the result of the last call of f.
+    """
+    times = []
+    for _ in range(repeat):
+        start = _timer()
+        result = f()
+        times.append(_timer() - start)
+    times.sort()
+
+    metrics = collections.OrderedDict([
+        ('seconds', times[0]),
+        ('seconds_median', times[len(times) // 2])
+    ])
+
+    if memory and tracemalloc is not None:
+        tracemalloc.start()
+        try:
+            f()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        metrics['peak_mib'] = peak / MIB
+
+    return metrics, result
+
+def _read_all(prefixes):
+    total = 0
+    for prefix in prefixes:
+        datafile = cfopen(prefix)
+        try:
+            while True:
+                data = datafile['f'].read(1 << 20)
+                if not data:
+                    break
+                total += len(data)
+        finally:
+            datafile['f'].close()
+    return total
+
+def bench_generate(ctx, compress):
+    tree = ctx.tree(compress)
+    if 'generate_seconds' not in tree:
+        # Reused tree
+        return None
+    return collections.OrderedDict([
+        ('seconds', tree['generate_seconds']),
+        ('lines_per_sec', tree['lines'] / tree['generate_seconds']),
+        ('mb_per_sec', tree['bytes'] / MIB / tree['generate_seconds'])
+    ])
+
+def bench_cfopen(ctx, compress):
+    tree = ctx.tree(compress)
+    prefixes = ctx.runs(compress)
+    metrics, _ = measure(lambda: _read_all(prefixes), ctx.args.repeat)
+    metrics['files_per_sec'] = len(prefixes) / metrics['seconds']
+    metrics['mb_per_sec'] = tree['bytes'] / MIB / metrics['seconds']
+    return metrics
+
+def _extract_all(prefixes, state=None, select=None):
+    for prefix in prefixes:
+        datafiles = [cfopen(prefix)]
+        try:
+            extract_data_from_files(datafiles, synthetic.DATASETS,
+                    state=None if state is None else state[prefix], select=select)
+        finally:
+            datafiles[0]['f'].close()
+
+def bench_extract(ctx, compress):
+    tree = ctx.tree(compress)
+    prefixes = ctx.runs(compress)
+    metrics, _ = measure(lambda: _extract_all(prefixes), ctx.args.repeat)
+    metrics['lines_per_sec'] = tree['lines'] / metrics['seconds']
+    metrics['mb_per_sec'] = tree['bytes'] / MIB / metrics['seconds']
+    return metrics
+
+def bench_extract_select(ctx):
+    """
+    Extraction of a single selected dataset (--datasets).
+    """
+    tree = ctx.tree(None)
+    prefixes = ctx.runs(None)
+    metrics, _ = measure(lambda: _extract_all(prefixes, select=lambda key: key == "events"),
+                         ctx.args.repeat)
+    metrics['lines_per_sec'] = tree['lines'] / metrics['seconds']
+    return metrics
+
+def bench_extract_incremental(ctx):
+    """
+    Extraction with ExtractState, when no data was appended (--follow).
+    """
+    prefixes = ctx.runs(None)
+    state = dict((prefix, ExtractState()) for prefix in prefixes)
+    _extract_all(prefixes, state)
+    metrics, _ = measure(lambda: _extract_all(prefixes, state), ctx.args.repeat)
+    metrics['files_per_sec'] = len(prefixes) / metrics['seconds']
+    return metrics
+
+def _make_result_trees(ctx, count):
+    rng = random.Random(ctx.args.seed)
+    return [dict((dataset, dict(("b{}".format(b), dict((t, rng.random())
+                                                         for t in ctx.args.threads))
+                                for b in range(ctx.args.benchmarks)))
+                 for dataset in synthetic.DATASETS)
+            for _ in range(count)]
+
+def bench_reduce_deep(ctx):
+    count = 1000
+    leaves = len(synthetic.DATASETS) * ctx.args.benchmarks * len(ctx.args.threads)
+
+    def _reduce():
+        # reduce_deep updates the first tree in place
+        trees = _make_result_trees(ctx, count)
+        start = _timer()
+        reduce_deep(lambda a, b: a + b, trees)
+        return _timer() - start
+
+    times = sorted(_reduce() for _ in range(ctx.args.repeat))
+    return collections.OrderedDict([
+        ('seconds', times[0]),
+        ('seconds_median', times[len(times) // 2]),
+        ('trees_per_sec', count / times[0]),
+        ('leaves_per_sec', count * leaves / times[0])
+    ])
+
+def bench_cache(ctx):
+    """
+    Saving and loading raw captures (about 20% of the lines of each run) with
+    the datasource cache functions.
+    """
+    rng = random.Random(ctx.args.seed)
+    raw_data = dict((prefix, [rng.lognormvariate(3.0, 0.5) for _ in range(ctx.args.lines // 5)])
+                    for prefix in ctx.runs(None))
+    cache_dir = os.path.join(ctx.args.work_dir, "cache")
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+
+    # The cache functions log each save and load.
+    logger = logging.getLogger()
+    loglevel = logger.level
+    logger.setLevel(max(loglevel, logging.WARNING))
+    try:
+        save_metrics, _ = measure(lambda: cache_save_pickle(cache_dir, raw_data=raw_data),
+                                  ctx.args.repeat, memory=False)
+        load_metrics, _ = measure(lambda: cache_load_pickle(cache_dir, None),
+                                  ctx.args.repeat)
+    finally:
+        logger.setLevel(loglevel)
+
+    cache_files = os.listdir(cache_dir)
+    return collections.OrderedDict([
+        ('save_seconds', save_metrics['seconds']),
+        ('load_seconds', load_metrics['seconds']),
+        ('load_peak_mib', load_metrics.get('peak_mib')),
+        ('bytes', sum(os.path.getsize(os.path.join(cache_dir, name)) for name in cache_files))
+    ])
+
+def bench_resultindex(ctx):
+    tree = ctx.tree(None)
+    index_path = os.path.join(ctx.args.work_dir, "index.pickle.gz")
+
+    def _cold():
+        if os.path.exists(index_path):
+            os.remove(index_path)
+        resultindex.ResultIndex(tree['path'], index_path).refresh()
+
+    cold_metrics, _ = measure(_cold, ctx.args.repeat)
+    warm_metrics, _ = measure(
+            lambda: resultindex.ResultIndex(tree['path'], index_path).refresh(),
+            ctx.args.repeat, memory=False)
+
+    return collections.OrderedDict([
+        ('cold_seconds', cold_metrics['seconds']),
+        ('warm_seconds', warm_metrics['seconds']),
+        ('runs', tree['runs'])
+    ])
+
+def bench_process(ctx):
+    tree = ctx.tree(ctx.args.compress[0])
+    logan_config = ctx.make_config(["base"], os.path.join(ctx.args.work_dir, "out"))
+    metrics, _ = measure(lambda: synthetic.DataSource(logan_config).process(),
+                         ctx.args.repeat)
+    metrics['lines_per_sec'] = tree['lines'] / metrics['seconds']
+    return metrics
+
+def bench_dataoutput(ctx, name, extra_args=()):
+    data_source = ctx.data_source()
+    out_path = os.path.join(ctx.args.work_dir, "out-{}".format(name))
+    logan_config = ctx.make_config([name], out_path, extra_args)
+    data_output = next(iter(logan_config.get_dataoutput_modules())).DataOutput(logan_config)
+
+    def _generate():
+        if not data_output.generate(data_source):
+            raise Exception("Dataoutput {} failed!".format(name))
+
+    metrics, _ = measure(_generate, ctx.args.repeat)
+    metrics['seconds_per_dataset'] = metrics['seconds'] / len(data_source.get_dataset_keys())
+    return metrics
+
+def bench_stream(ctx, jobs):
+    """
+    Processing and rendering the table dataoutput with --stream, compared to
+    processing all datasets first (batch_seconds). first_output_seconds is
+    the time until the first dataset is rendered.
+    """
+    tree = ctx.tree(ctx.args.compress[0])
+    out_path = os.path.join(ctx.args.work_dir, "out-stream")
+    logan_config = ctx.make_config(["table"], out_path, ["--stream", "-j", str(jobs)])
+    data_output = next(iter(logan_config.get_dataoutput_modules())).DataOutput(logan_config)
+    first_output_times = []
+
+    def _stream():
+        data_source = synthetic.DataSource(logan_config)
+        start = _timer()
+        for index, dataset in enumerate(data_source.process_datasets()):
+            if not data_output.generate_dataset(data_source, dataset):
+                raise Exception("Dataoutput table failed!")
+            if index == 0:
+                first_output_times.append(_timer() - start)
+            data_source.release_dataset(dataset)
+        data_output.generate_finish(data_source)
+
+    def _batch():
+        data_source = synthetic.DataSource(logan_config)
+        if not data_source.process() or not data_output.generate(data_source):
+            raise Exception("Processing or dataoutput table failed!")
+
+    metrics, _ = measure(_stream, ctx.args.repeat)
+    batch_metrics, _ = measure(_batch, ctx.args.repeat)
+    metrics['first_output_seconds'] = min(first_output_times)
+    metrics['lines_per_sec'] = tree['lines'] / metrics['seconds']
+    metrics['batch_seconds'] = batch_metrics['seconds']
+    if 'peak_mib' in batch_metrics:
+        metrics['batch_peak_mib'] = batch_metrics['peak_mib']
+    return metrics
+
+def make_benchmarks(args):
+    """
+    @return: OrderedDict mapping benchmark names to functions taking the
+             Context, and returning a dict of metrics (or None to skip).
+    """
+    benchmarks = collections.OrderedDict()
+    for compress in args.compress:
+        suffix = compress or "none"
+        benchmarks["generate/" + suffix] = lambda ctx, c=compress: bench_generate(ctx, c)
+        benchmarks["cfopen/" + suffix] = lambda ctx, c=compress: bench_cfopen(ctx, c)
+        benchmarks["extract/" + suffix] = lambda ctx, c=compress: bench_extract(ctx, c)
+
+    benchmarks["extract_select"] = bench_extract_select
+    benchmarks["extract_incremental"] = bench_extract_incremental
+    benchmarks["reduce_deep"] = bench_reduce_deep
+    benchmarks["cache"] = bench_cache
+    benchmarks["resultindex"] = bench_resultindex
+    benchmarks["process"] = bench_process
+    for name in DATAOUTPUTS:
+        benchmarks["dataoutput/" + name] = lambda ctx, n=name: bench_dataoutput(ctx, n)
+    benchmarks["dataoutput/csv_long"] = \
+            lambda ctx: bench_dataoutput(ctx, "csv", ["--csv-format", "long"])
+    for jobs in [1, 3]:
+        benchmarks["stream/j{}".format(jobs)] = lambda ctx, j=jobs: bench_stream(ctx, j)
+
+    return benchmarks
+
+def _git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=logan.BASEPATH,
+                                       stderr=subprocess.STDOUT).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _format_value(value):
+    if isinstance(value, float):
+        return "{:.4g}".format(value)
+    return str(value)
+
+def print_results(results):
+    for name, metrics in results.items():
+        print("{:<28} {}".format(name, "  ".join(
+            "{}={}".format(metric, _format_value(value))
+            for metric, value in metrics.items())))
+
+def _higher_is_better(metric):
+    return metric.endswith("_per_sec")
+
+def print_comparison(results, baseline):
+    """
+    Prints the change of each metric relative to baseline.
+    """
+    print("{:<28} {:<20} {:>12} {:>12} {:>9}".format("Benchmark", "Metric", "Baseline", "Current", "Change"))
+    for name, metrics in results.items():
+        if name not in baseline['results']:
+            continue
+        for metric, value in metrics.items():
+            old_value = baseline['results'][name].get(metric)
+            if not isinstance(value, (int, float)) or not isinstance(old_value, (int, float)) or \
+                    old_value == 0:
+                continue
+
+            change = (value - old_value) / float(old_value)
+            better = (change > 0) == _higher_is_better(metric)
+            print("{:<28} {:<20} {:>12} {:>12} {:>+8.1f}%{}".format(
+                name, metric, _format_value(old_value), _format_value(value),
+                change * 100, "" if abs(change) < 0.05 else (" +" if better else " -")))
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="logan-bench",
+            description="Logan benchmark suite on synthetic result trees.")
+    parser.add_argument("--size", choices=sorted(SIZES), default="small",
+            help="Size preset of the generated trees. [Default:small]")
+    parser.add_argument("--benchmarks", metavar="N", type=int, default=None,
+            help="Number of generated benchmarks (overrides size).")
+    parser.add_argument("--threads", metavar="T", type=int, default=None, nargs="+",
+            help="Generated thread counts (overrides size).")
+    parser.add_argument("--reps", metavar="N", type=int, default=None,
+            help="Generated repetitions of each run (overrides size).")
+    parser.add_argument("--lines", metavar="N", type=int, default=None,
+            help="Lines per generated datafile (overrides size).")
+    parser.add_argument("--line-mix", metavar="MIX", type=str, default=generator.DEFAULT_LINE_MIX,
+            help="Generated line mix, as kind=weight pairs. [Default:{}]".format(
+                generator.DEFAULT_LINE_MIX))
+    parser.add_argument("--markers", metavar="N", type=int, default=4,
+            help="Iteration markers per generated datafile. [Default:4]")
+    parser.add_argument("--compress", metavar="COMPRESS", type=str, default=None, nargs="+",
+            help="Compression schemes of generated trees ('none' for uncompressed); the first is used for processing and dataoutputs. [Default:none and all supported]")
+    parser.add_argument("--seed", metavar="SEED", type=int, default=0,
+            help="Seed of generated data. [Default:0]")
+    parser.add_argument("-r", "--repeat", metavar="N", type=int, default=3,
+            help="Repetitions of each measurement; the best is reported. [Default:3]")
+    parser.add_argument("-k", "--only", metavar="PATTERN", type=str, default=None, nargs="+",
+            help="Only run benchmarks matching any of the (shell-style) patterns.")
+    parser.add_argument("-w", "--work-dir", metavar="DIR", type=str, default=None,
+            help="Directory for generated trees and outputs; trees with the same parameters are reused. [Default: temporary directory, removed afterwards]")
+    parser.add_argument("-o", "--output", metavar="FILE", type=str, default=None,
+            help="Write results as JSON to FILE.")
+    parser.add_argument("--compare", metavar="FILE", type=str, default=None,
+            help="Compare results with JSON results in FILE.")
+    parser.add_argument("--loglevel", metavar="LEVEL", type=str, default="WARNING",
+            help="Loglevel (DEBUG, INFO, WARNING, ERROR, CRITICAL). [Default:WARNING]")
+    args = parser.parse_args(argv)
+
+    for key, value in SIZES[args.size].items():
+        if getattr(args, key) is None:
+            setattr(args, key, value)
+
+    if args.compress is None:
+        args.compress = [None] + sorted(COMPRESS_MODULES)
+    else:
+        args.compress = [None if compress == "none" else compress for compress in args.compress]
+        for compress in args.compress:
+            if compress is not None and compress not in COMPRESS_MODULES:
+                parser.error("Invalid compression scheme: {} [Valid options: none, {}]".format(
+                    compress, ", ".join(COMPRESS_MODULES)))
+
+    return args
+
+def main(argv):
+    args = parse_args(argv)
+    logging.basicConfig(level=getattr(logging, args.loglevel.upper(), logging.WARNING),
+                        format='[Logan:%(levelname)s] %(message)s')
+
+    remove_work_dir = args.work_dir is None
+    if remove_work_dir:
+        args.work_dir = tempfile.mkdtemp(prefix="logan-bench-")
+    elif not os.path.exists(args.work_dir):
+        os.makedirs(args.work_dir)
+
+    ctx = Context(args)
+    results = collections.OrderedDict()
+    try:
+        for name, benchmark in make_benchmarks(args).items():
+            if args.only is not None and \
+                    not any(fnmatch.fnmatchcase(name, pattern) for pattern in args.only):
+                continue
+
+            if name == "dataoutput/matplotlib":
+                try:
+                    import matplotlib
+                except ImportError:
+                    logging.warning("Skipping {}: matplotlib not available".format(name))
+                    continue
+
+            logging.info("Running {} ...".format(name))
+            metrics = benchmark(ctx)
+            if metrics is None:
+                continue
+            results[name] = metrics
+            print_results({name : metrics})
+            sys.stdout.flush()
+    finally:
+        if remove_work_dir:
+            shutil.rmtree(args.work_dir)
+
+    output = {
+        'version' : RESULTS_VERSION,
+        'meta' : {
+            'time' : time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            'revision' : _git_revision(),
+            'python' : sys.version.split()[0],
+            'implementation' : platform.python_implementation(),
+            'platform' : platform.platform(),
+            'tree' : dict(ctx.tree_params, compress=args.compress),
+            'repeat' : args.repeat
+        },
+        'results' : results
+    }
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(output, f, indent=1)
+        print("Written {}".format(args.output))
+
+    if args.compare is not None:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        print_comparison(results, baseline)
+
+    return 0
@@ -4,6 +4,7 @@
 Helper functions to create Python 2 and 3 compatible code.
 """
 
+import os
 import sys
 
 if sys.version_info >= (3, 0):
@@ -20,3 +21,27 @@ else:
         print
 
     input = raw_input
+
+def open_csv(path, buffering=-1):
+    """
+    @return: File opened for writing with the csv module.
+    """
+    if sys.version_info >= (3, 0):
+        return open(path, "w", newline="", buffering=buffering)
+    else:
+        return open(path, "wb", buffering)
+
+def get_fork_context():
+    """
+    @return: multiprocessing context (or module) whose processes are forked,
+             so that they inherit the parent's state instead of having it
+             pickled; None if fork is not supported.
+    """
+    import multiprocessing
+    try:
+        return multiprocessing.get_context("fork")
+    except AttributeError:
+        # Python 2: fork is the only start method on POSIX
+        return multiprocessing if hasattr(os, "fork") else None
+    except ValueError:
+        return None
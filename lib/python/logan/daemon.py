@@ -0,0 +1,183 @@
+"""
+Resident analysis daemon.
+
+A daemon (logan --daemon) processes its DataSource once and then serves
+requests to run dataoutputs on a Unix domain socket, avoiding interpreter
+startup, module import, cache load and processing for every invocation. The
+client side is used transparently by logan if a daemon socket is configured
+(--daemon-socket or LOGAN_DAEMON_SOCKET); if the daemon cannot serve a
+request, logan runs locally as usual.
+
+Protocol: the client sends one JSON line {"argv" : [...], "cwd" : "..."}. The
+daemon responds with JSON lines {"log" : "..."} for each log message, followed
+by either {"status" : N} or {"fallback" : "reason"}.
+"""
+
+import os
+import sys
+import json
+import signal
+import logging
+import traceback
+
+import logan.trace
+from logan.registry import lazy_import
+
+# Only needed to serve or send requests, not to register the arguments.
+socket = lazy_import("socket")
+
+DAEMON_SOCKET_ENV = "LOGAN_DAEMON_SOCKET"
+
+class _SocketLogHandler(logging.Handler):
+    def __init__(self, stream):
+        logging.Handler.__init__(self)
+        self.stream = stream
+        self.setFormatter(logging.Formatter('[Logan:%(levelname)s] %(message)s'))
+
+    def emit(self, record):
+        try:
+            _send(self.stream, {'log' : self.format(record)})
+        except Exception:
+            # Client went away; keep serving.
+            pass
+
+class _SocketWriter(object):
+    """
+    Forwards lines written to stdout/stderr (e.g. argparse messages) as log
+    messages.
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.buffer = ""
+
+    def write(self, s):
+        self.buffer += s
+        while "\n" in self.buffer:
+            line, self.buffer = self.buffer.split("\n", 1)
+            _send(self.stream, {'log' : line})
+
+    def flush(self):
+        if self.buffer:
+            _send(self.stream, {'log' : self.buffer})
+            self.buffer = ""
+
+def _send(stream, message):
+    stream.write((json.dumps(message) + "\n").encode())
+    stream.flush()
+
+def _handle_connection(conn, handler):
+    stream = conn.makefile("rwb")
+    try:
+        request = json.loads(stream.readline().decode())
+    except ValueError:
+        return
+
+    log_handler = _SocketLogHandler(stream)
+    root_logger = logging.getLogger()
+    root_logger.addHandler(log_handler)
+    old_cwd = os.getcwd()
+    old_stdout, old_stderr = sys.stdout, sys.stderr
+    sys.stdout = sys.stderr = _SocketWriter(stream)
+    try:
+        os.chdir(request['cwd'])
+        with logan.trace.span("request", argv=" ".join(request['argv'])):
+            result = handler(request['argv'])
+    except SystemExit as e:
+        # argparse errors
+        result = e.code if isinstance(e.code, int) else 2
+    except Exception:
+        logging.error("Request failed:\n{}".format(traceback.format_exc()))
+        result = 1
+    finally:
+        try:
+            sys.stdout.flush()
+        except (IOError, OSError):
+            pass
+        sys.stdout, sys.stderr = old_stdout, old_stderr
+        os.chdir(old_cwd)
+        root_logger.removeHandler(log_handler)
+
+    try:
+        if isinstance(result, int):
+            _send(stream, {'status' : result})
+        else:
+            _send(stream, {'fallback' : result})
+    except (IOError, OSError):
+        pass
+    finally:
+        stream.close()
+
+def _terminate(signum, frame):
+    raise KeyboardInterrupt()
+
+def serve(socket_path, handler):
+    """
+    Serves requests on socket_path until interrupted. Requests are handled
+    sequentially.
+
+    @handler: Called with the argv of each request; returns the exit status,
+              or a string describing why the request must be run locally.
+    """
+    if os.path.exists(socket_path):
+        try:
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            probe.connect(socket_path)
+            probe.close()
+            raise Exception("Daemon already running on {}".format(socket_path))
+        except (IOError, OSError):
+            # Stale socket
+            os.remove(socket_path)
+
+    signal.signal(signal.SIGTERM, _terminate)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen(8)
+    logging.info("Daemon serving on {} (interrupt to stop) ...".format(socket_path))
+
+    try:
+        while True:
+            conn, _ = server.accept()
+            try:
+                _handle_connection(conn, handler)
+            finally:
+                conn.close()
+    except KeyboardInterrupt:
+        logging.info("Daemon stopped.")
+    finally:
+        server.close()
+        os.remove(socket_path)
+
+def request(socket_path, argv):
+    """
+    Runs logan with argv on the daemon at socket_path, printing its log
+    messages to stderr.
+
+    @return: Exit status, or None if the request should be run locally.
+    """
+    try:
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.connect(socket_path)
+    except (IOError, OSError) as e:
+        logging.debug("No daemon on {}: {}".format(socket_path, e))
+        return None
+
+    stream = conn.makefile("rwb")
+    try:
+        _send(stream, {'argv' : argv, 'cwd' : os.getcwd()})
+        for line in stream:
+            message = json.loads(line.decode())
+            if 'log' in message:
+                sys.stderr.write(message['log'] + "\n")
+            elif 'status' in message:
+                return message['status']
+            elif 'fallback' in message:
+                logging.info("Daemon on {} cannot serve request ({}), running locally.".format(
+                    socket_path, message['fallback']))
+                return None
+    finally:
+        stream.close()
+        conn.close()
+
+    logging.warning("Daemon on {} closed connection, running locally.".format(socket_path))
+    return None
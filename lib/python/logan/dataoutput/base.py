@@ -2,6 +2,12 @@
 Base/null dataoutput (does nothing).
 """
 
+import os
+import json
+import hashlib
+import logging
+import weakref
+
 def register_arguments(logan_config):
     """
     Interface function.
@@ -22,6 +28,12 @@ def register_arguments(logan_config):
     logan_config.add_argument("--dout-size", metavar="SIZE", type=str,
             dest="dout_size", default=None,
             help="Output size (format depends on dataoutput); passed to dataoutputs.")
+    logan_config.add_argument("--dout-concurrent", action="store_true",
+            dest="dout_concurrent", default=False,
+            help="Run multiple dataoutputs concurrently in up to JOBS worker processes.")
+    logan_config.add_argument("--dout-rebuild", action="store_true",
+            dest="dout_rebuild", default=False,
+            help="Regenerate all outputs, even if their data did not change since they were generated.")
 
 def get_description():
     """
@@ -29,12 +41,145 @@ def get_description():
     """
     return ("Base/null dataoutput (does nothing). [Formats:]", None)
 
+def json_key(key):
+    """
+    @return: key (or presentation hint) as JSON value; tuples become lists,
+             and other values which JSON does not support become strings.
+    """
+    if key is None or isinstance(key, (bool, int, float, str)):
+        return key
+    if isinstance(key, (tuple, list)):
+        return [json_key(k) for k in key]
+    return str(key)
+
+# Data digests of datasets (see dataset_digest), shared by all dataoutputs: per
+# data source, the digest and the generation of the data source it was
+# computed for, by dataset.
+_data_digests = weakref.WeakKeyDictionary()
+
+def _data_digest(data_source, dataset):
+    """
+    @return: Hex digest of what dataoutputs query about dataset, computed once
+             per generation of data_source.
+    """
+    generation = data_source.generation
+    digests = _data_digests.setdefault(data_source, {})
+    if dataset in digests and digests[dataset][0] == generation:
+        return digests[dataset][1]
+
+    digest = hashlib.sha1()
+    def _add(value):
+        digest.update(repr(value).encode("utf-8"))
+        digest.update(b"\0")
+
+    _add(dataset)
+    _add(data_source.get_description(dataset=dataset))
+    _add(data_source.get_xlabel(dataset=dataset))
+    _add(data_source.get_ylabel(dataset=dataset))
+    _add(data_source.get_zlabel(dataset=dataset))
+    _add(data_source.get_yrange(dataset=dataset))
+    _add(sorted(data_source.get_presentation_hints(dataset).items()))
+
+    xtick_keys = data_source.get_xtick_keys(dataset=dataset)
+    ztick_keys = data_source.get_ztick_keys(dataset=dataset)
+    cluster_keys = data_source.get_cluster_keys(dataset=dataset)
+    stack_keys = data_source.get_stack_keys(dataset=dataset)
+    for keys in [xtick_keys, ztick_keys, cluster_keys, stack_keys]:
+        _add([(key, data_source.map_to_name(key)) for key in keys or []])
+
+    for x, z, cluster, stack, data_point in data_source.query_grid(dataset):
+        _add((x, z, cluster, stack, data_point.x, data_point.y, data_point.z,
+              data_point.x_err, data_point.y_err, data_point.z_err))
+
+    digests[dataset] = (generation, digest.hexdigest())
+    return digests[dataset][1]
+
+def dataset_digest(data_source, dataset, *options):
+    """
+    Content hash of everything a dataoutput queries about dataset: labels,
+    presentation hints, keys and their names, and the data of each point of
+    the (x, z, cluster, stack) grid; as well as options (e.g. output options
+    which affect the output). The data is only hashed once per generation of
+    data_source (see DataSource.generation), however many dataoutputs ask.
+
+    @return: Hex digest.
+    """
+    digest = hashlib.sha1()
+    digest.update(repr(options).encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(_data_digest(data_source, dataset).encode("utf-8"))
+    return digest.hexdigest()
+
+class OutputManifest(object):
+    """
+    Content hashes (see dataset_digest) of the outputs a dataoutput generated
+    in --dout-path, so that outputs whose data did not change are not
+    generated again (unless --dout-rebuild).
+    """
+    def __init__(self, logan_config, name):
+        """
+        @name: Name of the dataoutput; each dataoutput has its own manifest,
+               so that concurrent dataoutputs do not share it.
+        """
+        self.dout_path = logan_config.args.dout_path
+        self.path = os.path.join(self.dout_path, ".logan-manifest-{}.json".format(name))
+        self.rebuild = logan_config.args.dout_rebuild
+        self.entries = {}
+        self.updated = False
+
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as f:
+                    self.entries = json.load(f)
+            except (IOError, OSError, ValueError) as e:
+                logging.warning("Could not load manifest {}: {}".format(self.path, e))
+
+    def unchanged(self, key, digest, filenames):
+        """
+        @return: True if the output key was generated with the same digest,
+                 and all its files exist.
+        """
+        return not self.rebuild and self.entries.get(key) == digest and \
+               all(os.path.exists(filename) for filename in filenames)
+
+    def update(self, key, digest):
+        """
+        Records that output key was generated with digest.
+        """
+        if self.entries.get(key) != digest:
+            self.entries[key] = digest
+            self.updated = True
+
+    def save(self):
+        if not self.updated:
+            return
+
+        tmp_path = "{}.{}.tmp".format(self.path, os.getpid())
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(self.entries, f, indent=1, sort_keys=True)
+            os.rename(tmp_path, self.path)
+            self.updated = False
+        except (IOError, OSError) as e:
+            logging.warning("Could not save manifest {}: {}".format(self.path, e))
+
 class DataOutput(object):
     def __init__(self, logan_config):
         """
         @type logan_config: LoganConfig
         """
         self.logan_config = logan_config
+        self._manifest = None
+
+    def get_manifest(self):
+        """
+        @return: OutputManifest of this dataoutput in the current --dout-path.
+        """
+        if self._manifest is None or \
+                self._manifest.dout_path != self.logan_config.args.dout_path:
+            self._manifest = OutputManifest(self.logan_config,
+                                            self.__class__.__module__.split(".")[-1])
+        return self._manifest
 
     def generate(self, data_source):
         """
@@ -48,3 +193,36 @@ class DataOutput(object):
         """
         return True
 
+    def supports_streaming(self):
+        """
+        Interface function.
+
+        @rtype: boolean
+        @return: True if the output can be generated one dataset at a time
+                 with generate_dataset.
+        """
+        return False
+
+    def generate_dataset(self, data_source, dataset):
+        """
+        Interface function called in streaming mode (if supports_streaming),
+        instead of generate: generates the output for a single dataset, as
+        soon as it is ready.
+
+        @type data_source: DataSource
+        @data_source: Any datasource DataSource which defines the basic interface.
+        @dataset: The dataset key.
+        @rtype: boolean
+        @return: Success or not.
+        """
+        raise NotImplementedError("Dataoutput does not support streaming!")
+
+    def generate_finish(self, data_source):
+        """
+        Interface function called in streaming mode, after generate_dataset
+        was called for all datasets.
+
+        @rtype: boolean
+        @return: Success or not.
+        """
+        return True
@@ -0,0 +1,216 @@
+"""
+Dataoutput for columnar binary data, to load results in other tools (e.g.
+notebooks) without parsing text.
+
+Each dataset is written to a directory <dataset>.columnar in --dout-path,
+which contains a NumPy .npy file per column, and a JSON header with the keys,
+their names, labels and presentation hints. The columns are dense arrays over
+the grid of x-tick, z-tick, cluster and stack keys, in that order; z, cluster
+and stack dimensions the dataset does not have are of size 1, with keys null.
+Use load to read a dataset, which memory-maps the columns:
+
+    from logan.dataoutput.columnar import load
+    ds = load("out/throughput.columnar")
+    ds.y[ds.index(x=8, cluster="b0")]
+"""
+
+import os
+import json
+import logging
+import logan.dataoutput.base
+import logan.trace
+from logan.dataoutput.base import json_key
+from logan.registry import lazy_import
+
+# Only imported once needed by generate, so that registering arguments and
+# --help do not pay for it.
+np = lazy_import("numpy")
+
+# Part of the digest of each output, and of the header; change if the output
+# of the same data changes.
+OUTPUT_VERSION = 1
+
+HEADER_FILE = "header.json"
+
+DIMENSIONS = ["x", "z", "cluster", "stack"]
+
+COLUMNS = ["y", "y_err_lo", "y_err_hi"]
+
+def register_arguments(logan_config):
+    """
+    Interface function.
+    When module is loaded, this function is called by the main module,
+    allowing this module to register its own command-line arguments.
+
+    @type logan_config: LoganConfig
+    """
+
+def get_description():
+    """
+    Interface function. Used to query description.
+    """
+    return ("Dataoutput for columnar binary data (NumPy .npy).",
+"""Writes each dataset as a directory <dataset>.columnar of .npy columns and a
+JSON header, which logan.dataoutput.columnar.load memory-maps.""")
+
+class ColumnarDataset(object):
+    """
+    A dataset as written by the columnar dataoutput.
+    """
+    def __init__(self, path, mmap_mode="r"):
+        """
+        @path: Directory of the dataset.
+        @mmap_mode: Passed to numpy.load; None to read the columns into
+                    memory.
+        """
+        with open(os.path.join(path, HEADER_FILE), "r") as f:
+            self.header = json.load(f)
+
+        if self.header['version'] != OUTPUT_VERSION:
+            raise Exception("Unsupported columnar dataset version {} in {}".format(
+                self.header['version'], path))
+
+        self.path = path
+        self.dataset = self.header['dataset']
+        self.keys = self.header['keys']
+        self.names = self.header['names']
+        self.hints = self.header['hints']
+
+        for column in COLUMNS:
+            setattr(self, column, np.load(os.path.join(path, column + ".npy"),
+                                          mmap_mode=mmap_mode))
+
+    def index(self, x=None, z=None, cluster=None, stack=None):
+        """
+        @return: Index tuple into the columns of the given keys; keys which
+                 are not given select the whole dimension.
+        """
+        result = []
+        for dimension, key in zip(DIMENSIONS, [x, z, cluster, stack]):
+            if key is None:
+                result.append(slice(None))
+            else:
+                result.append(self.keys[dimension].index(json_key(key)))
+        return tuple(result)
+
+def load(path, mmap_mode="r"):
+    """
+    @return: ColumnarDataset of path.
+    """
+    return ColumnarDataset(path, mmap_mode)
+
+class DataOutput(logan.dataoutput.base.DataOutput):
+    def __init__(self, logan_config):
+        """
+        @type logan_config: LoganConfig
+        """
+        super(DataOutput, self).__init__(logan_config)
+
+    def _get_file_names(self, output_path):
+        return [os.path.join(output_path, column + ".npy") for column in COLUMNS] + \
+               [os.path.join(output_path, HEADER_FILE)]
+
+    def _write_dataset(self, data_source, dataset, output_path):
+        keys = [data_source.get_xtick_keys(dataset=dataset),
+                data_source.get_ztick_keys(dataset=dataset),
+                data_source.get_cluster_keys(dataset=dataset),
+                data_source.get_stack_keys(dataset=dataset)]
+        shape = tuple(len(k) if k is not None else (0 if i == 0 else 1)
+                      for i, k in enumerate(keys))
+
+        if 0 in shape:
+            for column in COLUMNS:
+                np.save(os.path.join(output_path, column + ".npy"),
+                        np.zeros(shape, dtype=np.float64))
+        else:
+            # Filled in place, so that a dataset is never held in memory
+            # twice.
+            columns = [np.lib.format.open_memmap(os.path.join(output_path, column + ".npy"),
+                                                 mode="w+", dtype=np.float64, shape=shape)
+                       for column in COLUMNS]
+            y, y_err_lo, y_err_hi = (column.reshape(-1) for column in columns)
+            count = 0
+            for _, _, _, _, data_point in data_source.query_grid(dataset):
+                y[count] = data_point.y
+                y_err_lo[count], y_err_hi[count] = data_point.y_err
+                count += 1
+            if count != y.size:
+                raise Exception("Expected {} data points of {}, got {}!".format(
+                    y.size, dataset, count))
+            for column in columns:
+                column.flush()
+            del columns, y, y_err_lo, y_err_hi
+
+        header = {
+            'version' : OUTPUT_VERSION,
+            'dataset' : dataset,
+            'description' : data_source.get_description(dataset=dataset),
+            'xlabel' : data_source.get_xlabel(dataset=dataset),
+            'ylabel' : data_source.get_ylabel(dataset=dataset),
+            'zlabel' : data_source.get_zlabel(dataset=dataset),
+            'yrange' : data_source.get_yrange(dataset=dataset),
+            'hints' : dict((k, json_key(v)) for k, v in
+                           data_source.get_presentation_hints(dataset).items()),
+            'shape' : shape,
+            'keys' : dict((dimension, [json_key(key) for key in k] if k is not None else None)
+                          for dimension, k in zip(DIMENSIONS, keys)),
+            'names' : dict((dimension, [data_source.map_to_name(key) for key in k]
+                                       if k is not None else None)
+                           for dimension, k in zip(DIMENSIONS, keys)),
+            'columns' : COLUMNS
+        }
+
+        # The header is written last, so that a dataset with a header is
+        # complete.
+        header_path = os.path.join(output_path, HEADER_FILE)
+        with open(header_path + ".tmp", "w") as f:
+            json.dump(header, f, indent=1, sort_keys=True)
+        os.rename(header_path + ".tmp", header_path)
+
+    def supports_streaming(self):
+        return True
+
+    def generate_dataset(self, data_source, dataset):
+        output_path = os.path.join(self.logan_config.args.dout_path, dataset) + ".columnar"
+        manifest = self.get_manifest()
+        manifest_key = os.path.basename(output_path)
+        digest = logan.dataoutput.base.dataset_digest(data_source, dataset,
+                                                      "columnar", OUTPUT_VERSION)
+        if manifest.unchanged(manifest_key, digest, self._get_file_names(output_path)):
+            logging.info("(DOUT/columnar) Unchanged {}".format(output_path))
+            return True
+
+        logging.info("(DOUT/columnar) Writing to {} ...".format(output_path))
+        if not os.path.exists(output_path):
+            os.makedirs(os.path.abspath(output_path))
+        elif os.path.exists(os.path.join(output_path, HEADER_FILE)):
+            os.remove(os.path.join(output_path, HEADER_FILE))
+
+        with logan.trace.span("write columns", dataset=dataset):
+            self._write_dataset(data_source, dataset, output_path)
+
+        manifest.update(manifest_key, digest)
+        return True
+
+    def generate_finish(self, data_source):
+        self.get_manifest().save()
+        return True
+
+    def generate(self, data_source):
+        """
+        Interface function to be called by the main program. This should
+        trigger the generation of the output.
+
+        @type data_source: DataSource
+        @data_source: Any datasource DataSource which defines the basic interface.
+        @rtype: boolean
+        @return: Success or not.
+        """
+        try:
+            for dataset in data_source.get_dataset_keys():
+                if not self.generate_dataset(data_source, dataset):
+                    return False
+        finally:
+            self.get_manifest().save()
+
+        return True
@@ -2,9 +2,29 @@
 Dataoutput for CSV.
 """
 
+from __future__ import absolute_import
+
 import os
+import csv
+import numbers
 import logging
 import logan.dataoutput.base
+import logan.dataoutput.table
+import logan.trace
+
+# Part of the digest of each output; change if the output of the same data
+# changes, so that existing outputs are regenerated.
+OUTPUT_VERSION = 3
+
+FORMATS = ["wide", "long"]
+
+LONG_FORMAT_COLUMNS = ["dataset", "x", "cluster", "stack", "ztick",
+                       "y", "y_err_lo", "y_err_hi", "z", "z_err_lo", "z_err_hi"]
+
+# Format of the values of the long format: 12 significant digits are kept,
+# which hides artifacts of the binary representation (e.g. 22.3175 rather
+# than 22.317500000000003).
+LONG_FORMAT_VALUE = "{:.12g}"
 
 def register_arguments(logan_config):
     """
@@ -14,6 +34,10 @@ def register_arguments(logan_config):
 
     @type logan_config: LoganConfig
     """
+    logan_config.add_argument("--csv-format", metavar="FMT", type=str,
+            dest="csv_format", default="wide", choices=FORMATS,
+            help="Table layout: 'wide' writes a row per x-tick and a column per cluster; 'long' writes a row per data point with the columns {}. [Default:wide]".format(
+                ", ".join(LONG_FORMAT_COLUMNS)))
 
 def get_description():
     """
@@ -28,33 +52,81 @@ class DataOutput(logan.dataoutput.base.DataOutput):
         """
         super(DataOutput, self).__init__(logan_config)
 
-    def _make_table(self, data_source, dataset, f):
-        # Store result to ensure ordering is preserved -- don't sort, sorted by data_source
-        cluster_keys = data_source.get_cluster_keys(dataset=dataset)
-        xtick_keys = data_source.get_xtick_keys(dataset=dataset)
-        stack_keys = data_source.get_stack_keys(dataset=dataset)
-
-        if data_source.get_xlabel(dataset=dataset) is not None:
-            f.write(data_source.get_xlabel(dataset=dataset))
-        f.write(";" + ";".join(data_source.map_to_name(c) for c in cluster_keys) + "\n")
-
-        for x in xtick_keys:
-            f.write("{}".format(data_source.map_to_name(x)))
-            for i, cluster in enumerate(cluster_keys):
-                y_summed = 0.0
-                f.write(";")
-                for j, stack in enumerate(stack_keys if stack_keys is not None else [None]):
-                    y = data_source.query_data(x=x, cluster=cluster, dataset=dataset, stack=stack).y
-                    y_summed += y
-                    if stack is None:
-                        f.write("{:.3f}".format(y))
-                    else:
-                        if j != 0: f.write("+")
-                        f.write("{:.3f}[{}]".format(y, data_source.map_to_name(stack)))
-
-                if stack is not None:
-                    f.write("={:.3f}".format(y_summed))
-            f.write("\n")
+    def _write_wide(self, data_source, dataset, output_file):
+        """
+        Writes a row per x-tick and a column per cluster; stacks are written
+        as their sum in each cell (see logan.dataoutput.table).
+        """
+        with logan.trace.span("build table", dataset=dataset):
+            table = logan.dataoutput.table.Table(data_source, dataset)
+        if table.omits_z:
+            logging.warning("(DOUT/csv) Omitting z data of {} (use --csv-format long)".format(
+                dataset))
+        logan.dataoutput.table.write_csv(table, output_file)
+
+    def _write_long(self, data_source, dataset, output_file):
+        """
+        Writes a row per data point, without holding more than a row in
+        memory: the names of its keys, and its y and z values with their
+        errors (see LONG_FORMAT_VALUE). Dimensions the dataset does not have are left
+        empty.
+        """
+        writer = csv.writer(output_file, delimiter=";", lineterminator="\n")
+        has_z = data_source.get_ztick_keys(dataset=dataset) is not None
+        names = {}
+        def _name(key):
+            if key not in names:
+                names[key] = data_source.map_to_name(key) if key is not None else None
+            return names[key]
+
+        def _value(value):
+            # Other values (e.g. None) are written as they are.
+            if isinstance(value, numbers.Real):
+                return LONG_FORMAT_VALUE.format(value)
+            return value
+
+        def _values(value, err):
+            return (_value(value), _value(err[0]), _value(err[1]))
+
+        writer.writerow(LONG_FORMAT_COLUMNS)
+        writer.writerows((dataset, _name(x), _name(cluster), _name(stack),
+                          _name(z) if has_z else None) +
+                         _values(data_point.y, data_point.y_err) +
+                         (_values(data_point.z, data_point.z_err) if has_z else
+                          (None, None, None))
+                         for x, z, cluster, stack, data_point
+                         in data_source.query_grid(dataset))
+
+    def supports_streaming(self):
+        return True
+
+    def generate_dataset(self, data_source, dataset):
+        if not os.path.exists(self.logan_config.args.dout_path):
+            os.makedirs(os.path.abspath(self.logan_config.args.dout_path))
+
+        output_file_name = os.path.join(self.logan_config.args.dout_path, dataset) + ".csv"
+        manifest = self.get_manifest()
+        digest = logan.dataoutput.base.dataset_digest(data_source, dataset,
+                "csv", OUTPUT_VERSION, self.logan_config.args.csv_format)
+        manifest_key = os.path.basename(output_file_name)
+        if manifest.unchanged(manifest_key, digest, [output_file_name]):
+            logging.info("(DOUT/csv) Unchanged {}".format(output_file_name))
+            return True
+
+        logging.info("(DOUT/csv) Writing to {} ...".format(output_file_name))
+        with logan.trace.span("write table", dataset=dataset), \
+                logan.dataoutput.table.open_table(output_file_name, "csv") as output_file:
+            if self.logan_config.args.csv_format == "long":
+                self._write_long(data_source, dataset, output_file)
+            else:
+                self._write_wide(data_source, dataset, output_file)
+
+        manifest.update(manifest_key, digest)
+        return True
+
+    def generate_finish(self, data_source):
+        self.get_manifest().save()
+        return True
 
     def generate(self, data_source):
         """
@@ -66,14 +138,11 @@ class DataOutput(logan.dataoutput.base.DataOutput):
         @rtype: boolean
         @return: Success or not.
         """
-        if not os.path.exists(self.logan_config.args.dout_path):
-            os.makedirs(os.path.abspath(self.logan_config.args.dout_path))
-
-        for dataset in data_source.get_dataset_keys():
-            output_file_name = os.path.join(self.logan_config.args.dout_path, dataset) + ".csv"
-            logging.info("(DOUT/csv) Writing to {} ...".format(output_file_name))
-            with open(output_file_name, "w") as output_file:
-                self._make_table(data_source, dataset, output_file)
+        try:
+            for dataset in data_source.get_dataset_keys():
+                if not self.generate_dataset(data_source, dataset):
+                    return False
+        finally:
+            self.get_manifest().save()
 
         return True
-
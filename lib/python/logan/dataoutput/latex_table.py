@@ -5,6 +5,12 @@ Dataoutput for LaTeX Table.
 import os
 import logging
 import logan.dataoutput.base
+import logan.dataoutput.table
+import logan.trace
+
+# Part of the digest of each output; change if the output of the same data
+# changes, so that existing outputs are regenerated.
+OUTPUT_VERSION = 2
 
 def register_arguments(logan_config):
     """
@@ -28,47 +34,37 @@ class DataOutput(logan.dataoutput.base.DataOutput):
         """
         super(DataOutput, self).__init__(logan_config)
 
-    def _make_table(self, data_source, dataset, f):
-        def _sanitize(s):
-            return s.replace("_", "\\_").replace("&", "\\&").replace("%", "\\%")
-
-        # Store result to ensure ordering is preserved -- don't sort, sorted by data_source
-        cluster_keys = data_source.get_cluster_keys(dataset=dataset)
-        xtick_keys = data_source.get_xtick_keys(dataset=dataset)
-        stack_keys = data_source.get_stack_keys(dataset=dataset)
-
-        f.write("""\\begin{{table}}
-\\caption{{{}}}
-\\begin{{tabular}}{{{}}}
-\\hline
-""".format(_sanitize(data_source.get_ylabel(dataset=dataset)), ("|l"*(len(cluster_keys)+1))+"|"))
-
-        if data_source.get_xlabel(dataset=dataset) is not None:
-            f.write(data_source.get_xlabel(dataset=dataset))
-        f.write(" &" + " & ".join(_sanitize(data_source.map_to_name(c)) for c in cluster_keys) + "\\\\\hline\n")
+    def supports_streaming(self):
+        return True
 
-        for x in xtick_keys:
-            f.write("{}".format(_sanitize(data_source.map_to_name(x))))
-            for i, cluster in enumerate(cluster_keys):
-                y_summed = 0.0
-                f.write(" & \\(")
-                for j, stack in enumerate(stack_keys if stack_keys is not None else [None]):
-                    y = data_source.query_data(x=x, cluster=cluster, dataset=dataset, stack=stack).y
-                    y_summed += y
-                    if stack is None:
-                        f.write("{:.3f}".format(y))
-                    else:
-                        if j != 0: f.write("+")
-                        f.write("{:.3f}_\\text{{{}}}".format(y,
-                            _sanitize(data_source.map_to_name(stack))))
+    def generate_dataset(self, data_source, dataset):
+        if not os.path.exists(self.logan_config.args.dout_path):
+            os.makedirs(os.path.abspath(self.logan_config.args.dout_path))
 
-                if stack is not None:
-                    f.write(" = {:.3f}".format(y_summed))
-                f.write("\\)")
-            f.write("\\\\\\hline\n")
+        output_file_name = os.path.join(self.logan_config.args.dout_path, dataset) + ".tex"
+        manifest = self.get_manifest()
+        digest = logan.dataoutput.base.dataset_digest(data_source, dataset,
+                                                      "latex_table", OUTPUT_VERSION)
+        manifest_key = os.path.basename(output_file_name)
+        if manifest.unchanged(manifest_key, digest, [output_file_name]):
+            logging.info("(DOUT/latex_table) Unchanged {}".format(output_file_name))
+            return True
+
+        logging.info("(DOUT/latex_table) Writing to {} ...".format(output_file_name))
+        with logan.trace.span("build table", dataset=dataset):
+            table = logan.dataoutput.table.Table(data_source, dataset)
+        if table.omits_z:
+            logging.warning("(DOUT/latex_table) Omitting z data of {}".format(dataset))
+        with logan.trace.span("write table", dataset=dataset), \
+                logan.dataoutput.table.open_table(output_file_name, "tex") as output_file:
+            logan.dataoutput.table.write_latex(table, output_file)
+
+        manifest.update(manifest_key, digest)
+        return True
 
-        f.write("""\\end{tabular}
-\\end{table}""")
+    def generate_finish(self, data_source):
+        self.get_manifest().save()
+        return True
 
     def generate(self, data_source):
         """
@@ -80,13 +76,11 @@ class DataOutput(logan.dataoutput.base.DataOutput):
         @rtype: boolean
         @return: Success or not.
         """
-        if not os.path.exists(self.logan_config.args.dout_path):
-            os.makedirs(os.path.abspath(self.logan_config.args.dout_path))
-
-        for dataset in data_source.get_dataset_keys():
-            output_file_name = os.path.join(self.logan_config.args.dout_path, dataset) + ".tex"
-            logging.info("(DOUT/latex_table) Writing to {} ...".format(output_file_name))
-            with open(output_file_name, "w") as output_file:
-                self._make_table(data_source, dataset, output_file)
+        try:
+            for dataset in data_source.get_dataset_keys():
+                if not self.generate_dataset(data_source, dataset):
+                    return False
+        finally:
+            self.get_manifest().save()
 
         return True
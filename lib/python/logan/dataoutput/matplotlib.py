@@ -4,13 +4,32 @@ Dataoutput for matplotlib.
 
 import os
 import logging
+import argparse
+import hashlib
 import logan.dataoutput.base
+import logan.datasource.base
+import logan.trace
 from logan.compat import *
+from logan.registry import lazy_import
 
 import math
-import numpy as np
-import matplotlib
-import matplotlib.pyplot as plt
+import numbers
+import threading
+import collections
+
+# Only imported once needed by generate, so that registering arguments and
+# --help do not pay for them.
+np = lazy_import("numpy")
+matplotlib = lazy_import("matplotlib")
+plt = lazy_import("matplotlib.pyplot")
+mpl_figure = lazy_import("matplotlib.figure")
+mpl_backend_agg = lazy_import("matplotlib.backends.backend_agg")
+mpl_backend_pdf = lazy_import("matplotlib.backends.backend_pdf")
+mpl_colors = lazy_import("matplotlib.colors")
+mpl_cm = lazy_import("matplotlib.cm")
+mpl_patches = lazy_import("matplotlib.patches")
+mpl_path = lazy_import("matplotlib.path")
+mpl_container = lazy_import("matplotlib.container")
 
 AVAILABLE_FORMATS = {
     None  : None,
@@ -33,15 +52,141 @@ COLOR_THEMES = {
 
 LINE_STYLES = [ "ko-", "ks--", "k^:", "ro-", "rs--", "r^:", "bo-", "bs--", "b^:"]
 
+# Presentation hint types plotted from DataSource.data()
+SERIES_TYPES = ["line", "scatter"]
+
+DOWNSAMPLE_METHODS = ["minmax", "lttb", "none"]
+
+# Lines with more points are drawn without markers.
+LINE_MARKERS_MAX_POINTS = 64
+
+# Marker size of scatter plots [points^2]
+SCATTER_MARKER_SIZE = 4
+
+# Single points of series hashed at once by the figure digest
+SERIES_DIGEST_CHUNK = 65536
+
+# Bars per patch with --mpl-merge-bars; matplotlib only snaps paths of up to
+# 1024 vertices to pixels (5 per bar), which bars are drawn with otherwise.
+MERGE_BARS_PER_PATCH = 200
+
+# Colormaps of heatmaps per theme (unless set by the 'cmap' presentation hint)
+HEATMAP_COLORMAPS = {
+    "color" : "viridis",
+    "bw"    : "Greys",
+    "colbw" : "cividis"
+}
+
+# Heatmaps with more cells are not annotated with their values.
+HEATMAP_ANNOTATE_MAX_CELLS = 400
+
+# At most as many tick labels are shown per heatmap axis.
+HEATMAP_MAX_TICKS = 40
+
+# Part of the digest of each output; change if the output of the same data
+# changes, so that existing outputs are regenerated.
+OUTPUT_VERSION = 1
+
 LEGEND_MAX_ROWS = int(os.environ.get("LOGAN_LEGEND_MAX_ROWS", 4))
 HATCH_DENSITY = int(os.environ.get("LOGAN_HATCH_DENSITY", 20))
 
+def downsample_minmax(x, y, columns):
+    """
+    Min/max decimation: splits the x-range into columns equally wide
+    intervals, and keeps the first, last, minimum and maximum point of each.
+    At a resolution of columns pixels, a line through the kept points is drawn
+    the same as through all points.
+
+    @x: Sorted array.
+    @return: Sorted array of the indices of the kept points.
+    """
+    count = len(x)
+    if count <= 4 * columns:
+        return np.arange(count)
+
+    span = x[-1] - x[0]
+    if span > 0:
+        column = np.minimum(((x - x[0]) * (columns / span)).astype(np.int64), columns - 1)
+    else:
+        column = np.zeros(count, dtype=np.int64)
+
+    starts = np.flatnonzero(np.r_[True, column[1:] != column[:-1]])
+    ends = np.r_[starts[1:], count] - 1
+    segment = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, count]))
+
+    def _first_per_segment(mask):
+        indices = np.flatnonzero(mask)
+        _, first = np.unique(segment[indices], return_index=True)
+        return indices[first]
+
+    argmin = _first_per_segment(y == np.minimum.reduceat(y, starts)[segment])
+    argmax = _first_per_segment(y == np.maximum.reduceat(y, starts)[segment])
+    return np.unique(np.concatenate([starts, ends, argmin, argmax]))
+
+def downsample_lttb(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets: keeps threshold points, the first, the
+    last, and of each bucket in between the point spanning the largest
+    triangle with the previously kept point and the average of the next
+    bucket.
+
+    @x: Sorted array.
+    @return: Sorted array of the indices of the kept points.
+    """
+    count = len(x)
+    if threshold >= count or threshold < 3:
+        return np.arange(count)
+
+    every = (count - 2) / float(threshold - 2)
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0] = a = 0
+    kept[-1] = count - 1
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, count)
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) -
+                      (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        kept[i + 1] = a
+
+    return kept
+
+def downsample_pixels(x, y, limits, size):
+    """
+    Keeps the first point of each cell of a grid of the given size, e.g. the
+    pixels or marker-sized cells of a scatter plot.
+
+    @limits: Tuple of x and y limits of the plot, each a tuple of min and max.
+    @size: Tuple of width and height of the grid.
+    @return: Sorted array of the indices of the kept points.
+    """
+    cells = np.zeros(len(x), dtype=np.int64)
+    for values, (low, high), pixels in zip([x, y], limits, size):
+        span = high - low
+        if span > 0:
+            pixel = np.clip(((values - low) * (pixels / span)).astype(np.int64), 0, pixels - 1)
+        else:
+            pixel = np.zeros(len(values), dtype=np.int64)
+        cells = cells * pixels + pixel
+
+    _, first = np.unique(cells, return_index=True)
+    return np.sort(first)
+
 def _patch_matplotlib(args):
     global HATCH_DENSITY
 
     import matplotlib.hatch
     import matplotlib.patches
 
+    # Only patch once per process (e.g. a daemon creates a DataOutput per
+    # request).
+    if hasattr(matplotlib.hatch, "_orig_get_path"):
+        return
+
     if HATCH_DENSITY is not None:
         # HACK: There does not seem to be any other way to globally set
         # matplotlib's hatch-density
@@ -64,6 +209,36 @@ def _patch_matplotlib(args):
             matplotlib.patches.Patch._orig_set_hatch(self, hatch)
         matplotlib.patches.Patch.set_hatch = override_Patch_set_hatch
 
+# Set before forking the render workers, so that they inherit the DataOutput
+# and the processed DataSource instead of having them pickled.
+_render_state = None
+
+def _render(task):
+    """
+    @task: Tuple of figure name, its datasets and output formats to render.
+    @return: Tuple of success, and the trace events of the worker.
+    """
+    data_output, data_source = _render_state
+    name, datasets, out_formats = task
+    try:
+        data_output._plot_and_output(data_source, name, datasets, out_formats,
+                                     data_output.grid)
+        result = True
+    except Exception:
+        logging.exception("(DOUT/matplotlib) Rendering {} raised:".format(name))
+        result = False
+    return (result, logan.trace.take_events())
+
+def _simplify_threshold(value):
+    """
+    Argument type of --mpl-simplify; matplotlib only accepts thresholds in
+    [0, 1].
+    """
+    threshold = float(value)
+    if not 0.0 <= threshold <= 1.0:
+        raise argparse.ArgumentTypeError("{} not in [0, 1]".format(value))
+    return threshold
+
 def register_arguments(logan_config):
     """
     Interface function.
@@ -75,6 +250,30 @@ def register_arguments(logan_config):
     logan_config.add_argument("--mpl-interactive", dest='mpl_interactive',
             action="store_true", default=False,
             help="Display interactive selection, to select from available datasets.")
+    logan_config.add_argument("--mpl-cache-size", metavar="N", type=int,
+            dest='mpl_cache_size', default=16,
+            help="Number of datasets whose plot data is kept in memory in interactive mode; the data of datasets not yet selected is prepared in the background. 0 to disable. [Default:16]")
+    logan_config.add_argument("--mpl-grid", metavar="RxC", type=str,
+            dest='mpl_grid', default=None,
+            help="Compose datasets into grids of R rows and C columns of subplots per figure; figures are named grid-NNN. Not used in interactive mode.")
+    logan_config.add_argument("--mpl-multipage", metavar="NAME", type=str,
+            dest='mpl_multipage', default=None,
+            help="Write all figures as pages of a single PDF NAME.pdf, instead of a PDF file per figure. Not used in interactive mode.")
+    logan_config.add_argument("--mpl-rasterize", dest='mpl_rasterize',
+            action="store_true", default=False,
+            help="Rasterize the data (bars, lines, markers) of vector formats, keeping text and axes as vectors; see --mpl-dpi. Overridden per dataset by the 'rasterize' presentation hint.")
+    logan_config.add_argument("--mpl-dpi", metavar="DPI", type=float,
+            dest='mpl_dpi', default=None,
+            help="Resolution of raster formats and rasterized data. [Default:matplotlib's savefig.dpi]")
+    logan_config.add_argument("--mpl-merge-bars", dest='mpl_merge_bars',
+            action="store_true", default=False,
+            help="Draw the bars of each series as a single patch instead of a patch per bar. Overridden per dataset by the 'merge_bars' presentation hint.")
+    logan_config.add_argument("--mpl-simplify", metavar="THRESHOLD",
+            dest='mpl_simplify', default=None, type=_simplify_threshold,
+            help="Simplify paths with matplotlib's path.simplify_threshold set to THRESHOLD (between 0 and 1); larger thresholds remove more vertices. [Default:matplotlib's path.simplify_threshold]")
+    logan_config.add_argument("--mpl-downsample", metavar="METHOD", type=str,
+            dest='mpl_downsample', default="minmax", choices=DOWNSAMPLE_METHODS,
+            help="Downsampling of line plots with more points than pixel columns: 'minmax' keeps the extremes of each column, 'lttb' the most significant points; scatter plots keep a point per pixel unless 'none'. [Default:minmax]")
 
 def get_description():
     """
@@ -84,6 +283,109 @@ def get_description():
                 ", ".join(k for k in AVAILABLE_FORMATS.keys() if k is not None)),
             None)
 
+class PlotDataCache(object):
+    """
+    Least recently used cache of the plot data (DatasetSnapshot) of datasets,
+    for interactive mode: selecting a dataset again does not query the
+    DataSource again. A background thread prepares the data of the datasets
+    given to prefetch while the cache is not full; it never evicts data.
+    Snapshots are prepared one at a time, so that the DataSource is never
+    queried concurrently.
+    """
+    def __init__(self, data_source, size):
+        """
+        @size: Maximum number of datasets in the cache.
+        """
+        self.data_source = data_source
+        self.size = size
+        self._entries = collections.OrderedDict()
+        self._pending = []
+        self._stopped = False
+        self._condition = threading.Condition()
+        self._source_lock = threading.Lock()
+        self._thread = None
+
+    def _prepare(self, dataset):
+        hints = self.data_source.get_presentation_hints(dataset)
+        series = hints.get('type') in SERIES_TYPES
+        return logan.datasource.base.DatasetSnapshot(self.data_source, dataset,
+                                                     grid=not series, series=series)
+
+    def get(self, dataset):
+        """
+        @return: DatasetSnapshot of dataset, prepared now if not cached.
+        """
+        with self._condition:
+            if dataset in self._entries:
+                snapshot = self._entries.pop(dataset)
+                self._entries[dataset] = snapshot
+                return snapshot
+
+        # Waits for the snapshot the background thread is preparing, which
+        # may be of dataset.
+        with self._source_lock:
+            with self._condition:
+                snapshot = self._entries.pop(dataset, None)
+            if snapshot is None:
+                with logan.trace.span("prepare", dataset=dataset):
+                    snapshot = self._prepare(dataset)
+
+        with self._condition:
+            self._entries[dataset] = snapshot
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+            return snapshot
+
+    def prefetch(self, datasets):
+        """
+        Prepares the data of datasets in the background, in the given order;
+        replaces the datasets of previous calls still pending.
+        """
+        with self._condition:
+            self._pending = list(datasets)
+            self._condition.notify()
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="logan-prefetch")
+            # Not joined when the interactive selection exits.
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopped and \
+                        (not self._pending or len(self._entries) >= self.size):
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                dataset = self._pending.pop(0)
+                if dataset in self._entries:
+                    continue
+
+            with self._source_lock:
+                with self._condition:
+                    if dataset in self._entries:
+                        continue
+                try:
+                    with logan.trace.span("prefetch", dataset=dataset):
+                        snapshot = self._prepare(dataset)
+                except Exception:
+                    # Raised again once selected.
+                    logging.debug("(DOUT/matplotlib) Preparing {} in the background failed".format(
+                        dataset), exc_info=True)
+                    continue
+
+                with self._condition:
+                    if len(self._entries) < self.size:
+                        self._entries[dataset] = snapshot
+            logging.debug("(DOUT/matplotlib) Prepared {}".format(dataset))
+
 class DataOutput(logan.dataoutput.base.DataOutput):
     def __init__(self, logan_config):
         """
@@ -92,6 +394,24 @@ class DataOutput(logan.dataoutput.base.DataOutput):
         super(DataOutput, self).__init__(logan_config)
         _patch_matplotlib(self.logan_config.args)
 
+        self.grid = None
+        if self.logan_config.args.mpl_grid is not None:
+            try:
+                rows, cols = (int(k) for k in self.logan_config.args.mpl_grid.split("x"))
+                if rows < 1 or cols < 1:
+                    raise ValueError()
+            except ValueError:
+                raise Exception("Invalid grid: {} [Expected: RxC]".format(
+                    self.logan_config.args.mpl_grid))
+            self.grid = (rows, cols)
+
+        # State of streaming mode: datasets of the incomplete grid, and the
+        # multi-page PDF.
+        self._pending_datasets = []
+        self._figure_count = 0
+        self._pdf_pages = None
+        self._page_digests = []
+
     def _get_bar_color_args(self, i):
         colors, hatches = COLOR_THEMES[self.logan_config.args.dout_theme]
         if hatches is not None:
@@ -102,7 +422,40 @@ class DataOutput(logan.dataoutput.base.DataOutput):
             return {'color' : colors[i % len(colors)],
                     'ecolor' : 'gray'}
 
-    def _plot_bar(self, data_source, dataset):
+    def _get_figsize(self, data_source, dataset):
+        """
+        @return: Tuple of figure size, and the automatic figure size (which
+                 the size is overridden with by the presentation hints or
+                 --dout-size).
+        """
+        xtick_count = len(data_source.get_xtick_keys(dataset=dataset) or [])
+        override_figsize = data_source.get_presentation_hints(dataset).get('size') or \
+                           self.logan_config.args.dout_size
+        if data_source.get_presentation_hints(dataset).get('type') == 'heatmap':
+            # Cells shrink instead, as heatmaps may have many ticks on both axes.
+            ztick_count = len(data_source.get_ztick_keys(dataset=dataset) or [])
+            auto_figsize = [min(max(12, xtick_count*0.8), 24), min(max(6, ztick_count*0.5), 12)]
+        else:
+            auto_figsize = [max(12, (xtick_count - 1)*1.2), 6]
+        figsize = auto_figsize if not override_figsize \
+                  else [float(k) if k else auto_figsize[i] for i,k in \
+                        enumerate(override_figsize.split("x"))]
+        return figsize, auto_figsize
+
+    def _new_figure(self, figsize, interactive):
+        """
+        @interactive: If the figure is going to be displayed; only then it is
+                      managed by pyplot. Otherwise, the figure is drawn on its
+                      own canvas, so that no global pyplot state is involved.
+        """
+        if interactive:
+            return plt.figure(figsize=figsize)
+
+        fig = mpl_figure.Figure(figsize=figsize)
+        mpl_backend_agg.FigureCanvasAgg(fig)
+        return fig
+
+    def _plot_bar(self, data_source, dataset, ax):
         # Store result to ensure ordering is preserved -- don't sort, sorted by data_source
         cluster_keys = data_source.get_cluster_keys(dataset=dataset)
         xtick_keys = data_source.get_xtick_keys(dataset=dataset)
@@ -110,9 +463,6 @@ class DataOutput(logan.dataoutput.base.DataOutput):
         fontsize = data_source.get_presentation_hints(dataset).get('fontsize', "large")
         color_offset = data_source.get_presentation_hints(dataset).get('color_offset', 0)
 
-        matplotlib.rc("xtick", labelsize=fontsize)
-        matplotlib.rc("ytick", labelsize=fontsize)
-
         ind = np.arange(len(xtick_keys))
         width_bar_factor = data_source.get_presentation_hints(dataset).get('bar_width', 0.75)
         if len(ind) > 1:
@@ -120,15 +470,9 @@ class DataOutput(logan.dataoutput.base.DataOutput):
         else:
             width_bar = (len(cluster_keys) * len(xtick_keys))*width_bar_factor
 
-        override_figsize = data_source.get_presentation_hints(dataset).get('size') or \
-                           self.logan_config.args.dout_size
-        auto_figsize = [max(12, ind[-1]*1.2), 6]
-        figsize = auto_figsize if not override_figsize \
-                  else [float(k) if k else auto_figsize[i] for i,k in \
-                        enumerate(override_figsize.split("x"))]
+        figsize, auto_figsize = self._get_figsize(data_source, dataset)
 
-        fig = plt.figure(figsize=figsize)
-        ax = fig.add_subplot(111)
+        ax.tick_params(labelsize=fontsize)
 
         # Setup x-Axis
         ax.yaxis.grid(True)
@@ -282,6 +626,634 @@ class DataOutput(logan.dataoutput.base.DataOutput):
             ax.set_position([box.x0, box.y0,
                 box.width, box.height - 0.025*min(len(legend_params[0]), LEGEND_MAX_ROWS)])
 
+    def _get_series(self, data_source, dataset):
+        """
+        @return: OrderedDict mapping tuples of cluster and stack to tuples of
+                 the x and y arrays of the series, as yielded by data().
+        """
+        chunks = collections.OrderedDict()
+        points = collections.OrderedDict()
+        def _flush(key):
+            xs, ys = points.pop(key)
+            if all(isinstance(x, numbers.Number) for x in xs):
+                chunks[key][0].append(np.asarray(xs, dtype=np.float64))
+            else:
+                # Keys, which may also be tuples.
+                x_keys = np.empty(len(xs), dtype=object)
+                for i, x in enumerate(xs):
+                    x_keys[i] = x
+                chunks[key][0].append(x_keys)
+            chunks[key][1].append(np.asarray(ys, dtype=np.float64))
+
+        for data_point in data_source.data(dataset=dataset):
+            if data_point.dataset is not None and data_point.dataset != dataset:
+                continue
+
+            key = (data_point.cluster, data_point.stack)
+            chunks.setdefault(key, ([], []))
+            if np.ndim(data_point.y) > 0:
+                if key in points:
+                    _flush(key)
+                chunks[key][0].append(np.asarray(data_point.x))
+                chunks[key][1].append(np.asarray(data_point.y, dtype=np.float64))
+            else:
+                xs, ys = points.setdefault(key, ([], []))
+                xs.append(data_point.x)
+                ys.append(data_point.y)
+
+        for key in list(points):
+            _flush(key)
+
+        return collections.OrderedDict(
+            (key, (np.concatenate(xs), np.concatenate(ys)))
+            for key, (xs, ys) in chunks.items())
+
+    def _plot_series(self, data_source, dataset, ax, plot_type):
+        """
+        Plots the series of dataset (see _get_series) as lines or scatter
+        plot, downsampled to the resolution of the plot.
+        """
+        hints = data_source.get_presentation_hints(dataset)
+        fontsize = hints.get('fontsize', "large")
+        color_offset = hints.get('color_offset', 0)
+        method = self.logan_config.args.mpl_downsample
+
+        ax.tick_params(labelsize=fontsize)
+        ax.grid(True)
+        if data_source.get_xlabel(dataset=dataset) is not None:
+            ax.set_xlabel(data_source.get_xlabel(dataset=dataset), fontsize=fontsize)
+        ax.set_ylabel(data_source.get_ylabel(dataset=dataset), fontsize=fontsize)
+
+        series = self._get_series(data_source, dataset)
+
+        # Non-numeric x (e.g. keys) are placed at the position of their key.
+        if any(x.dtype == object for x, _ in series.values()):
+            xtick_keys = list(data_source.get_xtick_keys(dataset=dataset) or [])
+            for x, _ in series.values():
+                xtick_keys.extend(key for key in x.tolist() if key not in xtick_keys)
+            positions = dict((key, i) for i, key in enumerate(xtick_keys))
+            series = collections.OrderedDict(
+                (key, (np.array([positions[k] for k in x.tolist()], dtype=np.float64), y))
+                for key, (x, y) in series.items())
+            ax.set_xticks(np.arange(len(xtick_keys)))
+            ax.set_xticklabels([data_source.map_to_name(key) for key in xtick_keys],
+                               fontsize=fontsize)
+
+        fig = ax.get_figure()
+        box = ax.get_position()
+        size = (max(int(box.width * fig.get_figwidth() * fig.dpi), 1),
+                max(int(box.height * fig.get_figheight() * fig.dpi), 1))
+
+        filtered = collections.OrderedDict()
+        for key, (x, y) in series.items():
+            x = x.astype(np.float64)
+            finite = np.isfinite(x) & np.isfinite(y)
+            if not finite.all():
+                x, y = x[finite], y[finite]
+            filtered[key] = (x, y)
+        series = filtered
+
+        if plot_type == 'scatter':
+            # Pixels of the data range of all series
+            nonempty = [(x, y) for x, y in series.values() if len(x)]
+            limits = [(min(values.min() for values in axis), max(values.max() for values in axis))
+                      for axis in zip(*nonempty)] if nonempty else [(0, 0), (0, 0)]
+
+        for i, ((cluster, stack), (x, y)) in enumerate(series.items()):
+            if plot_type == 'line':
+                if len(x) > 1 and (np.diff(x) < 0).any():
+                    order = np.argsort(x, kind="mergesort")
+                    x, y = x[order], y[order]
+                # Twice the pixel columns, as the columns of the data range
+                # are not aligned with the pixels.
+                if method == "minmax":
+                    kept = downsample_minmax(x, y, 2 * size[0])
+                elif method == "lttb":
+                    kept = downsample_lttb(x, y, 2 * size[0])
+                else:
+                    kept = None
+            elif method != "none":
+                # Points closer than a marker overlap.
+                marker_pixels = max(math.sqrt(SCATTER_MARKER_SIZE) * fig.dpi / 72.0, 1.0)
+                kept = downsample_pixels(x, y, limits,
+                                         [max(int(pixels / marker_pixels), 1) for pixels in size])
+            else:
+                kept = None
+
+            if kept is not None and len(kept) < len(x):
+                logging.debug("(DOUT/matplotlib) Downsampled series of {} from {} to {} points".format(
+                    dataset, len(x), len(kept)))
+                x, y = x[kept], y[kept]
+
+            label = " / ".join(data_source.map_to_name(key) for key in (cluster, stack)
+                               if key is not None) or None
+            style = LINE_STYLES[(i + color_offset) % len(LINE_STYLES)]
+            if plot_type == 'line':
+                if len(x) > LINE_MARKERS_MAX_POINTS:
+                    style = style[0] + style[2:]
+                ax.plot(x, y, style, label=label)
+            else:
+                ax.scatter(x, y, s=SCATTER_MARKER_SIZE, c=style[0], marker=style[1], linewidths=0, label=label)
+
+        y_range = data_source.get_yrange(dataset=dataset)
+        if y_range is not None and y_range not in ['auto', 'auto_nozoom']:
+            ax.set_ylim(y_range)
+
+        if hints.get('show_legend', True) and \
+                any(key != (None, None) for key in series):
+            ax.legend(loc="best", fontsize=fontsize)
+
+    def _plot_heatmap(self, data_source, dataset, ax):
+        """
+        Plots the x-tick by z-tick grid of dataset as a heatmap; stacks are
+        summed, and each cluster gets its own heatmap (sharing the color
+        scale) in the space of ax.
+        """
+        hints = data_source.get_presentation_hints(dataset)
+        fontsize = hints.get('fontsize', "large")
+        xtick_keys = data_source.get_xtick_keys(dataset=dataset)
+        ztick_keys = data_source.get_ztick_keys(dataset=dataset)
+        cluster_keys = data_source.get_cluster_keys(dataset=dataset)
+        stack_keys = data_source.get_stack_keys(dataset=dataset)
+        if ztick_keys is None:
+            raise Exception("Heatmap of {} requires z-ticks!".format(dataset))
+
+        # Fetch the whole grid in one pass
+        shape = (len(xtick_keys), len(ztick_keys),
+                 len(cluster_keys) if cluster_keys is not None else 1,
+                 len(stack_keys) if stack_keys is not None else 1)
+        values = np.fromiter((data_point.y if not isinstance(data_point.y, dict) else np.nan
+                              for _, _, _, _, data_point in data_source.query_grid(dataset)),
+                             dtype=np.float64, count=int(np.prod(shape))).reshape(shape)
+        values = values.sum(axis=3)
+
+        y_range = data_source.get_yrange(dataset=dataset)
+        if y_range is not None and y_range not in ['auto', 'auto_nozoom']:
+            vmin, vmax = y_range
+        elif np.isfinite(values).any():
+            vmin, vmax = np.nanmin(values), np.nanmax(values)
+        else:
+            vmin, vmax = 0.0, 1.0
+        norm = mpl_colors.Normalize(vmin=vmin, vmax=vmax)
+        cmap_name = hints.get('cmap', HEATMAP_COLORMAPS.get(self.logan_config.args.dout_theme,
+                                                            "viridis"))
+        try:
+            cmap = matplotlib.colormaps[cmap_name]
+        except AttributeError:
+            # matplotlib < 3.5
+            cmap = mpl_cm.get_cmap(cmap_name)
+
+        fig = ax.get_figure()
+        if shape[2] > 1:
+            subplot_spec = ax.get_subplotspec()
+            fig.delaxes(ax)
+            gridspec = subplot_spec.subgridspec(1, shape[2], wspace=0.1)
+            axes = [fig.add_subplot(gridspec[0, i]) for i in range(shape[2])]
+        else:
+            axes = [ax]
+
+        def _ticks(keys):
+            step = max(int(math.ceil(len(keys) / float(HEATMAP_MAX_TICKS))), 1)
+            positions = np.arange(0, len(keys), step)
+            return positions, [data_source.map_to_name(keys[i]) for i in positions]
+
+        annotate = hints.get('annotate', True) and \
+                   shape[0] * shape[1] <= HEATMAP_ANNOTATE_MAX_CELLS
+        annotate_format = hints.get('annotate_format', "{:.3g}")
+        for i, cluster_ax in enumerate(axes):
+            image = cluster_ax.imshow(values[:, :, i].T, cmap=cmap, norm=norm,
+                                      origin="lower", aspect="auto",
+                                      interpolation="nearest")
+            cluster_ax.tick_params(labelsize=fontsize)
+
+            positions, labels = _ticks(xtick_keys)
+            cluster_ax.set_xticks(positions)
+            cluster_ax.set_xticklabels(labels, fontsize=fontsize,
+                                       rotation=-90 if max(len(l) for l in labels) > 5 else 0)
+            if data_source.get_xlabel(dataset=dataset) is not None:
+                cluster_ax.set_xlabel(data_source.get_xlabel(dataset=dataset), fontsize=fontsize)
+
+            if i == 0:
+                positions, labels = _ticks(ztick_keys)
+                cluster_ax.set_yticks(positions)
+                cluster_ax.set_yticklabels(labels, fontsize=fontsize)
+                if data_source.get_zlabel(dataset=dataset) is not None:
+                    cluster_ax.set_ylabel(data_source.get_zlabel(dataset=dataset),
+                                          fontsize=fontsize)
+            else:
+                cluster_ax.set_yticks([])
+
+            if cluster_keys is not None:
+                cluster_ax.set_title(data_source.map_to_name(cluster_keys[i]),
+                                     fontsize=fontsize)
+
+            if annotate:
+                for (x, z), value in np.ndenumerate(values[:, :, i]):
+                    if not np.isfinite(value):
+                        continue
+                    red, green, blue, _ = cmap(norm(value))
+                    cluster_ax.text(x, z, annotate_format.format(value),
+                                    ha="center", va="center", fontsize="small",
+                                    color="black" if 0.299*red + 0.587*green + 0.114*blue > 0.5
+                                          else "white")
+
+        colorbar = fig.colorbar(image, ax=axes)
+        colorbar.set_label(data_source.get_ylabel(dataset=dataset), fontsize=fontsize)
+        colorbar.ax.tick_params(labelsize=fontsize)
+
+    def _get_out_formats(self):
+        return frozenset(self.logan_config.args.dout_formats) & \
+               frozenset(AVAILABLE_FORMATS.keys())
+
+    def _merge_bars(self, ax):
+        """
+        Replaces the bar patches of each bar container of ax with patches of
+        compound paths of up to MERGE_BARS_PER_PATCH bars, which are drawn
+        the same (bars of a container share their style). The bars remain
+        referenced by their container (e.g. as legend handles).
+        """
+        for container in ax.containers:
+            if not isinstance(container, mpl_container.BarContainer):
+                continue
+
+            bars = list(container.patches)
+            for i in range(0, len(bars), MERGE_BARS_PER_PATCH):
+                chunk = bars[i:i + MERGE_BARS_PER_PATCH]
+                merged = mpl_patches.PathPatch(mpl_path.Path.make_compound_path(
+                    *[bar.get_path().transformed(bar.get_patch_transform()) for bar in chunk]))
+                merged.update_from(chunk[0])
+                for bar in chunk:
+                    # Autoscaling does not add margins beyond the bars'
+                    # bottoms.
+                    merged.sticky_edges.x.extend(bar.sticky_edges.x)
+                    merged.sticky_edges.y.extend(bar.sticky_edges.y)
+                    bar.remove()
+                ax.add_patch(merged)
+
+    def _plot_dataset(self, data_source, dataset, ax):
+        """
+        Plots dataset according to its presentation hint type into ax (or
+        the space of ax).
+        """
+        args = self.logan_config.args
+        hints = data_source.get_presentation_hints(dataset)
+        fig = ax.get_figure()
+        axes_before = frozenset(fig.axes) - frozenset([ax])
+
+        self._plot_dataset_type(data_source, dataset, ax)
+
+        data_axes = [a for a in fig.axes if a not in axes_before]
+        if hints.get('merge_bars', args.mpl_merge_bars):
+            for data_ax in data_axes:
+                self._merge_bars(data_ax)
+
+        if hints.get('rasterize', args.mpl_rasterize):
+            for data_ax in data_axes:
+                for artist in list(data_ax.patches) + list(data_ax.lines) + \
+                              list(data_ax.collections) + list(data_ax.images):
+                    artist.set_rasterized(True)
+
+    def _plot_dataset_type(self, data_source, dataset, ax):
+        presentation_hint_type = data_source.get_presentation_hints(dataset).get('type')
+        if presentation_hint_type in [None, 'bar']:
+            self._plot_bar(data_source, dataset, ax)
+        elif presentation_hint_type in SERIES_TYPES:
+            self._plot_series(data_source, dataset, ax, presentation_hint_type)
+        elif presentation_hint_type == 'heatmap':
+            self._plot_heatmap(data_source, dataset, ax)
+        else:
+            raise Exception("Can't understand presentation hint type: {}".format(presentation_hint_type))
+
+    def _plot_figure(self, data_source, name, datasets, interactive, grid=None):
+        """
+        Plots datasets into a new figure; without grid, the single dataset
+        fills the figure, otherwise the datasets are placed in a grid of
+        subplots.
+
+        @grid: Tuple of rows and columns, or None.
+        @return: The figure.
+        """
+        # Lines fix their path simplification when plotted, not when saved.
+        with logan.trace.span("plot", figure=name), \
+                matplotlib.rc_context(self._get_rc_params()):
+            if grid is None:
+                fig = self._new_figure(self._get_figsize(data_source, datasets[0])[0],
+                                       interactive)
+                self._plot_dataset(data_source, datasets[0], fig.add_subplot(111))
+                return fig
+
+            # All cells have the size of the largest dataset figure.
+            rows, cols = grid
+            figsizes = [self._get_figsize(data_source, dataset)[0] for dataset in datasets]
+            fig = self._new_figure([cols * max(figsize[0] for figsize in figsizes),
+                                    rows * max(figsize[1] for figsize in figsizes)],
+                                   interactive)
+            for i, dataset in enumerate(datasets):
+                self._plot_dataset(data_source, dataset, fig.add_subplot(rows, cols, i + 1))
+            return fig
+
+    def _plot_and_output(self, data_source, name, datasets, out_formats, grid=None,
+                         pdf_pages=None):
+        """
+        Plots datasets into a figure (see _plot_figure), and outputs it as
+        name in each of out_formats.
+
+        @pdf_pages: If not None, the figure is added as a page as well.
+        """
+        fig = self._plot_figure(data_source, name, datasets, None in out_formats, grid)
+        if pdf_pages is not None:
+            self._add_page(pdf_pages, name, fig)
+
+        # Output
+        for out_format in out_formats:
+            if out_format is None:
+                logging.info("(DOUT/matplotlib) Displaying {} ...".format(name))
+                plt.show()
+            else:
+                output_file_name = self._get_output_file_name(name, out_format)
+                logging.info("(DOUT/matplotlib) Saving {} ...".format(output_file_name))
+
+                with logan.trace.span("save", file=output_file_name), \
+                        matplotlib.rc_context(self._get_rc_params()):
+                    fig.savefig(output_file_name, bbox_inches='tight',
+                                **self._get_savefig_args())
+
+        if None in out_formats:
+            plt.close(fig)
+
+    def _get_output_file_name(self, name, out_format):
+        return os.path.join(self.logan_config.args.dout_path,
+                            name) + AVAILABLE_FORMATS[out_format]
+
+    def _get_figure_digest(self, data_source, datasets):
+        """
+        @return: Digest of the datasets of a figure and the options the
+                 figure depends on.
+        """
+        args = self.logan_config.args
+        options = ("matplotlib", OUTPUT_VERSION, matplotlib.__version__,
+                   args.dout_theme, args.dout_size, self.grid,
+                   HATCH_DENSITY, LEGEND_MAX_ROWS, args.mpl_downsample,
+                   args.mpl_rasterize, args.mpl_dpi, args.mpl_merge_bars, args.mpl_simplify)
+        digest = hashlib.sha1()
+        for dataset in datasets:
+            digest.update(logan.dataoutput.base.dataset_digest(
+                data_source, dataset, *options).encode("utf-8"))
+            if data_source.get_presentation_hints(dataset).get('type') in SERIES_TYPES:
+                self._update_series_digest(digest, data_source, dataset)
+        return digest.hexdigest()
+
+    def _update_series_digest(self, digest, data_source, dataset):
+        """
+        Updates digest with the points of data() of dataset (see
+        _get_series), without holding the series in memory: chunks of
+        points are hashed as they are yielded, and single points in chunks
+        of SERIES_DIGEST_CHUNK.
+        """
+        xs, ys = [], []
+        def _update(x, y):
+            digest.update("{}:".format(len(y)).encode("utf-8"))
+            if x.dtype != object:
+                digest.update(x.tobytes())
+            else:
+                digest.update(repr(x.tolist()).encode("utf-8"))
+            digest.update(y.tobytes())
+
+        def _flush():
+            if all(isinstance(x, numbers.Number) for x in xs):
+                x = np.asarray(xs, dtype=np.float64)
+            else:
+                x = np.empty(len(xs), dtype=object)
+                x[:] = [repr(k) for k in xs]
+            _update(x, np.asarray(ys, dtype=np.float64))
+            del xs[:]
+            del ys[:]
+
+        key = None
+        for data_point in data_source.data(dataset=dataset):
+            if data_point.dataset is not None and data_point.dataset != dataset:
+                continue
+
+            point_key = (data_point.cluster, data_point.stack)
+            if xs and (point_key != key or np.ndim(data_point.y) > 0 or
+                       len(xs) >= SERIES_DIGEST_CHUNK):
+                _flush()
+            if point_key != key:
+                digest.update(repr(point_key).encode("utf-8"))
+                key = point_key
+
+            if np.ndim(data_point.y) > 0:
+                _update(np.asarray(data_point.x), np.asarray(data_point.y, dtype=np.float64))
+            else:
+                xs.append(data_point.x)
+                ys.append(data_point.y)
+
+        if xs:
+            _flush()
+
+    def _get_stale_formats(self, name, digest, out_formats):
+        """
+        @return: Output formats of which the file of figure name is out of
+                 date. Displaying the figure (GUI) is never skipped.
+        """
+        if None in out_formats:
+            return out_formats
+
+        manifest = self.get_manifest()
+        stale_formats = []
+        for out_format in out_formats:
+            output_file_name = self._get_output_file_name(name, out_format)
+            if not manifest.unchanged(os.path.basename(output_file_name), digest,
+                                      [output_file_name]):
+                stale_formats.append(out_format)
+        return frozenset(stale_formats)
+
+    def _update_manifest(self, name, digest, out_formats):
+        manifest = self.get_manifest()
+        for out_format in out_formats:
+            if out_format is not None:
+                manifest.update(os.path.basename(self._get_output_file_name(name, out_format)),
+                                digest)
+
+    def _get_figures(self, datasets):
+        """
+        @return: List of tuples of figure name and its datasets.
+        """
+        if self.grid is None:
+            return [(dataset, [dataset]) for dataset in datasets]
+
+        per_figure = self.grid[0] * self.grid[1]
+        return [("grid-{:03d}".format(i // per_figure + 1), datasets[i:i + per_figure])
+                for i in range(0, len(datasets), per_figure)]
+
+    def _get_file_formats(self, out_formats):
+        """
+        @return: Output formats written to a file per figure; with
+                 --mpl-multipage, PDF is written to the multi-page PDF
+                 instead.
+        """
+        if self.logan_config.args.mpl_multipage is not None:
+            return out_formats - frozenset(["pdf"])
+        return out_formats
+
+    def _get_multipage_file_name(self):
+        return os.path.join(self.logan_config.args.dout_path,
+                            self.logan_config.args.mpl_multipage + ".pdf")
+
+    def _get_multipage_digest(self, page_digests):
+        """
+        @page_digests: List of tuples of figure name and digest of each page.
+        """
+        return hashlib.sha1(repr(page_digests).encode("utf-8")).hexdigest()
+
+    def _open_multipage(self):
+        output_file_name = self._get_multipage_file_name()
+        logging.info("(DOUT/matplotlib) Saving pages to {} ...".format(output_file_name))
+        return mpl_backend_pdf.PdfPages(output_file_name)
+
+    def _add_page(self, pdf_pages, name, fig):
+        with logan.trace.span("save page", figure=name), \
+                matplotlib.rc_context(self._get_rc_params()):
+            pdf_pages.savefig(fig, bbox_inches='tight', **self._get_savefig_args())
+
+    def _get_rc_params(self):
+        """
+        @return: matplotlib rcParams while saving figures.
+        """
+        if self.logan_config.args.mpl_simplify is None:
+            return {}
+        return {'path.simplify' : True,
+                'path.simplify_threshold' : self.logan_config.args.mpl_simplify}
+
+    def _get_savefig_args(self):
+        if self.logan_config.args.mpl_dpi is None:
+            return {}
+        return {'dpi' : self.logan_config.args.mpl_dpi}
+
+    def _output_figure(self, data_source, name, datasets, out_formats):
+        """
+        Outputs a figure in streaming mode.
+        """
+        digest = self._get_figure_digest(data_source, datasets)
+        file_formats = self._get_stale_formats(name, digest,
+                                               self._get_file_formats(out_formats))
+
+        pdf_pages = None
+        if self.logan_config.args.mpl_multipage is not None:
+            # Whether the multi-page PDF is unchanged is only known once all
+            # pages are known, so it is always written in streaming mode.
+            if self._pdf_pages is None:
+                self._pdf_pages = self._open_multipage()
+            pdf_pages = self._pdf_pages
+            self._page_digests.append((name, digest))
+
+        if file_formats:
+            # The figure is plotted once for its files and its page.
+            self._plot_and_output(data_source, name, datasets, file_formats, self.grid,
+                                  pdf_pages)
+            self._update_manifest(name, digest, file_formats)
+        else:
+            logging.info("(DOUT/matplotlib) Unchanged {}".format(name))
+            if pdf_pages is not None:
+                self._add_page(pdf_pages, name, self._plot_figure(data_source, name, datasets,
+                                                                  False, self.grid))
+
+    def _render_parallel(self, data_source, figures):
+        """
+        Renders figures in forked worker processes (-j). If there are fewer
+        figures than jobs, the output formats of each figure are rendered
+        concurrently as well.
+
+        @figures: List of tuples of figure name, its datasets and output
+                  formats.
+
+        @return: Success or not, or None if rendering in parallel is not
+                 possible.
+        """
+        global _render_state
+
+        jobs = self.logan_config.args.jobs
+        fork_context = get_fork_context()
+        if jobs <= 1 or any(None in out_formats for _, _, out_formats in figures) or \
+                fork_context is None or fork_context.current_process().daemon:
+            # Daemonic processes (e.g. with --dout-concurrent) cannot fork
+            # workers.
+            return None
+
+        if len(figures) < jobs:
+            tasks = [(name, datasets, [out_format]) for name, datasets, out_formats in figures
+                     for out_format in sorted(out_formats)]
+        else:
+            tasks = [(name, datasets, sorted(out_formats))
+                     for name, datasets, out_formats in figures]
+        if len(tasks) <= 1:
+            return None
+
+        jobs = min(jobs, len(tasks))
+        logging.info("(DOUT/matplotlib) Rendering {} figures in {} processes ...".format(
+            len(figures), jobs))
+
+        _render_state = (self, data_source)
+        pool = fork_context.Pool(processes=jobs)
+        try:
+            pending = [pool.apply_async(_render, (task,)) for task in tasks]
+            pool.close()
+
+            success = True
+            for task, result in zip(tasks, pending):
+                task_success, events = result.get()
+                logan.trace.add_events(events)
+                if not task_success:
+                    logging.error("(DOUT/matplotlib) Rendering {} failed!".format(task[0]))
+                    success = False
+        finally:
+            pool.terminate()
+            pool.join()
+            _render_state = None
+
+        return success
+
+    def supports_streaming(self):
+        return not self.logan_config.args.mpl_interactive
+
+    def generate_dataset(self, data_source, dataset):
+        out_formats = self._get_out_formats()
+        if out_formats:
+            if not os.path.exists(self.logan_config.args.dout_path):
+                os.makedirs(os.path.abspath(self.logan_config.args.dout_path))
+
+            if self.grid is None:
+                self._output_figure(data_source, dataset, [dataset], out_formats)
+            else:
+                # Output once the grid is complete
+                self._pending_datasets.append(dataset)
+                if len(self._pending_datasets) == self.grid[0] * self.grid[1]:
+                    self._figure_count += 1
+                    self._output_figure(data_source, "grid-{:03d}".format(self._figure_count),
+                                        self._pending_datasets, out_formats)
+                    self._pending_datasets = []
+
+        return True
+
+    def generate_finish(self, data_source):
+        out_formats = self._get_out_formats()
+        if self._pending_datasets:
+            self._figure_count += 1
+            self._output_figure(data_source, "grid-{:03d}".format(self._figure_count),
+                                self._pending_datasets, out_formats)
+            self._pending_datasets = []
+
+        if self._pdf_pages is not None:
+            self._pdf_pages.close()
+            self._pdf_pages = None
+            self.get_manifest().update(
+                os.path.basename(self._get_multipage_file_name()),
+                self._get_multipage_digest(self._page_digests))
+            self._page_digests = []
+
+        self.get_manifest().save()
+        return True
+
     def generate(self, data_source):
         """
         Interface function to be called by the main program. This should
@@ -292,8 +1264,7 @@ class DataOutput(logan.dataoutput.base.DataOutput):
         @rtype: boolean
         @return: Success or not.
         """
-        out_formats = frozenset(self.logan_config.args.dout_formats) & \
-                      frozenset(AVAILABLE_FORMATS.keys())
+        out_formats = self._get_out_formats()
 
         if not os.path.exists(self.logan_config.args.dout_path):
             os.makedirs(os.path.abspath(self.logan_config.args.dout_path))
@@ -306,55 +1277,97 @@ class DataOutput(logan.dataoutput.base.DataOutput):
         #matplotlib.rc('font', **{'sans-serif' : ["FreeSans", "DejaVu Sans"],
         #                         'family' : 'sans-serif'})
 
-        def plot_and_output(dataset):
-            presentation_hint_type = data_source.get_presentation_hints(dataset).get('type')
-            if presentation_hint_type in [None, 'bar']:
-                self._plot_bar(data_source, dataset)
-            else:
-                raise Exception("Can't understand presentation hint type: {}".format(presentation_hint_type))
-
-            # Output
-            for out_format in out_formats:
-                if out_format is None:
-                    logging.info("(DOUT/matplotlib) Displaying {} ...".format(dataset))
-                    plt.show()
-                else:
-                    output_file_prefix = os.path.join(self.logan_config.args.dout_path,
-                                                      dataset)
-                    output_file_name = output_file_prefix + AVAILABLE_FORMATS[out_format]
-                    logging.info("(DOUT/matplotlib) Saving {} ...".format(output_file_name))
-
-                    plt.savefig(output_file_name, bbox_inches='tight')
-            plt.close()
-
         if self.logan_config.args.mpl_interactive:
             options = dict(enumerate(data_source.get_dataset_keys()))
 
-            while True:
-                print("Choose from available options (space-separated):")
-                for key in options:
-                    print("    {}) {}".format(str(key).rjust(2), options[key]))
-                print("     q) Exit")
+            cache = None
+            if self.logan_config.args.mpl_cache_size > 0:
+                cache = PlotDataCache(data_source, self.logan_config.args.mpl_cache_size)
+                cache.prefetch(options[key] for key in sorted(options))
 
-                choice = input("Selection: ").strip().lower().split()
-                if "all" in choice:
-                    choice = options
-                for c in choice:
-                    if c == "q":
-                        return True
+            try:
+                while True:
+                    print("Choose from available options (space-separated):")
+                    for key in options:
+                        print("    {}) {}".format(str(key).rjust(2), options[key]))
+                    print("     q) Exit")
 
-                    try:
-                        options[int(c)]
-                    except:
-                        print("Invalid selection!")
-                        continue
+                    choice = input("Selection: ").strip().lower().split()
+                    if "all" in choice:
+                        choice = options
+                    for c in choice:
+                        if c == "q":
+                            return True
 
-                    plot_and_output(options[int(c)])
+                        try:
+                            options[int(c)]
+                        except:
+                            print("Invalid selection!")
+                            continue
 
-                print_blank()
+                        dataset = options[int(c)]
+                        if cache is not None:
+                            snapshot = cache.get(dataset)
+                            # Datasets following the selection are likely
+                            # selected next.
+                            cache.prefetch(options[(int(c) + i) % len(options)]
+                                           for i in range(1, len(options)))
+                            self._plot_and_output(snapshot, dataset, [dataset], out_formats)
+                        else:
+                            self._plot_and_output(data_source, dataset, [dataset],
+                                                  out_formats)
+
+                    print_blank()
+            finally:
+                if cache is not None:
+                    cache.stop()
         else:
-            for dataset in data_source.get_dataset_keys():
-                plot_and_output(dataset)
+            figures = self._get_figures(data_source.get_dataset_keys())
+            digests = dict((name, self._get_figure_digest(data_source, datasets))
+                           for name, datasets in figures)
+            manifest = self.get_manifest()
 
-        return True
+            file_formats = self._get_file_formats(out_formats)
+            if file_formats:
+                stale_figures = [(name, datasets,
+                                  self._get_stale_formats(name, digests[name], file_formats))
+                                 for name, datasets in figures]
+                stale_figures = [figure for figure in stale_figures if figure[2]]
+                if len(stale_figures) < len(figures):
+                    logging.info("(DOUT/matplotlib) Skipping {} unchanged figures.".format(
+                        len(figures) - len(stale_figures)))
 
+                success = self._render_parallel(data_source, stale_figures)
+                if success is None:
+                    for name, datasets, stale_formats in stale_figures:
+                        self._plot_and_output(data_source, name, datasets, stale_formats,
+                                              self.grid)
+                elif not success:
+                    return False
+
+                for name, _, stale_formats in stale_figures:
+                    self._update_manifest(name, digests[name], stale_formats)
+                manifest.save()
+
+            if self.logan_config.args.mpl_multipage is not None:
+                output_file_name = self._get_multipage_file_name()
+                digest = self._get_multipage_digest([(name, digests[name])
+                                                     for name, _ in figures])
+                if manifest.unchanged(os.path.basename(output_file_name), digest,
+                                      [output_file_name]):
+                    logging.info("(DOUT/matplotlib) Unchanged {}".format(output_file_name))
+                else:
+                    # Pages share the fonts and other resources of one PDF file.
+                    pdf_pages = self._open_multipage()
+                    try:
+                        for name, datasets in figures:
+                            self._add_page(pdf_pages, name,
+                                           self._plot_figure(data_source, name, datasets,
+                                                             False, self.grid))
+                    finally:
+                        pdf_pages.close()
+
+                    manifest.update(os.path.basename(output_file_name), digest)
+                    manifest.save()
+
+        return True
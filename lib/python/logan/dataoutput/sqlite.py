@@ -0,0 +1,254 @@
+"""
+Dataoutput for SQLite, to query results across many logan runs.
+
+Each run of logan appends a row to the runs table (with --tag, --message,
+the datasource and its paths), a row per dataset to the datasets table, and a
+row per data point to the points table, all in a single transaction. With
+--follow, the run keeps its row, and the rows of changed datasets are replaced
+on each update. Points are indexed by dataset, x and cluster, e.g.:
+
+    SELECT runs.tag, points.x, points.y FROM points
+        JOIN runs ON runs.id = points.run_id
+        WHERE points.dataset = 'throughput' AND points.cluster = 'b0';
+
+Keys which are not numbers or strings are stored as JSON.
+"""
+
+import os
+import json
+import logging
+import sqlite3
+import time
+import logan.dataoutput.base
+import logan.trace
+from logan.dataoutput.base import json_key
+
+DEFAULT_DATABASE = "logan.sqlite"
+
+# Stored as user_version of the database; change if the schema changes.
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    created TEXT,
+    tag TEXT,
+    message TEXT,
+    datasource TEXT,
+    paths TEXT,
+    argv TEXT
+);
+CREATE TABLE IF NOT EXISTS datasets (
+    run_id INTEGER REFERENCES runs(id),
+    dataset TEXT,
+    description TEXT,
+    xlabel TEXT,
+    ylabel TEXT,
+    zlabel TEXT,
+    hints TEXT,
+    PRIMARY KEY (run_id, dataset)
+);
+CREATE TABLE IF NOT EXISTS points (
+    run_id INTEGER REFERENCES runs(id),
+    dataset TEXT,
+    x,
+    x_name TEXT,
+    z,
+    z_name TEXT,
+    cluster,
+    cluster_name TEXT,
+    stack,
+    stack_name TEXT,
+    y REAL,
+    y_err_lo REAL,
+    y_err_hi REAL
+);
+CREATE INDEX IF NOT EXISTS points_dataset_x_cluster ON points (dataset, x, cluster);
+CREATE INDEX IF NOT EXISTS points_run ON points (run_id);
+CREATE INDEX IF NOT EXISTS runs_tag ON runs (tag);
+"""
+
+def register_arguments(logan_config):
+    """
+    Interface function.
+    When module is loaded, this function is called by the main module,
+    allowing this module to register its own command-line arguments.
+
+    @type logan_config: LoganConfig
+    """
+    logan_config.add_argument("--sqlite-db", metavar="PATH", type=str,
+            dest="sqlite_db", default=None,
+            help="Database to append to. [Default:OUTPATH/{}]".format(DEFAULT_DATABASE))
+
+def get_description():
+    """
+    Interface function. Used to query description.
+    """
+    return ("Dataoutput for SQLite; appends to a database across runs.", None)
+
+def _sql_key(key):
+    """
+    @return: key as SQLite value; keys which are not numbers or strings are
+             stored as JSON.
+    """
+    if key is None or isinstance(key, (int, float, str)):
+        return key
+    return json.dumps(json_key(key))
+
+class DataOutput(logan.dataoutput.base.DataOutput):
+    def __init__(self, logan_config):
+        """
+        @type logan_config: LoganConfig
+        """
+        super(DataOutput, self).__init__(logan_config)
+
+        # Connection of the open transaction.
+        self._connection = None
+
+        # Run of this invocation, kept across updates with --follow, and
+        # whether its row was not committed yet.
+        self._run_id = None
+        self._new_run = False
+
+        # Datasets inserted for the run.
+        self._inserted_datasets = set()
+
+    def _get_database_path(self):
+        if self.logan_config.args.sqlite_db is not None:
+            return self.logan_config.args.sqlite_db
+        return os.path.join(self.logan_config.args.dout_path, DEFAULT_DATABASE)
+
+    def _begin(self):
+        """
+        Opens the database and begins a transaction; the first transaction
+        adds the row of this run.
+        """
+        args = self.logan_config.args
+        database_path = self._get_database_path()
+        database_dir = os.path.dirname(os.path.abspath(database_path))
+        if not os.path.exists(database_dir):
+            os.makedirs(database_dir)
+
+        logging.info("(DOUT/sqlite) Appending to {} ...".format(database_path))
+        # Transactions are managed explicitly.
+        self._connection = sqlite3.connect(database_path, timeout=60,
+                                           isolation_level=None)
+        cursor = self._connection.cursor()
+        user_version = cursor.execute("PRAGMA user_version").fetchone()[0]
+        if user_version not in (0, SCHEMA_VERSION):
+            self._connection.close()
+            self._connection = None
+            raise Exception("Unsupported schema version {} of {}".format(
+                user_version, database_path))
+
+        cursor.execute("BEGIN IMMEDIATE")
+        for statement in SCHEMA.split(";"):
+            if statement.strip():
+                cursor.execute(statement)
+        cursor.execute("PRAGMA user_version = {}".format(SCHEMA_VERSION))
+
+        if self._run_id is not None:
+            return
+
+        cursor.execute("INSERT INTO runs (created, tag, message, datasource, paths, argv) "
+                       "VALUES (?, ?, ?, ?, ?, ?)",
+                       (time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                        args.tag, args.message, args.datasource,
+                        json.dumps([os.path.abspath(path) for path in args.dsrc_paths]),
+                        json.dumps(self.logan_config.get_argv())))
+        self._run_id = cursor.lastrowid
+        self._new_run = True
+
+    def _insert_dataset(self, data_source, dataset):
+        cursor = self._connection.cursor()
+        if dataset in self._inserted_datasets:
+            # Updated with --follow: replace the rows of this run.
+            for table in ("points", "datasets"):
+                cursor.execute("DELETE FROM {} WHERE run_id = ? AND dataset = ?".format(table),
+                               (self._run_id, dataset))
+        self._inserted_datasets.add(dataset)
+
+        cursor.execute("INSERT INTO datasets VALUES (?, ?, ?, ?, ?, ?, ?)",
+                       (self._run_id, dataset,
+                        data_source.get_description(dataset=dataset),
+                        data_source.get_xlabel(dataset=dataset),
+                        data_source.get_ylabel(dataset=dataset),
+                        data_source.get_zlabel(dataset=dataset),
+                        json.dumps(dict((k, json_key(v)) for k, v in
+                                        data_source.get_presentation_hints(dataset).items()),
+                                   sort_keys=True)))
+
+        has_z = data_source.get_ztick_keys(dataset=dataset) is not None
+        names = {}
+        def _key_and_name(key):
+            if key not in names:
+                names[key] = (_sql_key(key), data_source.map_to_name(key)) \
+                             if key is not None else (None, None)
+            return names[key]
+
+        run_id = self._run_id
+        cursor.executemany("INSERT INTO points VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                ((run_id, dataset) + _key_and_name(x) +
+                 (_key_and_name(z) if has_z else (None, None)) +
+                 _key_and_name(cluster) + _key_and_name(stack) +
+                 (data_point.y, data_point.y_err[0], data_point.y_err[1])
+                 for x, z, cluster, stack, data_point in data_source.query_grid(dataset)))
+
+    def _commit(self):
+        try:
+            self._connection.execute("COMMIT")
+            self._new_run = False
+        finally:
+            self._connection.close()
+            self._connection = None
+
+    def _rollback(self):
+        try:
+            self._connection.execute("ROLLBACK")
+            if self._new_run:
+                self._run_id = None
+                self._new_run = False
+                self._inserted_datasets.clear()
+        finally:
+            self._connection.close()
+            self._connection = None
+
+    def supports_streaming(self):
+        return True
+
+    def generate_dataset(self, data_source, dataset):
+        if self._connection is None:
+            self._begin()
+
+        logging.debug("(DOUT/sqlite) Inserting {} ...".format(dataset))
+        try:
+            with logan.trace.span("insert", dataset=dataset):
+                self._insert_dataset(data_source, dataset)
+        except Exception:
+            self._rollback()
+            raise
+
+        return True
+
+    def generate_finish(self, data_source):
+        if self._connection is not None:
+            self._commit()
+        return True
+
+    def generate(self, data_source):
+        """
+        Interface function to be called by the main program. This should
+        trigger the generation of the output.
+
+        @type data_source: DataSource
+        @data_source: Any datasource DataSource which defines the basic interface.
+        @rtype: boolean
+        @return: Success or not.
+        """
+        for dataset in data_source.get_dataset_keys():
+            if not self.generate_dataset(data_source, dataset):
+                if self._connection is not None:
+                    self._rollback()
+                return False
+
+        return self.generate_finish(data_source)
@@ -0,0 +1,344 @@
+"""
+Dataoutput for tables, and the table engine of the csv and latex_table
+dataoutputs.
+
+A Table holds the values of a dataset in the wide layout -- a row per x-tick
+and a column per cluster, each cell with a value per stack -- formatted once,
+together with the names of the rows, columns and stacks. It is built in a
+single pass over query_grid, and rendered by the writer of each format:
+
+    table = Table(data_source, dataset)
+    for table_format in ["csv", "tex", "md", "html"]:
+        with open_table(path + FORMATS[table_format][0], table_format) as f:
+            FORMATS[table_format][1](table, f)
+
+The dataoutput writes each dataset to <dataset>.table.<ext> in all formats
+given with -f (all formats if none), from the same Table; the names do not
+collide with the files of the csv and latex_table dataoutputs.
+"""
+
+from __future__ import absolute_import
+
+import os
+import csv
+import logging
+import collections
+import logan.dataoutput.base
+import logan.trace
+from logan.compat import *
+
+# Part of the digest of each output; change if the output of the same data
+# changes, so that existing outputs are regenerated.
+OUTPUT_VERSION = 1
+
+# Buffer size of output files.
+WRITE_BUFFER_SIZE = 1 << 20
+
+# Inserted before the extension of the files of the dataoutput.
+FILE_SUFFIX = ".table"
+
+# Lines joined per write.
+WRITE_CHUNK_LINES = 1024
+
+def register_arguments(logan_config):
+    """
+    Interface function.
+    When module is loaded, this function is called by the main module,
+    allowing this module to register its own command-line arguments.
+
+    @type logan_config: LoganConfig
+    """
+
+def get_description():
+    """
+    Interface function. Used to query description.
+    """
+    return ("Dataoutput for tables. [Formats: csv, tex, md, html]",
+"""Writes a table <dataset>.table.<ext> per dataset with a row per x-tick and
+a column per cluster, in each format given with -f (all formats if none); all
+formats are rendered from a single pass over the data.""")
+
+class Table(object):
+    """
+    Values of a dataset in the wide layout, formatted once for all writers.
+    Datasets with z data only have the values of their first z-tick in the
+    table (see omits_z).
+    """
+    def __init__(self, data_source, dataset, value_format="{:.3f}"):
+        self.dataset = dataset
+        self.xlabel = data_source.get_xlabel(dataset=dataset)
+        self.ylabel = data_source.get_ylabel(dataset=dataset)
+
+        cluster_keys = data_source.get_cluster_keys(dataset=dataset)
+        stack_keys = data_source.get_stack_keys(dataset=dataset)
+        ztick_keys = data_source.get_ztick_keys(dataset=dataset)
+
+        first_z = 0
+        self.omits_z = ztick_keys is not None
+        if ztick_keys is not None:
+            first_z = ztick_keys[0] if ztick_keys else None
+
+        if cluster_keys is not None:
+            self.column_names = [data_source.map_to_name(c) for c in cluster_keys]
+        else:
+            self.column_names = [self.ylabel]
+        self.stack_names = [data_source.map_to_name(s) for s in stack_keys] \
+                           if stack_keys is not None else None
+
+        # rows holds a list of cells per row, each a list of the formatted
+        # values of its stacks; sums the formatted sum of each cell if the
+        # dataset is stacked.
+        self.row_names = []
+        self.rows = []
+        self.sums = [] if self.stack_names is not None else None
+
+        # The grid is ordered by x-tick, so a row is complete after the
+        # stacks of all clusters.
+        stack_count = len(self.stack_names) if self.stack_names is not None else 1
+        row_size = len(self.column_names) * stack_count
+        value_format = value_format.format
+        ys = []
+        for x, z, _, _, data_point in data_source.query_grid(dataset):
+            if z != first_z:
+                continue
+
+            ys.append(data_point.y)
+            if len(ys) < row_size:
+                continue
+
+            self.row_names.append(data_source.map_to_name(x))
+            if stack_count == 1:
+                self.rows.append([[value_format(y)] for y in ys])
+            else:
+                self.rows.append([[value_format(y) for y in ys[i:i + stack_count]]
+                                  for i in range(0, row_size, stack_count)])
+            if self.sums is not None:
+                self.sums.append([value_format(sum(ys[i:i + stack_count], 0.0))
+                                  for i in range(0, row_size, stack_count)])
+            ys = []
+
+def _write_lines(f, lines):
+    """
+    Writes the strings of the iterable lines, joined in chunks of
+    WRITE_CHUNK_LINES.
+    """
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) == WRITE_CHUNK_LINES:
+            f.write("".join(chunk))
+            chunk = []
+    if chunk:
+        f.write("".join(chunk))
+
+def write_csv(table, f):
+    """
+    Writes table as CSV (separated by ';'); stacked cells are written as
+    e.g. 1.000[a]+2.000[b]=3.000.
+
+    @f: File opened with open_table.
+    """
+    writer = csv.writer(f, delimiter=";", lineterminator="\n")
+    writer.writerow([table.xlabel if table.xlabel is not None else ""] + table.column_names)
+
+    if table.stack_names is None:
+        writer.writerows([name] + [cell[0] for cell in row]
+                         for name, row in zip(table.row_names, table.rows))
+        return
+
+    suffixes = ["[{}]".format(name) for name in table.stack_names]
+    writer.writerows([name] + ["+".join(y + suffix for y, suffix in zip(cell, suffixes)) +
+                               "=" + y_sum
+                               for cell, y_sum in zip(row, sums)]
+                     for name, row, sums in zip(table.row_names, table.rows, table.sums))
+
+def _sanitize_latex(s):
+    return s.replace("_", "\\_").replace("&", "\\&").replace("%", "\\%")
+
+def write_latex(table, f):
+    """
+    Writes table as a LaTeX table environment, captioned with the y-label.
+    """
+    def _lines():
+        yield """\\begin{{table}}
+\\caption{{{}}}
+\\begin{{tabular}}{{{}}}
+\\hline
+""".format(_sanitize_latex(table.ylabel), ("|l"*(len(table.column_names)+1))+"|")
+
+        yield (table.xlabel if table.xlabel is not None else "") + " &" + \
+              " & ".join(_sanitize_latex(name) for name in table.column_names) + \
+              "\\\\\\hline\n"
+
+        if table.stack_names is None:
+            for name, row in zip(table.row_names, table.rows):
+                yield _sanitize_latex(name) + \
+                      "".join(" & \\(" + cell[0] + "\\)" for cell in row) + \
+                      "\\\\\\hline\n"
+        else:
+            suffixes = ["_\\text{{{}}}".format(_sanitize_latex(name))
+                        for name in table.stack_names]
+            for name, row, sums in zip(table.row_names, table.rows, table.sums):
+                yield _sanitize_latex(name) + \
+                      "".join(" & \\(" + "+".join(y + suffix for y, suffix in zip(cell, suffixes)) +
+                              " = " + y_sum + "\\)"
+                              for cell, y_sum in zip(row, sums)) + \
+                      "\\\\\\hline\n"
+
+        yield """\\end{tabular}
+\\end{table}"""
+
+    _write_lines(f, _lines())
+
+def _sanitize_markdown(s):
+    return s.replace("\\", "\\\\").replace("|", "\\|").replace("\n", " ")
+
+def _stacked_cell(cell, y_sum, stack_names):
+    return " + ".join("{} ({})".format(y, name) for y, name in zip(cell, stack_names)) + \
+           " = " + y_sum
+
+def write_markdown(table, f):
+    """
+    Writes table as a Markdown (pipe) table, with the y-label as caption.
+    """
+    def _lines():
+        yield "| " + " | ".join(_sanitize_markdown(name) for name in
+                                [table.xlabel or ""] + table.column_names) + " |\n"
+        yield "|---" + "|--:" * len(table.column_names) + "|\n"
+
+        if table.stack_names is None:
+            for name, row in zip(table.row_names, table.rows):
+                yield "| " + _sanitize_markdown(name) + " | " + \
+                      " | ".join(cell[0] for cell in row) + " |\n"
+        else:
+            stack_names = [_sanitize_markdown(name) for name in table.stack_names]
+            for name, row, sums in zip(table.row_names, table.rows, table.sums):
+                yield "| " + _sanitize_markdown(name) + " | " + \
+                      " | ".join(_stacked_cell(cell, y_sum, stack_names)
+                                 for cell, y_sum in zip(row, sums)) + " |\n"
+
+        yield "\nTable: {}\n".format(_sanitize_markdown(table.ylabel))
+
+    _write_lines(f, _lines())
+
+def _sanitize_html(s):
+    return s.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;") \
+            .replace("\"", "&quot;")
+
+def write_html(table, f):
+    """
+    Writes table as an HTML table element, with the y-label as caption.
+    """
+    def _lines():
+        yield "<table>\n<caption>{}</caption>\n".format(_sanitize_html(table.ylabel))
+        yield "<thead>\n<tr><th>" + _sanitize_html(table.xlabel or "") + "</th>" + \
+              "".join("<th>" + _sanitize_html(name) + "</th>" for name in table.column_names) + \
+              "</tr>\n</thead>\n<tbody>\n"
+
+        if table.stack_names is None:
+            for name, row in zip(table.row_names, table.rows):
+                yield "<tr><th>" + _sanitize_html(name) + "</th>" + \
+                      "".join("<td>" + cell[0] + "</td>" for cell in row) + "</tr>\n"
+        else:
+            stack_names = [_sanitize_html(name) for name in table.stack_names]
+            for name, row, sums in zip(table.row_names, table.rows, table.sums):
+                yield "<tr><th>" + _sanitize_html(name) + "</th>" + \
+                      "".join("<td>" + _stacked_cell(cell, y_sum, stack_names) + "</td>"
+                              for cell, y_sum in zip(row, sums)) + "</tr>\n"
+
+        yield "</tbody>\n</table>\n"
+
+    _write_lines(f, _lines())
+
+# Maps formats to the extension of their files and their writer.
+FORMATS = collections.OrderedDict([
+    ("csv",  (".csv", write_csv)),
+    ("tex",  (".tex", write_latex)),
+    ("md",   (".md", write_markdown)),
+    ("html", (".html", write_html))
+])
+
+def open_table(path, table_format):
+    """
+    @return: File opened for writing a table of table_format.
+    """
+    if table_format == "csv":
+        return open_csv(path, WRITE_BUFFER_SIZE)
+    return open(path, "w", WRITE_BUFFER_SIZE)
+
+class DataOutput(logan.dataoutput.base.DataOutput):
+    def __init__(self, logan_config):
+        """
+        @type logan_config: LoganConfig
+        """
+        super(DataOutput, self).__init__(logan_config)
+
+    def _get_formats(self):
+        dout_formats = self.logan_config.args.dout_formats
+        if dout_formats == [None]:
+            return list(FORMATS)
+        return [table_format for table_format in FORMATS if table_format in dout_formats]
+
+    def supports_streaming(self):
+        return True
+
+    def generate_dataset(self, data_source, dataset):
+        if not os.path.exists(self.logan_config.args.dout_path):
+            os.makedirs(os.path.abspath(self.logan_config.args.dout_path))
+
+        manifest = self.get_manifest()
+        digest = logan.dataoutput.base.dataset_digest(data_source, dataset,
+                                                      "table", OUTPUT_VERSION)
+        stale_formats = []
+        for table_format in self._get_formats():
+            output_file_name = os.path.join(self.logan_config.args.dout_path,
+                                            dataset) + FILE_SUFFIX + FORMATS[table_format][0]
+            if manifest.unchanged(os.path.basename(output_file_name), digest,
+                                  [output_file_name]):
+                logging.info("(DOUT/table) Unchanged {}".format(output_file_name))
+            else:
+                stale_formats.append((table_format, output_file_name))
+
+        if not stale_formats:
+            return True
+
+        with logan.trace.span("build table", dataset=dataset):
+            table = Table(data_source, dataset)
+        if table.omits_z:
+            logging.warning("(DOUT/table) Omitting z data of {}".format(dataset))
+
+        for table_format, output_file_name in stale_formats:
+            logging.info("(DOUT/table) Writing to {} ...".format(output_file_name))
+            with logan.trace.span("write table", dataset=dataset, format=table_format), \
+                    open_table(output_file_name, table_format) as output_file:
+                FORMATS[table_format][1](table, output_file)
+            manifest.update(os.path.basename(output_file_name), digest)
+
+        return True
+
+    def generate_finish(self, data_source):
+        self.get_manifest().save()
+        return True
+
+    def generate(self, data_source):
+        """
+        Interface function to be called by the main program. This should
+        trigger the generation of the output.
+
+        @type data_source: DataSource
+        @data_source: Any datasource DataSource which defines the basic interface.
+        @rtype: boolean
+        @return: Success or not.
+        """
+        if not self._get_formats():
+            logging.warn("(DOUT/table) no valid output formats specified, skipping.")
+            return True
+
+        try:
+            for dataset in data_source.get_dataset_keys():
+                if not self.generate_dataset(data_source, dataset):
+                    return False
+        finally:
+            self.get_manifest().save()
+
+        return True
@@ -95,13 +95,127 @@ def cfopen(fileprefix, compress=None):
 
     return result
 
-RegexInfo = collections.namedtuple("RegexInfo", ["src", "re", "gid", "empty_def"])
+RegexInfo = collections.namedtuple("RegexInfo", ["src", "re", "gid", "empty_def", "container"])
 
-def regexinfo(src, re, gid=1, empty_def=None):
-    return RegexInfo(src, re, gid, empty_def)
+def regexinfo(src, re, gid=1, empty_def=None, container=None):
+    """
+    @container: Optional factory for the object collecting the captures of
+                this regex, instead of a list; it must provide append and
+                __len__ (e.g. statistics.KLLSketch, so that captures are
+                summarized while streaming rather than kept in memory).
+    """
+    return RegexInfo(src, re, gid, empty_def, container)
+
+class ExtractState(object):
+    """
+    State of extract_data_from_files, kept across calls to extract only data
+    appended to growing files since the previous call (see --follow).
+
+    Keeps the captures of all regexes, the byte offset and marker counts per
+    datafile, and the computed results. After each call, changed contains the
+    keys of datasets which were recomputed.
+
+    An incomplete last line of a datafile (still being written) is extracted
+    like in a call without state, but its captures are not kept: the offset
+    stays at the start of the line, which is read again by the next call.
+    Captures collected into a container other than a list (see regexinfo)
+    cannot be taken back, so incomplete lines are not extracted for them.
+
+    Changed datasets are recomputed from all their captures, not only from
+    the new ones: a call costs reading the appended data plus computing the
+    changed datasets over all data extracted so far.
+
+    If a datafile was truncated (e.g. the offset is beyond its new size) or
+    replaced (e.g. rotated) since the previous call, the state is reset and
+    all datafiles are read from the start: the captures of the old contents
+    cannot be told apart from those of the other datafiles.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.regex_data = {}
+        self.compiled_regexes = {}
+        self.markers = collections.defaultdict(set)
+        self.files = {}
+        self.result = {}
+        self.changed = set()
+        # Captures of the incomplete last lines of the previous call.
+        self.partial_captures = {}
+
+    def file_unchanged(self, name, path):
+        """
+        @name: Name of the datafile, as returned by cfopen.
+        @path: Path of the file (including a compression suffix).
+        @return: True if the datafile was read before and path is still the
+                 same file with the same size, i.e. reading it again would
+                 not find new lines; it need not be opened then.
+        """
+        file_state = self.files.get(name)
+        if file_state is None or file_state['stat'] is None:
+            return False
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        return file_state['stat'] == (stat.st_dev, stat.st_ino, stat.st_size)
+
+def _file_stat(f):
+    """
+    @return: Tuple of device, inode and size of the file underlying f; None
+             if f has no file descriptor.
+    """
+    try:
+        stat = os.fstat(f.fileno())
+    except (AttributeError, IOError, OSError, ValueError):
+        return None
+    return (stat.st_dev, stat.st_ino, stat.st_size)
+
+def _file_restarted(file_state, stat):
+    """
+    @return: True if the file was replaced or truncated since file_state was
+             last read. Sizes are those of the file on disk, so that this
+             also works for compressed files, whose offsets are not
+             comparable to their size.
+    """
+    old_stat = file_state['stat']
+    if old_stat is None or stat is None:
+        return False
+    return old_stat[:2] != stat[:2] or stat[2] < old_stat[2]
+
+def _complete_lines(f, file_state, partial_lines):
+    """
+    Yields the complete lines of f, and advances the offset in file_state
+    accordingly; an incomplete last line is appended to partial_lines, and
+    read again by the next call.
+    """
+    while True:
+        line = f.readline()
+        if not line.endswith(b"\n"):
+            if line:
+                partial_lines.append(line)
+            break
+        file_state['offset'] += len(line)
+        yield line
+
+def _select_dataset_keys(datasets, select):
+    """
+    @return: Set of keys of datasets for which select returns True, and of
+             the datasets these depend on (transitively).
+    """
+    selected = set()
+    pending = [dataset_key for dataset_key in datasets if select(dataset_key)]
+    while pending:
+        dataset_key = pending.pop()
+        if dataset_key in selected or dataset_key not in datasets:
+            continue
+        selected.add(dataset_key)
+        pending.extend(datasets[dataset_key].get('depends', []))
+    return selected
 
 def extract_data_from_files(datafiles, datasets, filter_by=None,
-                            error_set=None, regex_fn_args=[]):
+                            error_set=None, regex_fn_args=[], state=None,
+                            select=None):
     """
     Extract data from a file-like object.
 
@@ -113,6 +227,15 @@ def extract_data_from_files(datafiles, datasets, filter_by=None,
                       'compute' : compute_function } }
                 Where compute_function is passed a list of lists mapping to
                 'regex1', 'regex2', etc.
+    @state: Optional ExtractState of previous calls with the same datasets;
+            datafiles are then only read from where the previous call
+            stopped, and only datasets with new captures are recomputed.
+    @select: Optional predicate on dataset keys (e.g.
+             DataSource.dataset_selected); only the regexes of selected
+             datasets are compiled and matched, and only their compute
+             functions are run. Compute functions using the results of other
+             datasets (via R) must list these in the dataset's 'depends'
+             entry, so that they are selected as well.
     @return: dict mapping dataset keys to data-values
     """
     def check_filter(dataset):
@@ -136,58 +259,132 @@ def extract_data_from_files(datafiles, datasets, filter_by=None,
 
             yield regex
 
-    result = {}
+    if select is not None:
+        selected_keys = _select_dataset_keys(datasets, select)
+        datasets = collections.OrderedDict((dataset_key, datasets[dataset_key])
+                                           for dataset_key in datasets
+                                           if dataset_key in selected_keys)
 
     # Container for all data, which is then later used to compute final data
     # as defined in datasets.
-    regex_data = {}
-    compiled_regexes = {}
-    markers = collections.defaultdict(set)
+    if state is None:
+        result = {}
+        regex_data = {}
+        compiled_regexes = {}
+        markers = collections.defaultdict(set)
+    else:
+        file_stats = dict((datafile['name'], _file_stat(datafile['f'])) for datafile in datafiles)
+        restarted = [name for name, stat in file_stats.items()
+                     if name in state.files and _file_restarted(state.files[name], stat)]
+        if restarted:
+            logging.info("Datafiles truncated or replaced, reading again from the start: {}".format(
+                ", ".join(sorted(restarted))))
+            state.reset()
+
+        result = state.result
+        regex_data = state.regex_data
+        compiled_regexes = state.compiled_regexes
+        markers = state.markers
+
     for dataset_key in datasets:
         if 'regexes' not in datasets[dataset_key] or \
            not check_filter(datasets[dataset_key]): continue
 
         for regex in regex_generator(datasets[dataset_key]['regexes']):
             if regex not in regex_data:
-                regex_data[regex] = []
+                regex_data[regex] = [] if regex.container is None else regex.container()
                 compiled_regexes[regex.re] = re.compile(regex.re)
                 if regex.src is not None and not isinstance(regex.src, str):
                     markers[regex.src[0]].add(regex.src[1])
 
-    # Read all requested data into memory
-    for datafile in datafiles:
-        # Set up markers
-        marker_count = collections.defaultdict(lambda: 0)
-        file_markers = None
-        for file_suffix in markers:
-            if datafile['name'].endswith(file_suffix):
-                file_markers = markers[file_suffix]
-                break
+    if state is not None:
+        capture_counts = dict((regex, len(regex_data[regex])) for regex in regex_data)
 
-        for line in (logan.compat.decode_to_string(line) for line in datafile['f']):
+    def scan(lines, file_regexes, file_markers, marker_count, captures):
+        for line in (logan.compat.decode_to_string(line) for line in lines):
             # Process markers
             if file_markers is not None:
                 for marker in file_markers:
                     if line.startswith(marker):
                         marker_count[marker] += 1
 
-            for regex in regex_data:
-                # Check if we are allowed to process this regex
-                if regex.src is not None:
-                    if not isinstance(regex.src, str):
-                        if not datafile['name'].endswith(regex.src[0]) \
-                                or marker_count[regex.src[1]] != regex.src[2]:
-                            continue
-                    elif not datafile['name'].endswith(regex.src):
-                        continue
+            for regex, compiled_regex, marker_cond in file_regexes:
+                if marker_cond is not None and marker_count[marker_cond[0]] != marker_cond[1]:
+                    continue
 
                 # process regex
-                match_obj = compiled_regexes[regex.re].search(line)
+                match_obj = compiled_regex.search(line)
                 if match_obj is not None:
                     if callable(regex.gid):
-                        regex_data[regex].append(regex.gid(match_obj.group))
+                        captures[regex].append(regex.gid(match_obj.group))
                     else:
-                        regex_data[regex].append(match_obj.group(regex.gid))
+                        captures[regex].append(match_obj.group(regex.gid))
+
+    # Captures of incomplete last lines (with state only)
+    partial_data = collections.defaultdict(list)
+
+    # Read all requested data into memory
+    for datafile in datafiles:
+        # Regexes we are allowed to process for this datafile, with the
+        # (marker, count) they are restricted to, if any.
+        file_regexes = []
+        for regex in regex_data:
+            marker_cond = None
+            if regex.src is not None:
+                if not isinstance(regex.src, str):
+                    if not datafile['name'].endswith(regex.src[0]):
+                        continue
+                    marker_cond = (regex.src[1], regex.src[2])
+                elif not datafile['name'].endswith(regex.src):
+                    continue
+            file_regexes.append((regex, compiled_regexes[regex.re], marker_cond))
+
+        # No need to read datafiles without applicable regexes, e.g. if their
+        # datasets were not selected.
+        if not file_regexes:
+            continue
+
+        # Set up markers
+        if state is None:
+            marker_count = collections.defaultdict(lambda: 0)
+            lines = datafile['f']
+        else:
+            if datafile['name'] not in state.files:
+                state.files[datafile['name']] = {
+                        'offset' : 0,
+                        'marker_count' : collections.defaultdict(int)}
+            file_state = state.files[datafile['name']]
+            # Taken before reading, so that lines appended while reading are
+            # not taken as read by file_unchanged.
+            file_state['stat'] = file_stats[datafile['name']]
+
+            marker_count = file_state['marker_count']
+            if file_state['offset'] != 0:
+                datafile['f'].seek(file_state['offset'])
+            partial_lines = []
+            lines = _complete_lines(datafile['f'], file_state, partial_lines)
+
+        file_markers = None
+        for file_suffix in markers:
+            if datafile['name'].endswith(file_suffix):
+                file_markers = markers[file_suffix]
+                break
+
+        scan(lines, file_regexes, file_markers, marker_count, regex_data)
+
+        if state is not None and partial_lines:
+            # The incomplete line must not count towards the markers of the
+            # next call, which reads it again.
+            scan(partial_lines, [entry for entry in file_regexes
+                                 if isinstance(regex_data[entry[0]], list)],
+                 file_markers, collections.defaultdict(int, marker_count), partial_data)
+
+    if state is not None:
+        updated_regexes = frozenset(regex for regex in regex_data
+                                    if len(regex_data[regex]) != capture_counts.get(regex) or
+                                       partial_data.get(regex) != state.partial_captures.get(regex))
+        state.partial_captures = dict(partial_data)
+        state.changed = set()
 
     # Compute final result
     for dataset_key in datasets:
@@ -195,14 +392,26 @@ def extract_data_from_files(datafiles, datasets, filter_by=None,
            datasets[dataset_key]['compute'] is None or \
            not check_filter(datasets[dataset_key]): continue
 
-        data = []
+        if state is not None:
+            # Datasets without regexes may depend on any other result.
+            if dataset_key in result and 'regexes' in datasets[dataset_key] and \
+                    updated_regexes.isdisjoint(
+                            regex_generator(datasets[dataset_key]['regexes'])):
+                continue
+            state.changed.add(dataset_key)
+
+        data = analysis.CaptureData()
         if 'regexes' in datasets[dataset_key]:
             # Ensure data entries are ordered correctly!
             for regex in regex_generator(datasets[dataset_key]['regexes']):
-                if regex.empty_def is not None and len(regex_data[regex]) == 0:
+                captures = regex_data[regex]
+                if regex in partial_data:
+                    # Not kept in regex_data, see ExtractState.
+                    captures = captures + partial_data[regex]
+                if regex.empty_def is not None and len(captures) == 0:
                     data.append(regex.empty_def)
                 else:
-                    data.append(regex_data[regex])
+                    data.append(captures)
 
         try:
             compute = datasets[dataset_key]['compute']
@@ -7,7 +7,10 @@ try:
 except:
     pass
 
-import numpy as np
+from logan.datasource import statistics
+from logan.registry import lazy_import
+
+np = lazy_import("numpy")
 
 # Compute some generic results, adheres to function interface as required by
 # logan.datasource.extract_data_from_files (__init__.py)
@@ -15,6 +18,38 @@ import numpy as np
 class AnalysisError(Exception):
     pass
 
+class CaptureData(list):
+    """
+    The list of capture lists passed to compute functions as D. Conversions of
+    a capture list to a NumPy array are cached, so that several compute keys of
+    the same dataset only convert the captured strings once.
+    """
+    def __init__(self, *args, **kwargs):
+        super(CaptureData, self).__init__(*args, **kwargs)
+        self._arrays = {}
+
+    def array(self, idx=0, dtype=float):
+        key = (idx, dtype)
+        if key not in self._arrays:
+            self._arrays[key] = _to_array(self[idx], idx, dtype)
+        return self._arrays[key]
+
+def _to_array(values, idx, dtype):
+    if isinstance(values, statistics.KLLSketch):
+        raise AnalysisError("capture {} is collected into a KLLSketch, which does "
+                            "not keep the values; use quantile_sketch or "
+                            "sketch_quantile_float".format(idx))
+    return np.asarray(values, dtype=dtype)
+
+def as_array(D, idx=0, dtype=float):
+    """
+    Returns D[idx] as NumPy array; uses the cache if D is a CaptureData.
+    Raises AnalysisError if D[idx] is a sketch (see Quantile sketches below).
+    """
+    if isinstance(D, CaptureData):
+        return D.array(idx, dtype)
+    return _to_array(D[idx], idx, dtype)
+
 def count(idx=0):
     def _count(D=None,**kwargs):
         return len(D[idx])
@@ -65,6 +100,153 @@ def sum_ratio_float(i1=0, i2=1, empty_def=None):
         return sum(map(float, D[i1]))/sum(map(float, D[i2]))
     return _sum_ratio_float
 
-amean_float = make_operator_type(np.mean, float)
+amean_float = make_operator_type(lambda values: np.mean(list(values)), float)
 sum_float   = make_operator_type(sum, float)
 max_float   = make_operator_type(max, float)
+
+# Vectorized compute functions: the capture list is converted to a NumPy array
+# once (see CaptureData), and all reductions are performed by NumPy.
+
+def make_vector_operator(_operator, dtype=float):
+    """
+    @_operator: Reduction function taking a NumPy array.
+    """
+    def vector_operator(idx=0, empty_def=None):
+        def _vector_operator(D=None,**kwargs):
+            if len(D[idx]) == 0:
+                if empty_def is None: raise AnalysisError("0 elements")
+                else:                 return empty_def
+            return float(_operator(as_array(D, idx, dtype)))
+        return _vector_operator
+    return vector_operator
+
+# np is imported lazily, so it is resolved when the operator is called.
+vsum_float   = make_vector_operator(lambda a: np.sum(a))
+vmax_float   = make_vector_operator(lambda a: np.max(a))
+vmin_float   = make_vector_operator(lambda a: np.min(a))
+vamean_float = make_vector_operator(lambda a: np.mean(a))
+median_float = make_vector_operator(lambda a: np.median(a))
+
+def vsum_ratio_float(i1=0, i2=1, empty_def=None):
+    def _vsum_ratio_float(D=None,**kwargs):
+        if len(D[i1]) == 0 or len(D[i2]) == 0:
+            if empty_def is None: raise AnalysisError("0 elements")
+            else:                 return empty_def
+        return float(np.sum(as_array(D, i1)) / np.sum(as_array(D, i2)))
+    return _vsum_ratio_float
+
+def percentile_float(q, idx=0, empty_def=None):
+    """
+    @q: Percentile in [0, 100], or list of percentiles; in which case the
+        result is a list.
+    """
+    def _percentile_float(D=None,**kwargs):
+        if len(D[idx]) == 0:
+            if empty_def is None: raise AnalysisError("0 elements")
+            else:                 return empty_def
+        result = np.percentile(as_array(D, idx), q)
+        if np.ndim(result) == 0:
+            return float(result)
+        return [float(r) for r in result]
+    return _percentile_float
+
+def stddev_float(idx=0, ddof=0, empty_def=None):
+    def _stddev_float(D=None,**kwargs):
+        if len(D[idx]) <= ddof:
+            if empty_def is None: raise AnalysisError("{} elements".format(len(D[idx])))
+            else:                 return empty_def
+        return float(np.std(as_array(D, idx), ddof=ddof))
+    return _stddev_float
+
+def trimmed_amean_float(proportion=0.1, idx=0, empty_def=None):
+    """
+    Arithmetic mean after discarding the given proportion of the smallest and
+    largest values each.
+    """
+    if not 0.0 <= proportion < 0.5:
+        raise ValueError("Invalid proportion: {}".format(proportion))
+
+    def _trimmed_amean_float(D=None,**kwargs):
+        if len(D[idx]) == 0:
+            if empty_def is None: raise AnalysisError("0 elements")
+            else:                 return empty_def
+        values = as_array(D, idx)
+        cut = int(proportion * len(values))
+        if cut > 0:
+            values = np.partition(values, (cut, len(values) - cut - 1))[cut:len(values) - cut]
+        return float(np.mean(values))
+    return _trimmed_amean_float
+
+def histogram(bins=10, idx=0, range=None, density=False, empty_def=None):
+    """
+    @return: Tuple (counts, bin_edges) as lists.
+    """
+    def _histogram(D=None,**kwargs):
+        if len(D[idx]) == 0:
+            if empty_def is None: raise AnalysisError("0 elements")
+            else:                 return empty_def
+        counts, edges = np.histogram(as_array(D, idx), bins=bins,
+                                     range=range, density=density)
+        return (counts.tolist(), edges.tolist())
+    return _histogram
+
+def rate_float(idx=0, tidx=1, empty_def=None):
+    """
+    Rate of the values captured at idx over the time span covered by the
+    timestamps captured at tidx. If idx is None, the number of timestamps is
+    used, i.e. the result is events per time unit.
+    """
+    def _rate_float(D=None,**kwargs):
+        if len(D[tidx]) < 2 or (idx is not None and len(D[idx]) == 0):
+            if empty_def is None: raise AnalysisError("too few elements")
+            else:                 return empty_def
+        timestamps = as_array(D, tidx)
+        span = float(np.max(timestamps) - np.min(timestamps))
+        if span == 0.0:
+            if empty_def is None: raise AnalysisError("zero time span")
+            else:                 return empty_def
+        if idx is None:
+            return (len(timestamps) - 1) / span
+        return float(np.sum(as_array(D, idx))) / span
+    return _rate_float
+
+# Quantile sketches: the result of a compute function can be a sketch, which is
+# merged across files/runs with statistics.merge_sketches (e.g. via
+# reduce_deep), and queried for quantiles afterwards. If the captures are
+# collected directly into a sketch (regexinfo's container), D[idx] is used as
+# is; such a capture only combines with count and the sketch functions below,
+# as the sketch does not keep the values (the NumPy-based functions raise
+# AnalysisError).
+
+def _make_sketch(values, k):
+    if isinstance(values, statistics.KLLSketch):
+        return values
+    sketch = statistics.KLLSketch(k=k)
+    sketch.extend(values)
+    return sketch
+
+def quantile_sketch(idx=0, k=200, empty_def=None):
+    def _quantile_sketch(D=None,**kwargs):
+        if len(D[idx]) == 0:
+            if empty_def is None: raise AnalysisError("0 elements")
+            else:                 return empty_def
+        if isinstance(D[idx], statistics.KLLSketch):
+            # A copy, so that results do not share the capture container.
+            return D[idx].copy()
+        return _make_sketch(D[idx], k)
+    return _quantile_sketch
+
+def sketch_quantile_float(q, idx=0, k=200, empty_def=None):
+    """
+    @q: Quantile in [0, 1], or list of quantiles; in which case the result
+        is a list.
+    """
+    def _sketch_quantile_float(D=None,**kwargs):
+        if len(D[idx]) == 0:
+            if empty_def is None: raise AnalysisError("0 elements")
+            else:                 return empty_def
+        sketch = _make_sketch(D[idx], k)
+        if isinstance(q, (list, tuple)):
+            return sketch.quantiles(q)
+        return sketch.quantile(q)
+    return _sketch_quantile_float
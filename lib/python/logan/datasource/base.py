@@ -4,6 +4,8 @@ dataoutputs. The null DataSource class should be used as a base class for all
 other DataSources.
 """
 
+import fnmatch
+
 from logan.datasource import DataPoint
 
 def register_arguments(logan_config):
@@ -41,6 +43,9 @@ def register_arguments(logan_config):
     logan_config.add_argument("--dsrc-max-results", metavar="COUNT", type=int,
             dest="dsrc_max_results", default=0,
             help="Require a maximum of COUNT results, if supported by datasource.")
+    logan_config.add_argument("--dsrc-mpi",
+            action="store_true", dest="dsrc_mpi", default=False,
+            help="Distribute processing over MPI ranks (start with mpirun on all ranks; requires mpi4py), if supported by datasource.")
     logan_config.add_argument("--dsrc-ranges",
             action="store_true", dest="dsrc_ranges", default=False,
             help="Use data error/ranges, and pass to dataoutput.")
@@ -51,6 +56,12 @@ def get_description():
     """
     return ("Base/null datasource (does nothing).", None)
 
+def match_dataset(dataset, patterns):
+    """
+    @return: True if dataset matches any of the shell-style patterns.
+    """
+    return any(fnmatch.fnmatchcase(str(dataset), pattern) for pattern in patterns)
+
 class DataSourceGenerator(object):
     """
     Called to generate the data, usually by an external program, before
@@ -66,7 +77,14 @@ class DataSourceGenerator(object):
     def __call__(self):
         raise NotImplementedError("Base module does not support source data generation!")
 
+class ProcessError(Exception):
+    pass
+
 class DataSource(object):
+    # Incremented by update whenever data changed, so that what is derived
+    # from the data (e.g. dataset digests) can be reused until then.
+    generation = 0
+
     def __init__(self, logan_config):
         """
         @type logan_config: LoganConfig
@@ -82,6 +100,70 @@ class DataSource(object):
         """
         return True
 
+    def process_datasets(self):
+        """
+        Interface function. Streaming variant of process (used with --stream):
+        acts as a python-generator, which yields each dataset key as soon as
+        the dataset is ready to be accessed by a dataoutput. Datasources which
+        can prepare datasets independently should override this, so that
+        dataoutputs can render datasets while others are still being
+        processed.
+
+        The default implementation calls process and then yields all dataset
+        keys.
+
+        @raise ProcessError: If processing failed.
+        """
+        if not self.process():
+            raise ProcessError("Datasource data processing with {} failed!".format(
+                self.__class__))
+
+        for dataset in self.get_dataset_keys() or []:
+            yield dataset
+
+    def update(self):
+        """
+        Interface function called periodically in follow mode (--follow),
+        after process: bring the data up to date with data appended to the
+        source data files (and newly created ones) since the last call. To
+        only scan new data, pass an ExtractState to extract_data_from_files.
+        If any dataset changed, generation must be incremented.
+
+        @return: List of dataset keys which changed, or None if the datasource
+                 does not support updates.
+        """
+        return None
+
+    @classmethod
+    def supports_update(cls):
+        """
+        Interface function; checked when parsing the arguments, so that
+        --follow is rejected for datasources without update.
+
+        @rtype: boolean
+        @return: True if the datasource implements update.
+        """
+        return False
+
+    def dataset_selected(self, dataset):
+        """
+        Whether dataset was selected for output (--datasets). Datasources
+        should only process selected datasets, e.g. by passing this as the
+        select argument of extract_data_from_files, so that rendering a few
+        datasets does not cost processing all of them.
+
+        @return: True if dataset is selected.
+        """
+        patterns = getattr(self.logan_config.args, "datasets", None)
+        return patterns is None or match_dataset(dataset, patterns)
+
+    def release_dataset(self, dataset):
+        """
+        Interface function. Called in streaming mode, after all dataoutputs
+        are done with dataset; the datasource may free its data.
+        """
+        pass
+
     def map_to_name(self, key):
         """
         Interface function. Map any key to a given name.
@@ -200,15 +282,225 @@ class DataSource(object):
         """
         return DataPoint(y=0)
 
-    def data(self):
-        """
-        Interface function. Acts as a python-generator for all available data.
-        Yields a DataPoint until no more data is available. Contrary to
-        the query_data function, this can be used to generate smooth
-        curves. As the dataoutput would only know about the {x,z}-ticks from
-        get_{x,z}tick_keys, those would be the points queried by the
-        dataoutput. Using this generator, it is possible to define the ticks, but
-        generate data inbetween.
-        """
-        yield DataPoint()
+    def query_grid(self, dataset):
+        """
+        Interface function. Bulk variant of query_data, for dataoutputs which
+        export all data of a dataset: acts as a python-generator over the
+        grid of x-tick, z-tick, cluster and stack keys (the latter varying
+        fastest). Where get_{z,cluster,stack}_keys return None, the grid has
+        a single z of 0, cluster and stack of None respectively.
+
+        The default implementation calls query_data for each point;
+        datasources which can look up the data more efficiently should
+        override this.
+
+        @return: Yields a tuple of x, z, cluster, stack key and DataPoint.
+        """
+        xtick_keys = self.get_xtick_keys(dataset=dataset)
+        if xtick_keys is None:
+            return
+
+        ztick_keys = self.get_ztick_keys(dataset=dataset)
+        ztick_keys = ztick_keys if ztick_keys is not None else [0]
+        cluster_keys = self.get_cluster_keys(dataset=dataset)
+        cluster_keys = cluster_keys if cluster_keys is not None else [None]
+        stack_keys = self.get_stack_keys(dataset=dataset)
+        stack_keys = stack_keys if stack_keys is not None else [None]
+
+        for x in xtick_keys:
+            for z in ztick_keys:
+                for cluster in cluster_keys:
+                    for stack in stack_keys:
+                        yield (x, z, cluster, stack,
+                               self.query_data(x=x, z=z, stack=stack,
+                                               cluster=cluster, dataset=dataset))
+
+    def data(self, dataset=None):
+        """
+        Interface function. Acts as a python-generator for all available data
+        of dataset. Yields a DataPoint until no more data is available.
+        Contrary to the query_data function, this can be used to generate
+        smooth curves. As the dataoutput would only know about the
+        {x,z}-ticks from get_{x,z}tick_keys, those would be the points
+        queried by the dataoutput. Using this generator, it is possible to
+        define the ticks, but generate data inbetween.
+
+        Used for the line and scatter presentation hint types: points are
+        grouped into a series per cluster and stack. For long series, a
+        DataPoint may also carry a chunk of the series, with x and y as
+        arrays.
+
+        The default implementation yields the points of query_grid.
+        """
+        for x, z, cluster, stack, data_point in self.query_grid(dataset):
+            yield DataPoint(x=x, y=data_point.y, z=z,
+                            x_err=data_point.x_err, y_err=data_point.y_err,
+                            z_err=data_point.z_err, stack=stack, cluster=cluster,
+                            dataset=dataset)
+
+class DatasetSelection(object):
+    """
+    Proxy for a DataSource, which restricts get_dataset_keys to the datasets
+    matching any of the given shell-style patterns (see --datasets).
+    """
+    def __init__(self, data_source, patterns):
+        self._data_source = data_source
+        self._patterns = patterns
 
+    def selected(self, dataset):
+        return match_dataset(dataset, self._patterns)
+
+    def get_dataset_keys(self):
+        return [dataset for dataset in self._data_source.get_dataset_keys() or []
+                if self.selected(dataset)]
+
+    def process_datasets(self):
+        for dataset in self._data_source.process_datasets():
+            if self.selected(dataset):
+                yield dataset
+
+    def update(self):
+        changed = self._data_source.update()
+        if changed is None:
+            return None
+        return [dataset for dataset in changed if self.selected(dataset)]
+
+    def __getattr__(self, attr):
+        return getattr(self._data_source, attr)
+
+class DatasetSnapshot(object):
+    """
+    Proxy for a DataSource, which holds everything dataoutputs query about a
+    single dataset in memory: labels, presentation hints, keys and their
+    names, and the points of query_grid (and of data, if requested). Once
+    constructed, querying the dataset does not call the DataSource, so that
+    snapshots can be prepared ahead of time (e.g. in a background thread).
+    Other datasets and methods are passed through to the DataSource.
+    """
+    def __init__(self, data_source, dataset, grid=True, series=False):
+        """
+        @grid: Capture the points of query_grid (used by query_data).
+        @series: Capture the points of data.
+        """
+        self._data_source = data_source
+        self.dataset = dataset
+
+        self._hints = data_source.get_presentation_hints(dataset)
+        self._description = data_source.get_description(dataset=dataset)
+        self._labels = {
+            'x' : data_source.get_xlabel(dataset=dataset),
+            'y' : data_source.get_ylabel(dataset=dataset),
+            'z' : data_source.get_zlabel(dataset=dataset)
+        }
+        self._yrange = data_source.get_yrange(dataset=dataset)
+        self._keys = {
+            'x' : data_source.get_xtick_keys(dataset=dataset),
+            'z' : data_source.get_ztick_keys(dataset=dataset),
+            'cluster' : data_source.get_cluster_keys(dataset=dataset),
+            'stack' : data_source.get_stack_keys(dataset=dataset)
+        }
+
+        self._grid = None
+        self._points = None
+        if grid:
+            self._grid = list(data_source.query_grid(dataset))
+            self._points = dict(((x, z, cluster, stack), data_point)
+                                for x, z, cluster, stack, data_point in self._grid)
+
+        self._data = None
+        if series:
+            self._data = list(data_source.data(dataset=dataset))
+
+        self._names = {}
+        for keys in self._keys.values():
+            for key in keys or []:
+                self._add_name(key)
+        for data_point in self._data or []:
+            self._add_name(data_point.cluster)
+            self._add_name(data_point.stack)
+
+    def _add_name(self, key):
+        try:
+            if key not in self._names:
+                self._names[key] = self._data_source.map_to_name(key)
+        except TypeError:
+            # Unhashable keys are mapped on demand.
+            pass
+
+    def map_to_name(self, key):
+        try:
+            return self._names[key]
+        except (KeyError, TypeError):
+            return self._data_source.map_to_name(key)
+
+    def get_presentation_hints(self, dataset):
+        if dataset != self.dataset:
+            return self._data_source.get_presentation_hints(dataset)
+        return self._hints
+
+    def get_description(self, dataset=None):
+        if dataset != self.dataset:
+            return self._data_source.get_description(dataset=dataset)
+        return self._description
+
+    def get_ylabel(self, dataset=None):
+        if dataset != self.dataset:
+            return self._data_source.get_ylabel(dataset=dataset)
+        return self._labels['y']
+
+    def get_xlabel(self, dataset=None):
+        if dataset != self.dataset:
+            return self._data_source.get_xlabel(dataset=dataset)
+        return self._labels['x']
+
+    def get_zlabel(self, dataset=None):
+        if dataset != self.dataset:
+            return self._data_source.get_zlabel(dataset=dataset)
+        return self._labels['z']
+
+    def get_yrange(self, dataset=None):
+        if dataset != self.dataset:
+            return self._data_source.get_yrange(dataset=dataset)
+        return self._yrange
+
+    def get_xtick_keys(self, dataset=None):
+        if dataset != self.dataset:
+            return self._data_source.get_xtick_keys(dataset=dataset)
+        return self._keys['x']
+
+    def get_ztick_keys(self, dataset=None):
+        if dataset != self.dataset:
+            return self._data_source.get_ztick_keys(dataset=dataset)
+        return self._keys['z']
+
+    def get_stack_keys(self, dataset=None):
+        if dataset != self.dataset:
+            return self._data_source.get_stack_keys(dataset=dataset)
+        return self._keys['stack']
+
+    def get_cluster_keys(self, dataset=None):
+        if dataset != self.dataset:
+            return self._data_source.get_cluster_keys(dataset=dataset)
+        return self._keys['cluster']
+
+    def query_data(self, x, z=0, stack=None, cluster=None, dataset=None):
+        if dataset == self.dataset and self._points is not None:
+            try:
+                return self._points[(x, z, cluster, stack)]
+            except (KeyError, TypeError):
+                pass
+        return self._data_source.query_data(x=x, z=z, stack=stack, cluster=cluster,
+                                            dataset=dataset)
+
+    def query_grid(self, dataset):
+        if dataset != self.dataset or self._grid is None:
+            return self._data_source.query_grid(dataset)
+        return iter(self._grid)
+
+    def data(self, dataset=None):
+        if dataset != self.dataset or self._data is None:
+            return self._data_source.data(dataset=dataset)
+        return iter(self._data)
+
+    def __getattr__(self, attr):
+        return getattr(self._data_source, attr)
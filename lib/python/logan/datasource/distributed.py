@@ -0,0 +1,41 @@
+"""
+Distributed processing over MPI ranks (--dsrc-mpi).
+
+logan is started on all ranks (e.g. mpirun -n 16 bin/logan --dsrc-mpi ...),
+and all ranks construct the same DataSource. Datasources distribute their
+work with TaskFarm.map (see logan.taskfarm, which is shared with
+launch_scripts/ARCHER/mpi_tf_worker.py): rank 0 hands out tasks (e.g. groups
+of datafiles to extract) to the ranks which are ready, and collects the
+compact results (e.g. computed per-run results or mergeable sketches). Only
+rank 0 continues with the dataoutputs; the other ranks exit after processing.
+
+Without --dsrc-mpi, or if started on a single rank, TaskFarm.map runs all
+tasks locally.
+
+The workers wait in map until rank 0 hands out tasks, so whether map is called
+must be decided on rank 0 and broadcast (see TaskFarm.bcast); if rank 0 fails
+after deciding to call map, but before calling it, it must call
+TaskFarm.cancel instead.
+"""
+
+from logan.taskfarm import TaskError, TaskFarm
+
+_task_farm = None
+
+def get_task_farm(logan_config):
+    """
+    @return: The TaskFarm of this process, using MPI if --dsrc-mpi is given.
+    """
+    global _task_farm
+    if _task_farm is None:
+        _task_farm = TaskFarm(getattr(logan_config.args, "dsrc_mpi", False))
+    return _task_farm
+
+def get_rank():
+    """
+    @return: Rank of this process in the task farm; 0 if no task farm was
+             created (e.g. without --dsrc-mpi).
+    """
+    if _task_farm is None:
+        return 0
+    return _task_farm.rank
@@ -0,0 +1,316 @@
+"""
+Index of result directory trees.
+
+Datasources usually locate their data by walking the --dsrc-path trees and
+decoding the parameter-encoded directory names (see encode_json_to_filename).
+On large trees (and in particular on parallel filesystems) this metadata walk
+becomes expensive. A ResultIndex records each run directory's decoded
+parameters, datafiles and their compression suffixes in a compact on-disk
+index. On refresh, only directories whose mtime changed are listed again;
+unchanged directories cost a single stat.
+
+Example:
+
+    index = ResultIndex(path)
+    index.refresh()
+    for run in index.query(threads=[1, 2, 4], benchmark="foo"):
+        datafiles = [index.open_datafile(run, name) for name in run.datafiles]
+"""
+
+import os
+import time
+import json
+import gzip
+import pickle
+import numbers
+import logging
+import collections
+
+from logan.datasource import COMPRESS_MODULES, PICKLE_VERSION, \
+        decode_filename_to_json
+
+INDEX_FILENAME = ".logan-index.pickle.gz"
+INDEX_VERSION = 2
+
+# Directories modified this close (in seconds) to the time they were scanned
+# are always rescanned, as mtime granularity may hide later modifications.
+MTIME_SLACK = 2.0
+
+ResultRun = collections.namedtuple("ResultRun", ["path", "params", "datafiles"])
+ResultRun.__doc__ = """
+A run directory: path is relative to the index root, params is a dict of the
+parameters decoded from the path components, datafiles maps the datafile names
+(without compression suffix, as passed to cfopen) to their compression suffix
+(None if uncompressed). If a datafile exists with several suffixes, the one
+cfopen would open is used.
+"""
+
+def _parse_value(value):
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+def decode_params(name):
+    """
+    Decode a parameter-encoded file or directory name to a dict; the reverse of
+    encode_json_to_filename.
+
+    The parameters of a name with a prepended key (e.g. bench+threads=4) are
+    not nested under the key: the key only names the group of runs, and the
+    parameters are queried the same with or without it ({'threads': 4}). A
+    prepended key with a plain value (e.g. bench+foo) decodes to
+    {'bench': 'foo'}.
+
+    @return: dict of parameters; empty if name is not parameter-encoded.
+    """
+    if "=" not in name:
+        if "+" in name:
+            key, value = decode_filename_to_json(name).split(":", 1)
+            return {key: _parse_value(value)}
+        return {}
+
+    if "+" not in name:
+        # Without a prepended key, decode_filename_to_json passes the name
+        # through unchanged.
+        name = "+" + name
+
+    value = decode_filename_to_json(name).split(":", 1)[1]
+    try:
+        return json.loads(value)
+    except ValueError:
+        # Contains non-numeric values, which are not quoted in the name.
+        return dict((k, _parse_value(v)) for k, v in
+                    (kv.split("=", 1) for kv in name.split("+", 1)[1].split(",")
+                     if "=" in kv))
+
+def _split_compress_suffix(filename):
+    base, ext = os.path.splitext(filename)
+    if ext[1:] in COMPRESS_MODULES:
+        return base, ext[1:]
+    return filename, None
+
+def _datafiles(filenames):
+    """
+    @filenames: Names of the files of a directory.
+    @return: dict mapping datafile names to the compression suffix cfopen
+             would open (compressed variants first, in the order of
+             COMPRESS_MODULES).
+    """
+    datafiles = {}
+    for filename in filenames:
+        prefix, suffix = _split_compress_suffix(filename)
+        if prefix not in datafiles or datafiles[prefix] is None:
+            datafiles[prefix] = suffix
+        elif suffix is not None:
+            order = list(COMPRESS_MODULES)
+            if order.index(suffix) < order.index(datafiles[prefix]):
+                datafiles[prefix] = suffix
+    return datafiles
+
+def _sort_key(value):
+    """
+    Sort key for parameter values of mixed types: numbers sort before
+    other values, which sort by type and then by value.
+    """
+    if isinstance(value, numbers.Real):
+        return (0, value)
+    return (1, type(value).__name__, str(value))
+
+def _match(value, expected):
+    if callable(expected):
+        return expected(value)
+    if isinstance(expected, (list, tuple, set, frozenset)):
+        return value in expected
+    return value == expected
+
+class ResultIndex(object):
+    def __init__(self, root, index_path=None):
+        """
+        @root: Root directory of the result tree.
+        @index_path: Where to store the index; defaults to INDEX_FILENAME in
+                     root.
+        """
+        self.root = os.path.abspath(root)
+        self.index_path = index_path or os.path.join(self.root, INDEX_FILENAME)
+
+        # Maps directory path (relative to root) to dict with 'mtime',
+        # 'scanned', 'subdirs' and 'files' (sorted list of file names).
+        self._dirs = {}
+        self._runs = None
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.index_path):
+            return
+
+        try:
+            with gzip.open(self.index_path, "rb") as f:
+                index = pickle.load(f)
+        except Exception as e:
+            logging.warning("Could not load index {}: {}".format(self.index_path, e))
+            return
+
+        if index.get('version') != INDEX_VERSION:
+            logging.info("Discarding outdated index {}".format(self.index_path))
+            return
+
+        self._dirs = index['dirs']
+
+    def save(self):
+        tmp_path = "{}.{}.tmp".format(self.index_path, os.getpid())
+        try:
+            with gzip.open(tmp_path, "wb") as f:
+                pickle.dump({'version' : INDEX_VERSION, 'dirs' : self._dirs},
+                            f, PICKLE_VERSION)
+            os.rename(tmp_path, self.index_path)
+        except (IOError, OSError) as e:
+            logging.warning("Could not save index {}: {}".format(self.index_path, e))
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _scan_dir(self, rel_path, mtime, now, dirs):
+        """
+        Scan directory rel_path and its subdirectories into dirs, reusing the
+        old entries of unchanged directories.
+
+        @return: Tuple of number of directories which were listed, and
+                 number of directories whose contents changed.
+        """
+        old_entry = entry = self._dirs.get(rel_path)
+        listed = 0
+        modified = 0
+
+        if entry is None or entry['mtime'] != mtime or \
+                mtime >= entry['scanned'] - MTIME_SLACK:
+            entry = {'mtime' : mtime, 'scanned' : now, 'subdirs' : [], 'files' : []}
+            for dir_entry in os.scandir(os.path.join(self.root, rel_path)):
+                if dir_entry.name.startswith("."):
+                    continue
+
+                if dir_entry.is_dir():
+                    entry['subdirs'].append(dir_entry.name)
+                else:
+                    entry['files'].append(dir_entry.name)
+            entry['subdirs'].sort()
+            entry['files'].sort()
+            listed += 1
+
+            if old_entry is None or old_entry['subdirs'] != entry['subdirs'] or \
+                    old_entry['files'] != entry['files']:
+                modified += 1
+
+        dirs[rel_path] = entry
+        for subdir in entry['subdirs']:
+            sub_path = os.path.join(rel_path, subdir)
+            try:
+                sub_mtime = os.stat(os.path.join(self.root, sub_path)).st_mtime
+            except OSError:
+                # Removed in the meantime
+                continue
+            sub_listed, sub_modified = self._scan_dir(sub_path, sub_mtime, now, dirs)
+            listed += sub_listed
+            modified += sub_modified
+
+        return listed, modified
+
+    def refresh(self, save=True):
+        """
+        Brings the index up to date with the result tree.
+
+        @return: Number of directories which had to be listed.
+        """
+        dirs = {}
+        listed, modified = self._scan_dir("", os.stat(self.root).st_mtime,
+                                          time.time(), dirs)
+
+        # Removed directories are dropped by only keeping visited ones. Only
+        # save if the contents changed: saving the index modifies the root's
+        # mtime (if stored in root), so saving on every listing would cause
+        # the root to be saved and relisted on every refresh.
+        changed = modified > 0 or len(dirs) != len(self._dirs)
+        self._dirs = dirs
+        self._runs = None
+
+        logging.debug("Index {}: {} directories, {} listed".format(
+            self.root, len(dirs), listed))
+
+        if changed and save:
+            self.save()
+
+        return listed
+
+    def runs(self):
+        """
+        @return: List of ResultRun of all directories containing datafiles,
+                 sorted by path.
+        """
+        if self._runs is None:
+            self._runs = []
+            for rel_path in sorted(self._dirs):
+                entry = self._dirs[rel_path]
+                if not entry['files']:
+                    continue
+
+                params = {}
+                for component in rel_path.split(os.sep) if rel_path else []:
+                    params.update(decode_params(component))
+
+                self._runs.append(ResultRun(rel_path, params, _datafiles(entry['files'])))
+
+        return self._runs
+
+    def query(self, **params):
+        """
+        Query runs by parameter values. Each value may be a value to compare
+        for equality, a list/tuple/set of accepted values, or a predicate.
+
+        @return: Generator of matching ResultRun.
+        """
+        for run in self.runs():
+            if all(key in run.params and _match(run.params[key], expected)
+                   for key, expected in params.items()):
+                yield run
+
+    def values(self, key):
+        """
+        @return: Sorted list of distinct values of parameter key; numeric
+                 values sort before values of other types.
+        """
+        return sorted(frozenset(run.params[key] for run in self.runs()
+                                if key in run.params), key=_sort_key)
+
+    def open_datafile(self, run, name):
+        """
+        Opens datafile name of run, without probing for compressed variants.
+
+        @return: dict as returned by cfopen.
+        """
+        return open_datafile(self.root, run, name)
+
+def datafile_path(root, run, name):
+    """
+    @return: Path of datafile name of run in the tree at root, including its
+             compression suffix.
+    """
+    fileprefix = os.path.join(root, run.path, name)
+    suffix = run.datafiles[name]
+    if suffix is None:
+        return fileprefix
+    return "{}.{}".format(fileprefix, suffix)
+
+def open_datafile(root, run, name):
+    """
+    Opens datafile name of run in the tree at root; see
+    ResultIndex.open_datafile. Does not require the index (e.g. on remote
+    workers, which are only passed the runs).
+
+    @return: dict as returned by cfopen.
+    """
+    fileprefix = os.path.join(root, run.path, name)
+    suffix = run.datafiles[name]
+    if suffix is None:
+        return {'name' : fileprefix, 'f' : open(fileprefix, 'rb')}
+
+    return {'name' : fileprefix,
+            'f' : COMPRESS_MODULES[suffix].open(datafile_path(root, run, name), 'rb')}
@@ -101,3 +101,220 @@ class dixon(object):
                 return (rest, outliers)
 
         return (data, [])
+
+# ------------------------
+# QUANTILE SKETCH
+
+class KLLSketch(object):
+    """
+    Streaming, mergeable quantile sketch (Karnin, Lang, Liberty: "Optimal
+    Quantile Approximation in Streams", 2016).
+
+    The sketch keeps a hierarchy of compactors, where items at level h carry
+    weight 2**h. Memory use is O(k) regardless of the number of items added,
+    and the normalised rank error of quantile queries is O(1/k); see
+    error_bound. Compaction uses an alternating (rather than random) offset,
+    which keeps results deterministic and the pickled sketch compact.
+
+    Sketches can be merged, so they can be computed per file, then reduced
+    across files and runs (see merge_sketches).
+    """
+
+    # The normalised rank error measured on random and skewed inputs (see
+    # tests/test_statistics.py) is below ERROR_CONSTANT / k. This is an
+    # empirical constant, not a guarantee: the KLL bound is
+    # O(sqrt(log(1/delta)) / k) with probability 1 - delta, with an
+    # unspecified constant. See error_bound and from_error.
+    ERROR_CONSTANT = 2.0
+
+    def __init__(self, k=200, c=2.0/3.0):
+        if k < 8:
+            raise ValueError("k too small: {}".format(k))
+        self.k = int(k)
+        self.c = float(c)
+        self.compactors = [[]]
+        self.offsets = [0]
+        self.n = 0
+        self.min = None
+        self.max = None
+        self._update_capacity()
+
+    @classmethod
+    def from_error(cls, epsilon, **kwargs):
+        """
+        Create sketch, where k is chosen such that the normalised rank error
+        is below epsilon.
+        """
+        return cls(k=int(math.ceil(cls.ERROR_CONSTANT / epsilon)), **kwargs)
+
+    @property
+    def error_bound(self):
+        """
+        Empirical bound of the normalised rank error (see ERROR_CONSTANT).
+        """
+        return self.ERROR_CONSTANT / self.k
+
+    def copy(self):
+        """
+        @return: Independent copy of the sketch.
+        """
+        result = KLLSketch(k=self.k, c=self.c)
+        result.compactors = [list(compactor) for compactor in self.compactors]
+        result.offsets = list(self.offsets)
+        result.n = self.n
+        result.min = self.min
+        result.max = self.max
+        result._update_capacity()
+        return result
+
+    def _capacity(self, h):
+        return int(math.ceil(self.k * self.c ** (len(self.compactors) - h - 1))) + 1
+
+    def _update_capacity(self):
+        self.capacities = [self._capacity(h) for h in range(len(self.compactors))]
+        self.max_size = sum(self.capacities)
+
+    def _grow(self):
+        self.compactors.append([])
+        self.offsets.append(0)
+        self._update_capacity()
+
+    def _compress(self):
+        size = sum(len(compactor) for compactor in self.compactors)
+        while size >= self.max_size:
+            for h, compactor in enumerate(self.compactors):
+                if len(compactor) >= self.capacities[h]:
+                    if h + 1 >= len(self.compactors):
+                        self._grow()
+
+                    compactor.sort()
+                    # Keep the last item if the count is odd.
+                    keep = [compactor.pop()] if len(compactor) % 2 else []
+                    promoted = compactor[self.offsets[h]::2]
+                    self.compactors[h + 1].extend(promoted)
+                    self.offsets[h] ^= 1
+                    self.compactors[h] = keep
+                    size -= len(compactor) - len(promoted)
+                    break
+
+    def __len__(self):
+        return self.n
+
+    def append(self, value):
+        """
+        Add a single value; allows the sketch to be used in place of a
+        capture list (see regexinfo's container).
+        """
+        value = float(value)
+        self.compactors[0].append(value)
+        self.n += 1
+        if self.min is None or value < self.min: self.min = value
+        if self.max is None or value > self.max: self.max = value
+        if len(self.compactors[0]) >= self.capacities[0]:
+            self._compress()
+
+    def extend(self, values):
+        values = [float(v) for v in values]
+        if not values:
+            return
+
+        self.n += len(values)
+        self.min = min(values) if self.min is None else min(self.min, min(values))
+        self.max = max(values) if self.max is None else max(self.max, max(values))
+
+        # Add values in batches, such that the sketch never exceeds its
+        # maximum size before compressing.
+        start = 0
+        while start < len(values):
+            size = sum(len(compactor) for compactor in self.compactors)
+            end = start + max(self.max_size - size, 1)
+            self.compactors[0].extend(values[start:end])
+            start = end
+            self._compress()
+
+    def merge(self, other):
+        """
+        Merge other sketch into this sketch.
+
+        @return: self
+        @raise ValueError: If the sketches have different k or c.
+        """
+        if other is self:
+            raise ValueError("Cannot merge sketch into itself")
+        if (other.k, other.c) != (self.k, self.c):
+            raise ValueError("Cannot merge sketches with different k/c: {}/{} and {}/{}".format(
+                self.k, self.c, other.k, other.c))
+        if other.n == 0:
+            return self
+
+        while len(self.compactors) < len(other.compactors):
+            self._grow()
+
+        for h, compactor in enumerate(other.compactors):
+            self.compactors[h].extend(compactor)
+
+        self.n += other.n
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self._compress()
+        return self
+
+    def _weighted_items(self):
+        items = sorted((value, 1 << h) for h, compactor in enumerate(self.compactors)
+                       for value in compactor)
+        return items, sum(weight for _, weight in items)
+
+    def rank(self, value):
+        """
+        @return: Approximate normalised rank of value, i.e. the fraction of
+                 added values which are <= value.
+        """
+        if self.n == 0:
+            raise ValueError("Empty sketch")
+        items, total = self._weighted_items()
+        return sum(weight for v, weight in items if v <= value) / float(total)
+
+    def quantiles(self, qs):
+        """
+        @qs: Iterable of quantiles in [0, 1].
+        @return: List of approximate values at the given quantiles.
+        """
+        if self.n == 0:
+            raise ValueError("Empty sketch")
+
+        items, total = self._weighted_items()
+        result = []
+        for q in qs:
+            if not 0.0 <= q <= 1.0:
+                raise ValueError("Invalid quantile: {}".format(q))
+
+            if q == 0.0:
+                result.append(self.min)
+                continue
+            if q == 1.0:
+                result.append(self.max)
+                continue
+
+            target = q * total
+            cumulative = 0
+            for value, weight in items:
+                cumulative += weight
+                if cumulative >= target:
+                    result.append(value)
+                    break
+            else:
+                result.append(self.max)
+        return result
+
+    def quantile(self, q):
+        return self.quantiles([q])[0]
+
+def merge_sketches(a, b):
+    """
+    Reduce function for sketches; can be passed to
+    logan.datasource.reduce_deep. Neither a nor b is modified, so that
+    sketches shared between results are not counted twice.
+
+    @return: New sketch of the items of a and b.
+    """
+    return a.copy().merge(b)
@@ -0,0 +1,389 @@
+"""
+Datasource for synthetic result trees, as generated by
+logan.benchmark.generator. Used to benchmark and exercise the datasource and
+dataoutput code paths without real result data.
+"""
+
+import os
+import logging
+import collections
+
+import logan.compat
+import logan.datasource.base
+from logan.datasource import DataPoint, ExtractState, regexinfo, extract_data_from_files, \
+        cache_save_pickle, cache_load_pickle, analysis, distributed, resultindex
+from logan.benchmark import generator
+
+def register_arguments(logan_config):
+    """
+    Interface function.
+    When module is loaded, this function is called by the main module,
+    allowing this module to register its own command-line arguments.
+
+    @type logan_config: LoganConfig
+    """
+    logan_config.add_argument("--dsrc-syn-benchmarks", metavar="N", type=int,
+            dest="dsrc_syn_benchmarks", default=2,
+            help="Number of benchmarks to generate. [Default:2]")
+    logan_config.add_argument("--dsrc-syn-threads", metavar="T", type=int,
+            dest="dsrc_syn_threads", default=[1, 2, 4, 8], nargs="+",
+            help="Thread counts to generate runs for. [Default:1 2 4 8]")
+    logan_config.add_argument("--dsrc-syn-reps", metavar="N", type=int,
+            dest="dsrc_syn_reps", default=3,
+            help="Repetitions of each run to generate. [Default:3]")
+    logan_config.add_argument("--dsrc-syn-lines", metavar="N", type=int,
+            dest="dsrc_syn_lines", default=10000,
+            help="Lines per generated datafile. [Default:10000]")
+    logan_config.add_argument("--dsrc-syn-line-mix", metavar="MIX", type=str,
+            dest="dsrc_syn_line_mix", default=generator.DEFAULT_LINE_MIX,
+            help="Generated line mix, as kind=weight pairs. [Default:{}]".format(
+                generator.DEFAULT_LINE_MIX))
+    logan_config.add_argument("--dsrc-syn-markers", metavar="N", type=int,
+            dest="dsrc_syn_markers", default=4,
+            help="Iteration markers per generated datafile. [Default:4]")
+    logan_config.add_argument("--dsrc-syn-seed", metavar="SEED", type=int,
+            dest="dsrc_syn_seed", default=0,
+            help="Seed of generated data. [Default:0]")
+
+def get_description():
+    """
+    Interface function. Used to query description.
+    """
+    return ("Datasource for synthetic result trees (see logan.benchmark).",
+"""Generate a tree with -G (compressed with --dsrc-compress), then process it
+with -S pointing to the same path. Datasets are the metrics, the x-axis the
+thread counts and the clusters the benchmarks; values are the mean over all
+repetitions.""")
+
+DATASETS = {
+    'throughput' : {
+        'regexes' : [regexinfo(generator.DATAFILE, r"^throughput: ([0-9.]+)")],
+        'compute' : analysis.vamean_float()
+    },
+    'first_iteration_throughput' : {
+        'regexes' : [regexinfo((generator.DATAFILE, generator.MARKER, 1),
+                               r"^throughput: ([0-9.]+)")],
+        'compute' : analysis.vamean_float(empty_def=0.0)
+    },
+    'latency' : {
+        'regexes' : [regexinfo(generator.DATAFILE, r"^latency_us: ([0-9.]+)")],
+        'compute' : analysis.median_float()
+    },
+    'latency_p99' : {
+        'regexes' : [regexinfo(generator.DATAFILE, r"^latency_us: ([0-9.]+)")],
+        'compute' : analysis.percentile_float(99)
+    },
+    'events' : {
+        'regexes' : [regexinfo(generator.DATAFILE, r"event=(\w+)")],
+        'compute' : analysis.count()
+    }
+}
+
+NAMES = {
+    'throughput'                 : "Throughput [ops/s]",
+    'first_iteration_throughput' : "Throughput, first iteration [ops/s]",
+    'latency'                    : "Median latency [us]",
+    'latency_p99'                : "99th percentile latency [us]",
+    'events'                     : "Events"
+}
+
+# State of DataSource.process_datasets, inherited by its forked workers.
+_stream_extract = None
+
+def _extract_group(index):
+    """
+    Extracts the datasets of group index from all runs; in a worker process
+    with -j.
+
+    @return: List of the results of each run.
+    """
+    data_source, tasks, groups = _stream_extract
+    select = frozenset(groups[index]).__contains__
+    return [data_source._extract_run(task, select) for task in tasks]
+
+class DataSourceGenerator(logan.datasource.base.DataSourceGenerator):
+    def __call__(self):
+        args = self.logan_config.args
+        run_info_list = []
+        for path in args.dsrc_paths:
+            summary = generator.generate_tree(path,
+                    benchmarks=args.dsrc_syn_benchmarks,
+                    threads=args.dsrc_syn_threads,
+                    reps=args.dsrc_syn_reps,
+                    lines=args.dsrc_syn_lines,
+                    line_mix=args.dsrc_syn_line_mix,
+                    markers=args.dsrc_syn_markers,
+                    compress=args.dsrc_compress,
+                    seed=args.dsrc_syn_seed)
+            logging.info("Generated {runs} runs ({lines} lines, {bytes} bytes) in {root}".format(
+                **summary))
+            run_info_list.append({'root_directory_full' : path})
+        return run_info_list
+
+class DataSource(logan.datasource.base.DataSource):
+    def __init__(self, logan_config):
+        """
+        @type logan_config: LoganConfig
+        """
+        super(DataSource, self).__init__(logan_config)
+
+        # Maps dataset -> benchmark -> threads -> list of values of all
+        # repetitions.
+        self.results = {}
+
+        # With --follow, maps (tree root, run path) to the ExtractState of
+        # each run, which holds the result of the run.
+        self._follow_states = None
+
+    def _extract_run(self, task, select=None, state=None):
+        """
+        Task of the task farm; may run on any rank.
+
+        @task: Tuple of tree root and ResultRun.
+        @select: Predicate on the datasets to extract; defaults to the
+                 selected datasets.
+        @state: ExtractState of the run (--follow).
+        @return: dict mapping datasets to the result of the run.
+        """
+        root, run = task
+        datafiles = [resultindex.open_datafile(root, run, generator.DATAFILE)]
+        try:
+            return extract_data_from_files(datafiles, DATASETS, state=state,
+                                           select=select or self.dataset_selected)
+        finally:
+            for datafile in datafiles:
+                datafile['f'].close()
+
+    def _find_runs(self):
+        """
+        @return: List of tasks of the runs in all --dsrc-path trees.
+        """
+        tasks = []
+        for path in self.logan_config.args.dsrc_paths:
+            index = resultindex.ResultIndex(path)
+            index.refresh()
+            tasks.extend((index.root, run) for run in index.runs()
+                         if generator.DATAFILE in run.datafiles and
+                            'benchmark' in run.params and 'threads' in run.params)
+        return tasks
+
+    def _update_run(self, task):
+        """
+        Extracts the lines appended to the datafile of the run since the
+        previous call (--follow); the datafile is not opened if it did not
+        change.
+
+        @return: Set of the datasets whose result of the run changed.
+        """
+        root, run = task
+        key = (root, run.path)
+        if key not in self._follow_states:
+            self._follow_states[key] = ExtractState()
+        state = self._follow_states[key]
+
+        if state.file_unchanged(os.path.join(root, run.path, generator.DATAFILE),
+                                resultindex.datafile_path(root, run, generator.DATAFILE)):
+            return set()
+
+        self._extract_run(task, state=state)
+        return set(state.changed)
+
+    def _add_results(self, tasks, run_results):
+        for (_, run), result in zip(tasks, run_results):
+            benchmark, threads = run.params['benchmark'], run.params['threads']
+            for dataset, value in result.items():
+                self.results.setdefault(dataset, {}).setdefault(benchmark, {}) \
+                        .setdefault(threads, []).append(value)
+
+    def _stream_groups(self):
+        """
+        @return: List of lists of the selected datasets; datasets matching the
+                 same regular expressions are in the same group, so that each
+                 line is only matched once per expression.
+        """
+        groups = []
+        for dataset in sorted(DATASETS):
+            if not self.dataset_selected(dataset):
+                continue
+            patterns = set(regex.re for regex in DATASETS[dataset]['regexes'])
+            for group_patterns, group in groups:
+                if not group_patterns.isdisjoint(patterns):
+                    group_patterns.update(patterns)
+                    group.append(dataset)
+                    break
+            else:
+                groups.append((patterns, [dataset]))
+        return [group for _, group in groups]
+
+    def process(self):
+        args = self.logan_config.args
+        task_farm = distributed.get_task_farm(self.logan_config)
+
+        # Only the root loads the cache and finds the runs, and decides for
+        # all ranks whether the runs are processed: the workers wait in map
+        # until the root calls it.
+        cache_loaded = False
+        tasks = []
+        if task_farm.is_root():
+            try:
+                cache_loaded = args.dsrc_cache_load and \
+                        cache_load_pickle(args.dsrc_paths[0], self,
+                                          results="results") is not None
+                if not cache_loaded:
+                    tasks = self._find_runs()
+            except Exception:
+                task_farm.bcast(False)
+                task_farm.cancel()
+                raise
+        if task_farm.bcast(cache_loaded):
+            return True
+
+        if args.follow is not None:
+            # Not distributed (see main), so that the states stay here.
+            self._follow_states = collections.OrderedDict()
+            for task in tasks:
+                self._update_run(task)
+            run_results = [self._follow_states[(root, run.path)].result
+                           for root, run in tasks]
+        else:
+            try:
+                run_results = task_farm.map(self._extract_run, tasks)
+            except distributed.TaskError as e:
+                logging.error(str(e))
+                return False
+            if not task_farm.is_root():
+                return True
+
+        self.results = {}
+        self._add_results(tasks, run_results)
+
+        if not self.results:
+            logging.error("No synthetic runs found in {}".format(", ".join(args.dsrc_paths)))
+            return False
+
+        if args.dsrc_cache_save:
+            if args.datasets is not None:
+                logging.warning("Not saving cache of selected datasets only.")
+            else:
+                cache_save_pickle(args.dsrc_paths[0], results=self.results)
+
+        return True
+
+    def process_datasets(self):
+        """
+        Extracts the runs once per group of datasets (see _stream_groups), and
+        yields the datasets of each group once extracted, so that they are
+        rendered before the remaining groups are extracted. With -j, the
+        groups are extracted in forked worker processes while the datasets
+        are rendered. Each group reads the runs again: without -j, the first
+        datasets are rendered earlier, but processing takes longer overall.
+        With --dsrc-mpi, the cache or --follow, all datasets are processed at
+        once.
+        """
+        global _stream_extract
+
+        args = self.logan_config.args
+        if distributed.get_task_farm(self.logan_config).size > 1 or \
+                args.dsrc_cache_load or args.dsrc_cache_save or args.follow is not None:
+            for dataset in super(DataSource, self).process_datasets():
+                yield dataset
+            return
+
+        tasks = self._find_runs()
+        if not tasks:
+            raise logan.datasource.base.ProcessError("No synthetic runs found in {}".format(
+                ", ".join(args.dsrc_paths)))
+
+        groups = self._stream_groups()
+        jobs = min(args.jobs, len(groups))
+        fork_context = logan.compat.get_fork_context() if jobs > 1 else None
+
+        self.results = {}
+        _stream_extract = (self, tasks, groups)
+        pool = None
+        try:
+            if fork_context is not None:
+                pool = fork_context.Pool(processes=jobs)
+                group_results = pool.imap(_extract_group, range(len(groups)))
+                pool.close()
+            else:
+                group_results = (_extract_group(index) for index in range(len(groups)))
+
+            for group, run_results in zip(groups, group_results):
+                self._add_results(tasks, run_results)
+                for dataset in group:
+                    if dataset in self.results:
+                        yield dataset
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+            _stream_extract = None
+
+    @classmethod
+    def supports_update(cls):
+        return True
+
+    def update(self):
+        """
+        Refreshes the index of the trees for new runs, and extracts the lines
+        appended to the datafiles of all runs since process or the previous
+        update; unchanged datafiles are not opened. If process loaded the
+        cache, the first update extracts all runs.
+        """
+        tasks = self._find_runs()
+        if self._follow_states is None:
+            self._follow_states = collections.OrderedDict()
+
+        changed = set()
+        keys = frozenset((root, run.path) for root, run in tasks)
+        for key in list(self._follow_states):
+            if key not in keys:
+                # Run removed
+                changed.update(self._follow_states.pop(key).result)
+
+        for task in tasks:
+            changed |= self._update_run(task)
+
+        if changed:
+            self.generation += 1
+            self.results = {}
+            self._add_results(tasks, [self._follow_states[(root, run.path)].result
+                                      for root, run in tasks])
+
+        return sorted(changed)
+
+    def release_dataset(self, dataset):
+        self.results.pop(dataset, None)
+
+    def map_to_name(self, key):
+        return NAMES.get(key, str(key))
+
+    def get_dataset_keys(self):
+        return sorted(self.results)
+
+    def get_description(self, dataset=None):
+        return "Synthetic benchmark"
+
+    def get_ylabel(self, dataset=None):
+        return self.map_to_name(dataset)
+
+    def get_xlabel(self, dataset=None):
+        return "Threads"
+
+    def get_xtick_keys(self, dataset=None):
+        return sorted(frozenset(threads for benchmark in self.results[dataset].values()
+                                for threads in benchmark))
+
+    def get_cluster_keys(self, dataset=None):
+        return sorted(self.results[dataset])
+
+    def query_data(self, x, z=0, stack=None, cluster=None, dataset=None):
+        values = self.results[dataset][cluster].get(x)
+        if not values:
+            return DataPoint(y=0)
+
+        y = sum(values) / float(len(values))
+        if self.logan_config.args.dsrc_ranges:
+            return DataPoint(y=y, y_err=(y - min(values), max(values) - y))
+        return DataPoint(y=y)
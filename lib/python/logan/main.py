@@ -5,24 +5,33 @@ Log Analyser main file.
 """
 
 import sys
-import argparse
 import time
-import imp
+
+# Before importing anything else, to trace import time.
+_import_start = time.time()
+
+import argparse
 import os
+import atexit
 import logging
-import pipes
-import datetime
 
 import logan
-import logan.datasource.base
-import logan.dataoutput.base
 import logan.compat
+import logan.registry
+import logan.daemon
+import logan.trace
+import logan.profiling
 
 class LoganConfig(object):
     """
     Configuration class which maintains the global configuration of the program.
     """
-    def __init__(self):
+    def __init__(self, argv=None):
+        """
+        @argv: Arguments (without program name); defaults to sys.argv[1:].
+        """
+        self._argv = sys.argv[1:] if argv is None else argv
+
         self._parser = argparse.ArgumentParser(prog="logan",
                 description="Logan: The Universal LOG and Data ANalyser framework.")
         self._parser.add_argument("-s", "--datasource", metavar="DS", type=str,
@@ -52,11 +61,39 @@ class LoganConfig(object):
         self._parser.add_argument("-m", "--message", metavar="MSG", type=str,
                 dest="message", default=None,
                 help="Provide message to describe data, if supported by datasource/dataoutput.")
+        self._parser.add_argument("--stream", action="store_true",
+                dest="stream", default=False,
+                help="Render each dataset as soon as the datasource has it ready, if supported by datasource/dataoutput.")
+        self._parser.add_argument("--follow", metavar="SECS", type=float,
+                dest="follow", default=None,
+                help="Follow mode: after generating outputs, check for new source data every SECS seconds and regenerate outputs of changed datasets; rejected if the datasource does not support updates.")
+        self._parser.add_argument("--datasets", metavar="PATTERN", type=str,
+                dest="datasets", default=None, nargs="+",
+                help="Only process and output datasets matching any of the (shell-style) patterns; processing is only restricted if supported by datasource.")
+        self._parser.add_argument("--daemon", action="store_true",
+                dest="daemon", default=False,
+                help="Process data once, then serve dataoutput requests on the daemon socket.")
+        self._parser.add_argument("--daemon-socket", metavar="PATH", type=str,
+                dest="daemon_socket", default=os.environ.get(logan.daemon.DAEMON_SOCKET_ENV),
+                help="Daemon socket; if set, requests are served by a running daemon, if possible. [Default:${}]".format(
+                    logan.daemon.DAEMON_SOCKET_ENV))
+        self._parser.add_argument("--trace", metavar="FILE", type=str,
+                dest="trace", default=None,
+                help="Trace phases of the run and write Chrome trace-event JSON to FILE; logs a summary. With --dsrc-mpi, ranks other than the root write FILE with .rankN before the extension.")
+        self._parser.add_argument("--profile-cpu", action="store_true",
+                dest="profile_cpu", default=False,
+                help="Profile each stage (generation, processing, each dataoutput) with cProfile; writes .pstats files to OUTPATH/profile.")
+        self._parser.add_argument("--profile-mem", action="store_true",
+                dest="profile_mem", default=False,
+                help="Trace allocations of each stage with tracemalloc; writes top allocations to OUTPATH/profile.")
+        self._parser.add_argument("--profile-top", metavar="N", type=int,
+                dest="profile_top", default=25,
+                help="Number of top allocations to write with --profile-mem. [Default:25]")
         self._parser.add_argument("-M", "--gen-script", action="store_true",
                 dest="gen_script", default=False,
                 help="Generate script to re-run logan with the same parameters.")
 
-        args_nohelp = sys.argv[:]
+        args_nohelp = self._argv[:]
         for help_str in ["--help", "-h"]:
             if help_str in args_nohelp:
                 args_nohelp.remove(help_str)
@@ -80,7 +117,20 @@ class LoganConfig(object):
         logging.basicConfig(level=loglevel,format='[Logan:%(levelname)s] %(message)s')
 
     def parse_args(self):
-        self.args = self._parser.parse_args()
+        self.args = self._parser.parse_args(self._argv)
+
+    def error(self, message):
+        """
+        Reports an invalid combination of arguments and exits.
+        """
+        self._parser.error(message)
+
+    def get_argv(self):
+        """
+        @return: Arguments (without program name) the configuration was
+                 created with.
+        """
+        return self._argv
 
     def add_argument(self, *args, **kwargs):
         """
@@ -106,29 +156,25 @@ def list_datamodules():
     """
     Lists available datasources and dataoutputs with description.
     """
-    for xend in ["datasource", "dataoutput"]:
+    for xend in logan.registry.KINDS:
         print("------------------------------------------------------")
         print("{}:".format(xend))
-        filename, pathname, description = imp.find_module("logan/{}".format(xend))
-        if filename is None: # is package
-            modules = (os.path.splitext(module)[0] for module in os.listdir(pathname) \
-                    if not module.startswith("__init__") and not module == "__pycache__" and \
-                        (module.endswith((".py", ".pyc", ".pyo")) or \
-                            os.path.isdir(os.path.join(pathname, module))) )
-
-            # using set, so that it returns only one element per module,
-            # as there could be .py, .pyc and/or .pyo files of same module.
-            for name in sorted(frozenset(modules)):
-                try:
-                    temp_module = __import__("logan.{}.{}".format(xend, name),
-                            fromlist=["get_description"])
-                    print("    {}  {}".format(name.ljust(15),
-                        temp_module.get_description()[0]))
-                except:
-                    pass
+        for name, summary in logan.registry.list_modules(xend):
+            print("    {}  {}".format(name.ljust(15), summary))
     print("------------------------------------------------------")
 
+def load_base_modules():
+    """
+    Imports the base datamodules; deferred, so that --list does not need to
+    import them.
+    """
+    import logan.datasource.base
+    import logan.datasource.distributed
+    import logan.dataoutput.base
+
 def gen_make_script(logan_config):
+    import pipes
+    import datetime
     import lancet
     vcs_info = lancet.vcs_metadata([logan.BASEPATH])
 
@@ -177,23 +223,174 @@ cd {}
             script_file.write(make_script_code)
             logging.info("Written {}".format(make_script))
 
-def main(argv):
-    the_time = time.time()
-    def show_elapsed_time():
-        logging.info("Elapsed time: {:.2f} sec".format(time.time() - the_time))
+# Set before forking the dataoutput workers, so that they inherit the
+# processed DataSource instead of having it pickled.
+_concurrent_outputs = None
 
-    logan_config = LoganConfig()
+def _output_stage_name(data_output):
+    return "generate-" + data_output.__class__.__module__.split(".")[-1]
 
-    logging.debug("Python {}".format(sys.version.replace("\n", "\n              ")))
+def _generate_output(index):
+    """
+    @return: Tuple of success, and the trace events of the worker.
+    """
+    data_source, data_outputs = _concurrent_outputs
+    data_output = data_outputs[index]
+    try:
+        with logan.trace.span("generate", output=data_output.__class__), \
+                logan.profiling.stage(data_output.logan_config, _output_stage_name(data_output)):
+            result = data_output.generate(data_source)
+    except Exception:
+        logging.exception("Dataoutput analysis generation with {} raised:".format(
+            data_outputs[index].__class__))
+        result = False
+    return (result, logan.trace.take_events())
+
+def generate_outputs(logan_config, data_source, data_outputs):
+    """
+    Generates all dataoutputs from the processed data_source; concurrently in
+    forked worker processes with --dout-concurrent.
 
-    if logan_config.args.list_datamodules:
-        list_datamodules()
-        return 0
+    @return: True if all dataoutputs succeeded.
+    """
+    global _concurrent_outputs
 
-    # Load modules
-    datasource_module = logan_config.get_datasource_module()
-    dataoutput_modules = logan_config.get_dataoutput_modules()
+    jobs = min(logan_config.args.jobs, len(data_outputs))
+    fork_context = logan.compat.get_fork_context()
+    if not logan_config.args.dout_concurrent or jobs <= 1 or fork_context is None:
+        if logan_config.args.dout_concurrent and fork_context is None:
+            logging.warning("Concurrent dataoutputs require fork, running serially.")
+
+        for data_output in data_outputs:
+            logging.info("Initiating dataoutput analysis generation with {} ...".format(
+                data_output.__class__))
+            with logan.trace.span("generate", output=data_output.__class__), \
+                    logan.profiling.stage(logan_config, _output_stage_name(data_output)):
+                success = data_output.generate(data_source)
+            if not success:
+                logging.critical("Dataoutput analysis generation with {} failed! Aborting ...".format(
+                    data_output.__class__))
+                return False
+        return True
+
+    logging.info("Initiating dataoutput analysis generation with {} in {} processes ...".format(
+        ", ".join(str(data_output.__class__) for data_output in data_outputs), jobs))
+
+    _concurrent_outputs = (data_source, data_outputs)
+    pool = fork_context.Pool(processes=jobs)
+    try:
+        pending = [pool.apply_async(_generate_output, (i,))
+                   for i in range(len(data_outputs))]
+        pool.close()
+
+        success = True
+        for data_output, result in zip(data_outputs, pending):
+            output_success, events = result.get()
+            logan.trace.add_events(events)
+            if output_success:
+                logging.info("Dataoutput analysis generation with {} done.".format(
+                    data_output.__class__))
+            else:
+                logging.critical("Dataoutput analysis generation with {} failed!".format(
+                    data_output.__class__))
+                success = False
+    finally:
+        pool.terminate()
+        pool.join()
+        _concurrent_outputs = None
+
+    return success
+
+def stream_outputs(logan_config, data_source, data_outputs):
+    """
+    Processes the data_source in streaming mode: dataoutputs which support
+    streaming render each dataset as soon as it is ready. The remaining
+    dataoutputs are generated after all datasets were processed.
+
+    @return: True if processing and all dataoutputs succeeded.
+    """
+    streaming_outputs = [data_output for data_output in data_outputs
+                         if data_output.supports_streaming()]
+    other_outputs = [data_output for data_output in data_outputs
+                     if not data_output.supports_streaming()]
+
+    logging.info("Initiating datasource data processing with {} (streaming to {}) ...".format(
+        data_source.__class__,
+        ", ".join(str(data_output.__class__) for data_output in streaming_outputs) or "none"))
+    try:
+        with logan.profiling.stage(logan_config, "stream"):
+            for dataset in data_source.process_datasets():
+                for data_output in streaming_outputs:
+                    with logan.trace.span("generate_dataset", output=data_output.__class__,
+                                          dataset=dataset):
+                        success = data_output.generate_dataset(data_source, dataset)
+                    if not success:
+                        logging.critical("Dataoutput analysis generation with {} failed for {}! Aborting ...".format(
+                            data_output.__class__, dataset))
+                        return False
+
+                # Data of datasets is only needed until all outputs are done.
+                if not other_outputs:
+                    data_source.release_dataset(dataset)
+    except logan.datasource.base.ProcessError as e:
+        logging.critical("{} Aborting ...".format(e))
+        return False
+    logging.info("Datasource data processing done.")
+
+    for data_output in streaming_outputs:
+        if not data_output.generate_finish(data_source):
+            logging.critical("Dataoutput analysis generation with {} failed! Aborting ...".format(
+                data_output.__class__))
+            return False
 
+    if other_outputs:
+        return generate_outputs(logan_config, data_source, other_outputs)
+
+    return True
+
+def follow_outputs(logan_config, data_source, data_outputs):
+    """
+    Follow mode: periodically update the data_source with new source data,
+    and regenerate the outputs for changed datasets; dataoutputs which do not
+    support streaming are regenerated completely. Returns on interrupt.
+
+    @return: True if all updates and dataoutputs succeeded.
+    """
+    logging.info("Following source data every {} sec (interrupt to stop) ...".format(
+        logan_config.args.follow))
+    try:
+        while True:
+            time.sleep(logan_config.args.follow)
+
+            with logan.trace.span("update"):
+                changed = data_source.update()
+            if changed is None:
+                logging.warning("Datasource {} does not support updates, not following.".format(
+                    data_source.__class__))
+                return True
+            if not changed:
+                continue
+
+            logging.info("Changed datasets: {}".format(", ".join(str(c) for c in changed)))
+            for data_output in data_outputs:
+                if data_output.supports_streaming():
+                    success = all(data_output.generate_dataset(data_source, dataset)
+                                  for dataset in changed) and \
+                              data_output.generate_finish(data_source)
+                else:
+                    success = data_output.generate(data_source)
+
+                if not success:
+                    logging.critical("Dataoutput analysis generation with {} failed! Aborting ...".format(
+                        data_output.__class__))
+                    return False
+    except KeyboardInterrupt:
+        logan.compat.print_blank()
+        logging.info("Stopped following.")
+
+    return True
+
+def register_module_arguments(logan_config, datasource_module, dataoutput_modules):
     # Always register base arguments (but only once)
     logan.datasource.base.register_arguments(logan_config)
     logan.dataoutput.base.register_arguments(logan_config)
@@ -205,15 +402,147 @@ def main(argv):
         if dataoutput_module is not logan.dataoutput.base:
             dataoutput_module.register_arguments(logan_config)
 
-    # Get all args
+def make_data_outputs(logan_config, dataoutput_modules):
+    data_outputs = []
+    for dataoutput_module in dataoutput_modules:
+        data_output = dataoutput_module.DataOutput(logan_config)
+        if not isinstance(data_output, logan.dataoutput.base.DataOutput):
+            raise Exception("{} not based on dataoutput.base.DataOutput".format(
+                dataoutput_module.DataOutput))
+        data_outputs.append(data_output)
+    return data_outputs
+
+def select_datasets(logan_config, data_source):
+    """
+    @return: data_source, restricted to the datasets selected with --datasets.
+    """
+    if logan_config.args.datasets is None:
+        return data_source
+    return logan.datasource.base.DatasetSelection(data_source, logan_config.args.datasets)
+
+def serve_daemon_request(daemon_config, data_source, argv):
+    """
+    Generates the dataoutputs requested by argv from the processed
+    data_source of the daemon.
+
+    @return: Exit status, or reason why the request must be run locally.
+    """
+    logan_config = LoganConfig(argv)
+    # Tracing and profiling apply to the whole process, and streaming to the
+    # datasource's processing, which the daemon has already done.
+    for arg in ["list_datamodules", "daemon", "follow", "gen_script", "stream",
+                "trace", "profile_cpu", "profile_mem"]:
+        if getattr(logan_config.args, arg):
+            return "unsupported option: {}".format(arg)
+    if logan_config.args.datasource != daemon_config.args.datasource:
+        return "different datasource"
+    if daemon_config.args.datasets is not None and \
+            logan_config.args.datasets != daemon_config.args.datasets:
+        # The daemon only processed its selected datasets.
+        return "different dataset selection"
+
+    datasource_module = daemon_config.get_datasource_module()
+    dataoutput_modules = logan_config.get_dataoutput_modules()
+    register_module_arguments(logan_config, datasource_module, dataoutput_modules)
     logan_config.parse_args()
 
+    # Relative to the cwd of the request (the daemon's paths are absolute).
+    logan_config.args.dsrc_paths = [os.path.abspath(path)
+                                    for path in logan_config.args.dsrc_paths]
+
+    # Datasource options are prefixed with dsrc_
+    for arg, value in vars(daemon_config.args).items():
+        if arg.startswith("dsrc_") and getattr(logan_config.args, arg, None) != value:
+            return "different datasource option: {}".format(arg)
+
+    data_outputs = make_data_outputs(logan_config, dataoutput_modules)
+    if not generate_outputs(logan_config, select_datasets(logan_config, data_source),
+                            data_outputs):
+        return 1
+
+    logging.info("Output generation done.")
+    return 0
+
+def finish_trace(filename):
+    """
+    Writes the trace at exit; with --dsrc-mpi, each rank to its own file
+    (see logan.trace.finish).
+    """
+    distributed = sys.modules.get("logan.datasource.distributed")
+    logan.trace.finish(filename, distributed.get_rank() if distributed is not None else 0)
+
+def mpi_worker_main(logan_config, datasource_module):
+    """
+    Main of the MPI ranks other than the root (--dsrc-mpi): serve the tasks of
+    the datasource's processing, then exit; the dataoutputs are only generated
+    on the root.
+    """
+    task_farm = logan.datasource.distributed.get_task_farm(logan_config)
+    task_farm.barrier()
+    if logan_config.args.dsrc_gen_data_only:
+        return 0
+
+    # Only warn from workers (they process the same datasets as the root).
+    logging.getLogger().setLevel(max(logging.getLogger().level, logging.WARNING))
+
+    data_source = datasource_module.DataSource(logan_config)
+    if not data_source.process():
+        logging.critical("Datasource data processing with {} failed on rank {}!".format(
+            data_source.__class__, task_farm.rank))
+        return 1
+    return 0
+
+def main(argv):
+    the_time = time.time()
+    def show_elapsed_time():
+        logging.info("Elapsed time: {:.2f} sec".format(time.time() - the_time))
+
+    logan_config = LoganConfig()
+
+    if logan_config.args.trace is not None:
+        logan.trace.enable()
+        logan.trace.add_complete("import", _import_start, the_time)
+        logan.trace.add_complete("parse base arguments", the_time, time.time())
+        atexit.register(finish_trace, logan_config.args.trace)
+
+    logging.debug("Python {}".format(sys.version.replace("\n", "\n              ")))
+
+    if logan_config.args.list_datamodules:
+        list_datamodules()
+        return 0
+
+    if logan_config.args.daemon_socket is not None and not logan_config.args.daemon and \
+            not any(help_str in argv for help_str in ["--help", "-h"]):
+        status = logan.daemon.request(logan_config.args.daemon_socket, argv[1:])
+        if status is not None:
+            return status
+
+    # Load modules
+    with logan.trace.span("load modules"):
+        load_base_modules()
+        datasource_module = logan_config.get_datasource_module()
+        dataoutput_modules = logan_config.get_dataoutput_modules()
+
+    with logan.trace.span("parse arguments"):
+        register_module_arguments(logan_config, datasource_module, dataoutput_modules)
+
+        # Get all args
+        logan_config.parse_args()
+
+        if logan_config.args.follow is not None:
+            if not datasource_module.DataSource.supports_update():
+                logan_config.error("--follow: datasource {} does not support updates".format(
+                    logan_config.args.datasource))
+            if logan_config.args.dsrc_mpi:
+                logan_config.error("--follow: not supported with --dsrc-mpi")
+
     # Show selected datamodules information
     if logan_config.args.show_datamodules:
         print("-" * 79)
         logan.compat.print_blank()
-        for summary, description in [datasource_module.get_description(),
-                dataoutput_module.get_description()]:
+        for summary, description in [datasource_module.get_description()] + \
+                [dataoutput_module.get_description() for dataoutput_module in
+                 sorted(dataoutput_modules, key=lambda module: module.__name__)]:
 
             if None in [summary, description]:
                 continue
@@ -226,6 +555,12 @@ def main(argv):
         print("-" * 79)
         logan.compat.print_blank()
 
+    task_farm = None
+    if logan_config.args.dsrc_mpi:
+        task_farm = logan.datasource.distributed.get_task_farm(logan_config)
+        if not task_farm.is_root():
+            return mpi_worker_main(logan_config, datasource_module)
+
     # Generate outputs from source
     if logan_config.args.dsrc_gen_data != 0 or logan_config.args.dsrc_gen_data_only:
         # gen_data_only implies gen_data
@@ -238,7 +573,9 @@ def main(argv):
 
         logging.info("Initiating datasource data generation ...")
         try:
-            run_info_list = data_source_generator()
+            with logan.trace.span("generate source data"), \
+                    logan.profiling.stage(logan_config, "generate-source-data"):
+                run_info_list = data_source_generator()
             logging.info("Datasource data generation done.")
         except KeyboardInterrupt:
             run_info_list = None
@@ -269,6 +606,10 @@ def main(argv):
 
         show_elapsed_time()
 
+    if task_farm is not None:
+        # Workers wait for source data generation on the root.
+        task_farm.barrier()
+
     if not logan_config.args.dsrc_gen_data_only:
         # Setup source/output processors
         data_source = datasource_module.DataSource(logan_config)
@@ -276,34 +617,62 @@ def main(argv):
             raise Exception("{} not based on datasource.base.DataSource".format(
                 datasource_module.DataSource))
 
-        data_outputs = []
-        for dataoutput_module in dataoutput_modules:
-            data_output = dataoutput_module.DataOutput(logan_config)
-            if not isinstance(data_output, logan.dataoutput.base.DataOutput):
-                raise Exception("{} not based on dataoutput.base.DataOutput".format(
-                    dataoutput_module.DataOutput))
-            data_outputs.append(data_output)
-
-        logging.info("Initiating datasource data processing with {} ...".format(
-            data_source.__class__))
-        if not data_source.process():
-            logging.critical("Datasource data processing with {} failed! Aborting ...".format(
+        data_outputs = make_data_outputs(logan_config, dataoutput_modules)
+
+        if logan_config.args.daemon:
+            if logan_config.args.daemon_socket is None:
+                logging.critical("No daemon socket specified! Aborting ...")
+                return 1
+
+            # Requests are served in their own cwd, and compare their paths
+            # after making them absolute.
+            logan_config.args.dsrc_paths = [os.path.abspath(path)
+                                            for path in logan_config.args.dsrc_paths]
+
+            logging.info("Initiating datasource data processing with {} ...".format(
                 data_source.__class__))
-            return 1
-        logging.info("Datasource data processing done.")
+            with logan.trace.span("process"), \
+                    logan.profiling.stage(logan_config, "process"):
+                success = data_source.process()
+            if not success:
+                logging.critical("Datasource data processing with {} failed! Aborting ...".format(
+                    data_source.__class__))
+                return 1
+            logging.info("Datasource data processing done.")
+            show_elapsed_time()
 
-        for data_output in data_outputs:
-            logging.info("Initiating dataoutput analysis generation with {} ...".format(
-                data_output.__class__))
-            if not data_output.generate(data_source):
-                logging.critical("Dataoutput analysis generation with {} failed! Aborting ...".format(
-                    data_output.__class__))
+            logan.daemon.serve(logan_config.args.daemon_socket,
+                    lambda request_argv: serve_daemon_request(logan_config, data_source,
+                                                              request_argv))
+            return 0
+
+        selected_data_source = select_datasets(logan_config, data_source)
+        if logan_config.args.stream:
+            if not stream_outputs(logan_config, selected_data_source, data_outputs):
+                return 1
+        else:
+            logging.info("Initiating datasource data processing with {} ...".format(
+                data_source.__class__))
+            with logan.trace.span("process"), \
+                    logan.profiling.stage(logan_config, "process"):
+                success = data_source.process()
+            if not success:
+                logging.critical("Datasource data processing with {} failed! Aborting ...".format(
+                    data_source.__class__))
+                return 1
+            logging.info("Datasource data processing done.")
+
+            if not generate_outputs(logan_config, selected_data_source, data_outputs):
                 return 1
 
         logging.info("Output generation done.")
 
         show_elapsed_time()
 
+        if logan_config.args.follow is not None:
+            if not follow_outputs(logan_config, selected_data_source, data_outputs):
+                return 1
+
     # Reproducability!
     if logan_config.args.gen_script:
         gen_make_script(logan_config)
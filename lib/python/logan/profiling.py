@@ -0,0 +1,143 @@
+"""
+Per-stage CPU and memory profiling.
+
+With --profile-cpu, each stage (source data generation, processing, each
+dataoutput) is run under cProfile, and the statistics are written to
+<dout-path>/profile/<stage>.pstats (inspect with python -m pstats). With
+--profile-mem, allocations are traced with tracemalloc, and the top
+allocations of each stage are written to <dout-path>/profile/<stage>.mem.txt.
+With either option, the peak RSS of each stage is logged: on Linux, the peak
+is reset at the start of each stage (see _reset_peak_rss); elsewhere, the
+peak RSS of the process so far is logged, with its increase during the
+stage.
+
+If neither option is given, stage returns a no-op context manager.
+"""
+
+import os
+import logging
+
+class _NullStage(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+def _peak_rss_mb():
+    """
+    @return: Peak RSS [MiB] since the start of the process, or since the last
+             _reset_peak_rss on Linux.
+    """
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024.0
+    except (IOError, OSError, ValueError):
+        pass
+
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    # ru_maxrss is in KiB on Linux, but in bytes on macOS.
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if os.uname()[0] == "Darwin":
+        return maxrss / (1024.0 * 1024.0)
+    return maxrss / 1024.0
+
+def _reset_peak_rss():
+    """
+    Resets the peak RSS (VmHWM) of the process to its current RSS; only
+    supported on Linux.
+
+    @return: True if reset.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except (IOError, OSError):
+        return False
+
+class _ProfiledStage(object):
+    def __init__(self, args, name):
+        self.args = args
+        self.name = name
+        self.path_prefix = os.path.join(args.dout_path, "profile", name)
+
+    def __enter__(self):
+        if not os.path.exists(os.path.dirname(self.path_prefix)):
+            os.makedirs(os.path.dirname(self.path_prefix))
+
+        self.peak_rss_reset = _reset_peak_rss()
+        self.start_peak_rss = _peak_rss_mb()
+
+        if self.args.profile_mem:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            if hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+            self.start_snapshot = tracemalloc.take_snapshot()
+
+        if self.args.profile_cpu:
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.args.profile_cpu:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.path_prefix + ".pstats")
+            logging.info("(profile) Written {}.pstats".format(self.path_prefix))
+
+        report = ["Stage {}:".format(self.name)]
+
+        if self.args.profile_mem:
+            import tracemalloc
+            snapshot = tracemalloc.take_snapshot()
+            _, traced_peak = tracemalloc.get_traced_memory()
+
+            with open(self.path_prefix + ".mem.txt", "w") as f:
+                f.write("# Top {} allocations during stage {} (size difference, by line)\n".format(
+                    self.args.profile_top, self.name))
+                for stat in snapshot.compare_to(self.start_snapshot, "lineno")[:self.args.profile_top]:
+                    f.write("{}\n".format(stat))
+
+                f.write("\n# Top {} allocations alive after stage {} (by line)\n".format(
+                    self.args.profile_top, self.name))
+                for stat in snapshot.statistics("lineno")[:self.args.profile_top]:
+                    f.write("{}\n".format(stat))
+            logging.info("(profile) Written {}.mem.txt".format(self.path_prefix))
+
+            report.append("traced peak {:.1f} MiB".format(traced_peak / (1024.0 * 1024.0)))
+
+        peak_rss = _peak_rss_mb()
+        if peak_rss is not None:
+            if self.peak_rss_reset:
+                report.append("peak RSS {:.1f} MiB".format(peak_rss))
+            else:
+                # Stages after the one with the highest peak would all report
+                # the same peak.
+                report.append("process peak RSS so far {:.1f} MiB (+{:.1f} MiB during stage)".format(
+                    peak_rss, peak_rss - self.start_peak_rss))
+
+        logging.info("(profile) " + " ".join(report))
+        return False
+
+def stage(logan_config, name):
+    """
+    @return: Context manager profiling the stage with name, according to the
+             profiling options.
+    """
+    args = logan_config.args
+    if not (args.profile_cpu or args.profile_mem):
+        return _NULL_STAGE
+    return _ProfiledStage(args, name)
@@ -0,0 +1,148 @@
+"""
+Registry of available datasource and dataoutput modules.
+
+The one-line descriptions of the modules are cached in a manifest, which is
+only regenerated for modules whose files changed. Listing the available
+modules therefore does not import them (and their heavy dependencies, such
+as matplotlib or NumPy) on every invocation.
+"""
+
+import os
+import sys
+import json
+import logging
+import importlib
+
+import logan
+
+KINDS = ["datasource", "dataoutput"]
+
+MANIFEST_PATH = os.environ.get("LOGAN_MANIFEST",
+        os.path.join(os.environ.get("XDG_CACHE_HOME",
+                                    os.path.join(os.path.expanduser("~"), ".cache")),
+                     "logan", "manifest.json"))
+
+class LazyModule(object):
+    """
+    Proxy for a module, which is only imported on first attribute access.
+    Use for heavy dependencies, which are not needed to register arguments or
+    describe a module.
+    """
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        if self._module is None:
+            self.__dict__['_module'] = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+def lazy_import(name):
+    """
+    @return: LazyModule for module name, or the module itself if it is
+             already imported.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
+
+def _module_files(kind):
+    """
+    @return: dict mapping module names of kind to the mtime of the file
+             defining the module.
+    """
+    pathname = os.path.join(os.path.dirname(logan.__file__), kind)
+    result = {}
+    for entry in os.scandir(pathname):
+        name, ext = os.path.splitext(entry.name)
+        if name.startswith("__init__") or entry.name == "__pycache__" or \
+                name.startswith("."):
+            continue
+
+        if entry.is_dir():
+            init_path = os.path.join(entry.path, "__init__.py")
+            if os.path.exists(init_path):
+                result[entry.name] = os.stat(init_path).st_mtime
+        elif ext in (".py", ".pyc", ".pyo"):
+            # Multiple files of the same module could exist; use the newest.
+            result[name] = max(result.get(name, 0), entry.stat().st_mtime)
+
+    return result
+
+def _load_manifest():
+    try:
+        with open(MANIFEST_PATH, "r") as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+
+def _save_manifest(manifest):
+    tmp_path = "{}.{}.tmp".format(MANIFEST_PATH, os.getpid())
+    try:
+        if not os.path.exists(os.path.dirname(MANIFEST_PATH)):
+            os.makedirs(os.path.dirname(MANIFEST_PATH))
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.rename(tmp_path, MANIFEST_PATH)
+    except (IOError, OSError) as e:
+        logging.debug("Could not save manifest {}: {}".format(MANIFEST_PATH, e))
+        try:
+            os.remove(tmp_path)
+        except (IOError, OSError):
+            pass
+
+def _describe(kind, name):
+    """
+    Imports module to query its description.
+
+    @return: Summary, or None if the module is not a datamodule.
+    @raise Exception: If the module cannot be imported or described (e.g. an
+                      optional dependency is missing).
+    """
+    module = importlib.import_module("logan.{}.{}".format(kind, name))
+    if not hasattr(module, "get_description"):
+        return None
+    return module.get_description()[0]
+
+def list_modules(kind):
+    """
+    @return: List of (name, summary) tuples of available modules of kind,
+             sorted by name.
+    """
+    manifest = _load_manifest()
+    # Several installations may share the manifest.
+    package_key = os.path.dirname(os.path.abspath(logan.__file__))
+    entries = manifest.setdefault(package_key, {}).setdefault(kind, {})
+
+    module_files = _module_files(kind)
+    updated = False
+    for name, mtime in module_files.items():
+        if name not in entries or entries[name]['mtime'] != mtime:
+            try:
+                summary = _describe(kind, name)
+            except Exception as e:
+                # Not cached, so that the module is described once it can be
+                # imported, even if its file did not change.
+                logging.debug("Could not describe {} module {}: {}".format(kind, name, e))
+                if entries.pop(name, None) is not None:
+                    updated = True
+                continue
+            entries[name] = {'mtime' : mtime, 'summary' : summary}
+            updated = True
+
+    for name in list(entries):
+        if name not in module_files:
+            del entries[name]
+            updated = True
+
+    if updated:
+        _save_manifest(manifest)
+
+    return [(name, entries[name]['summary']) for name in sorted(entries)
+            if entries[name]['summary'] is not None]
@@ -0,0 +1,176 @@
+"""
+MPI task farm, using a task pull scheme.
+
+Inspired by
+https://raw.githubusercontent.com/jbornschein/mpi4py-examples/master/09-task-pull.py
+
+Rank 0 hands out tasks to the ranks which are ready, and collects their
+results. Used by the distributed datasources (see
+logan.datasource.distributed) and by launch_scripts/ARCHER/mpi_tf_worker.py;
+the latter runs with the Python version of the cluster, so this module must
+stay compatible with Python 2, and must not import other logan modules.
+"""
+
+import logging
+import traceback
+
+# Have the master execute tasks as well or not
+MASTER_TASK = True
+
+class Tags(object):
+    READY = 0x1
+    DONE  = 0x2
+    EXIT  = 0x4
+    START = 0x8
+
+class TaskError(Exception):
+    pass
+
+class TaskFarm(object):
+    def __init__(self, use_mpi=False):
+        """
+        @use_mpi: Distribute over the ranks of MPI.COMM_WORLD; requires
+                  mpi4py.
+        """
+        self.comm = None
+        self.rank = 0
+        self.size = 1
+
+        if use_mpi:
+            try:
+                from mpi4py import MPI
+            except ImportError:
+                raise Exception("MPI processing requires mpi4py!")
+
+            self.MPI = MPI
+            self.comm = MPI.COMM_WORLD
+            self.rank = self.comm.Get_rank()
+            self.size = self.comm.Get_size()
+            logging.debug("Task farm rank {} of {}".format(self.rank, self.size))
+
+    def is_root(self):
+        return self.rank == 0
+
+    def barrier(self):
+        if self.comm is not None:
+            self.comm.Barrier()
+
+    def bcast(self, value):
+        """
+        Must be called by all ranks.
+
+        @return: value of rank 0.
+        """
+        if self.comm is None:
+            return value
+        return self.comm.bcast(value, root=0)
+
+    def cancel(self):
+        """
+        Releases the workers waiting in map; called on rank 0 instead of map,
+        if the tasks cannot be produced. No-op on all other ranks.
+        """
+        if self.size > 1 and self.is_root():
+            self._master(None, [], None)
+
+    def map(self, function, tasks, on_result=None):
+        """
+        Calls function on each task; must be called by all ranks with the
+        same function. Tasks and results must be picklable.
+
+        @tasks: List of tasks; only used on rank 0.
+        @on_result: Called on rank 0 with the index and result of each task
+                    as soon as it completed, e.g. to record progress.
+        @return: On rank 0, list of results in the order of tasks; None on
+                 all other ranks.
+        @raise TaskError: On rank 0, if any task raised; on a single rank,
+                          the exception of the task is raised.
+        """
+        if self.size == 1:
+            return [self._run(function, index, task, on_result)
+                    for index, task in enumerate(tasks)]
+
+        if self.is_root():
+            return self._master(function, tasks, on_result)
+
+        self._worker(function)
+        return None
+
+    @staticmethod
+    def _run(function, index, task, on_result):
+        result = function(task)
+        if on_result is not None:
+            on_result(index, result)
+        return result
+
+    def _master(self, function, tasks, on_result):
+        status = self.MPI.Status()
+        results = [None] * len(tasks)
+        errors = []
+        next_task = [0]
+
+        def _next_task():
+            if next_task[0] >= len(tasks):
+                return None
+            next_task[0] += 1
+            return next_task[0] - 1
+
+        worker_count = self.size - 1
+        worker_exit_count = 0
+        while worker_exit_count < worker_count:
+            if MASTER_TASK and not self.comm.Iprobe(source=self.MPI.ANY_SOURCE,
+                                                    tag=self.MPI.ANY_TAG):
+                # Execute a task while no worker is waiting; a worker's
+                # message is then answered after at most one task.
+                index = _next_task()
+                if index is not None:
+                    try:
+                        results[index] = self._run(function, index, tasks[index], on_result)
+                    except Exception:
+                        errors.append("Task {} on master:\n{}".format(index, traceback.format_exc()))
+                    continue
+
+            data = self.comm.recv(source=self.MPI.ANY_SOURCE, tag=self.MPI.ANY_TAG,
+                                  status=status)
+            source = status.Get_source()
+            tag = status.Get_tag()
+
+            if tag == Tags.READY:
+                index = _next_task()
+                if index is not None:
+                    self.comm.send((index, tasks[index]), dest=source, tag=Tags.START)
+                else:
+                    self.comm.send(None, dest=source, tag=Tags.EXIT)
+            elif tag == Tags.DONE:
+                index, result, error = data
+                if error is not None:
+                    errors.append("Task {} on worker {}:\n{}".format(index, source, error))
+                else:
+                    results[index] = result
+                    if on_result is not None:
+                        on_result(index, result)
+            elif tag == Tags.EXIT:
+                worker_exit_count += 1
+
+        if errors:
+            raise TaskError("{} of {} tasks failed:\n{}".format(
+                len(errors), len(tasks), "\n".join(errors)))
+
+        return results
+
+    def _worker(self, function):
+        status = self.MPI.Status()
+        while True:
+            self.comm.send(None, dest=0, tag=Tags.READY)
+            data = self.comm.recv(source=0, tag=self.MPI.ANY_TAG, status=status)
+            if status.Get_tag() == Tags.EXIT:
+                break
+
+            index, task = data
+            try:
+                message = (index, function(task), None)
+            except Exception:
+                message = (index, None, traceback.format_exc())
+            self.comm.send(message, dest=0, tag=Tags.DONE)
+
+        self.comm.send(None, dest=0, tag=Tags.EXIT)
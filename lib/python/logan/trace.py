@@ -0,0 +1,152 @@
+"""
+Structured phase tracing.
+
+Datasources and dataoutputs can mark phases of their work with nested spans:
+
+    with logan.trace.span("plot", dataset=dataset):
+        ...
+
+Spans are only recorded if tracing was enabled (--trace); otherwise span
+returns a no-op context manager. Recorded spans are written as Chrome
+trace-event JSON (viewable with chrome://tracing or Perfetto), and summarized
+in a table of the time spent per span name.
+"""
+
+import os
+import time
+import json
+import logging
+import functools
+import threading
+
+# List of recorded trace events; None if tracing is disabled.
+_events = None
+
+class _NullSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class _Span(object):
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        add_complete(self.name, self.start, time.time(), **self.args)
+        return False
+
+def enable():
+    global _events
+    if _events is None:
+        _events = []
+
+def enabled():
+    return _events is not None
+
+def span(name, **args):
+    """
+    @return: Context manager recording a span with name; args are shown with
+             the span in the trace viewer.
+    """
+    if _events is None:
+        return _NULL_SPAN
+    return _Span(name, args)
+
+def traced(name=None):
+    """
+    Decorator recording each call of the decorated function as a span.
+    """
+    def decorator(f):
+        span_name = name or f.__name__
+
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return f(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def add_complete(name, start, end, **args):
+    """
+    Record a span with known start and end time (from time.time()).
+    """
+    if _events is None:
+        return
+
+    _events.append({
+        'name' : name,
+        'cat'  : "logan",
+        'ph'   : "X",
+        'ts'   : start * 1e6,
+        'dur'  : (end - start) * 1e6,
+        'pid'  : os.getpid(),
+        'tid'  : threading.current_thread().ident,
+        'args' : dict((k, str(v)) for k, v in args.items())
+    })
+
+def take_events():
+    """
+    Removes and returns the events recorded so far by this process; used to
+    pass events of forked worker processes, which inherit the events of their
+    parent, to the main process (see add_events).
+    """
+    if _events is None:
+        return []
+    pid = os.getpid()
+    events = [event for event in _events if event['pid'] == pid]
+    del _events[:]
+    return events
+
+def add_events(events):
+    if _events is not None:
+        _events.extend(events)
+
+def write_chrome_trace(filename):
+    with open(filename, "w") as f:
+        json.dump({'traceEvents' : _events or [], 'displayTimeUnit' : "ms"}, f)
+    logging.info("Written trace {}".format(filename))
+
+def summary():
+    """
+    @return: List of (name, count, total seconds) tuples, sorted by total time
+             spent in spans with name.
+    """
+    totals = {}
+    for event in _events or []:
+        count, total = totals.get(event['name'], (0, 0.0))
+        totals[event['name']] = (count + 1, total + event['dur'] / 1e6)
+
+    return sorted(((name, count, total) for name, (count, total) in totals.items()),
+                  key=lambda entry: -entry[2])
+
+def log_summary():
+    lines = ["{:<40} {:>8} {:>12} {:>12}".format("Span", "Count", "Total [s]", "Mean [s]")]
+    for name, count, total in summary():
+        lines.append("{:<40} {:>8} {:>12.3f} {:>12.4f}".format(
+            name[:40], count, total, total / count))
+    logging.info("Trace summary:\n    " + "\n    ".join(lines))
+
+def finish(filename, rank=0):
+    """
+    Writes the trace to filename and logs the summary.
+
+    @rank: MPI rank of the process (--dsrc-mpi); ranks other than the root
+           write to filename with .rankN inserted before the extension, so
+           that the ranks do not overwrite each other's trace.
+    """
+    if _events is None:
+        return
+    if rank:
+        root, ext = os.path.splitext(filename)
+        filename = "{}.rank{}{}".format(root, rank, ext)
+    write_chrome_trace(filename)
+    log_summary()
@@ -0,0 +1,72 @@
+"""
+In-memory datasource with small datasets of every grid dimension, for the
+tests of dataoutputs.
+"""
+
+import logan.datasource.base
+from logan.datasource import DataPoint
+
+# Maps dataset to its x-tick, z-tick, cluster and stack keys (None if the
+# dataset does not have the dimension).
+GRIDS = {
+    'flat'    : ([1, 2, 4], None, ["a", "b"], None),
+    'stacked' : ([1, 2], None, ["a", "b"], ["user", "sys"]),
+    'surface' : ([1, 2], [10, 20], ["a"], None)
+}
+
+NAMES = {
+    "a" : "Config A",
+    "b" : "Config B"
+}
+
+def point(dataset, x, z=0, cluster=None, stack=None):
+    """
+    @return: DataPoint of the given keys; y has a binary representation
+             artifact (e.g. 0.1 + 0.2).
+    """
+    offset = {None : 0.0, "a" : 0.1, "b" : 0.2, "user" : 0.0, "sys" : 1000.0}
+    y = x * 10.0 + offset[cluster] + 0.2 + offset[stack]
+    if dataset == 'surface':
+        return DataPoint(x=x, y=y + z, z=z * 1.5, y_err=(0.5, 0.25), z_err=(0.1, 0.2))
+    return DataPoint(x=x, y=y, y_err=(0.5, 0.25))
+
+class DataSource(logan.datasource.base.DataSource):
+    def __init__(self, logan_config=None, grids=GRIDS):
+        super(DataSource, self).__init__(logan_config)
+        self.grids = grids
+
+    def map_to_name(self, key):
+        return NAMES.get(key, str(key))
+
+    def get_dataset_keys(self):
+        return sorted(self.grids)
+
+    def get_presentation_hints(self, dataset):
+        return {'type' : 'bar'}
+
+    def get_description(self, dataset=None):
+        return "Dataset {}".format(dataset)
+
+    def get_ylabel(self, dataset=None):
+        return "Time [s]"
+
+    def get_xlabel(self, dataset=None):
+        return "Threads"
+
+    def get_zlabel(self, dataset=None):
+        return "Size"
+
+    def get_xtick_keys(self, dataset=None):
+        return self.grids[dataset][0]
+
+    def get_ztick_keys(self, dataset=None):
+        return self.grids[dataset][1]
+
+    def get_cluster_keys(self, dataset=None):
+        return self.grids[dataset][2]
+
+    def get_stack_keys(self, dataset=None):
+        return self.grids[dataset][3]
+
+    def query_data(self, x, z=0, stack=None, cluster=None, dataset=None):
+        return point(dataset, x, z, cluster, stack)
@@ -0,0 +1,80 @@
+"""
+Tests of the vectorized compute functions of logan.datasource.analysis,
+against their scalar counterparts.
+
+Run from the repository root with: python -m pytest tests
+"""
+
+import os
+import sys
+import math
+import random
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "lib", "python"))
+
+from logan.datasource import analysis
+
+def _captures(n, seed):
+    """
+    @return: Capture lists as extracted: a list of values and a list of
+             timestamps, both as strings.
+    """
+    rng = random.Random(seed)
+    values = [repr(rng.uniform(-50.0, 150.0)) for _ in range(n)]
+    timestamps = [repr(0.5 * i + rng.uniform(0.0, 0.1)) for i in range(n)]
+    return [values, timestamps]
+
+class VectorOperatorTest(unittest.TestCase):
+    def assertSameResult(self, vector, scalar, D):
+        for data in [D, analysis.CaptureData(D)]:
+            self.assertAlmostEqual(vector(D=data), scalar(D=data), places=9)
+
+    def test_scalar_counterparts(self):
+        for n in [1, 2, 101]:
+            D = _captures(n, seed=n)
+            self.assertSameResult(analysis.vsum_float(), analysis.sum_float(), D)
+            self.assertSameResult(analysis.vmax_float(), analysis.max_float(), D)
+            self.assertSameResult(analysis.vmin_float(),
+                                  analysis.make_operator_type(min, float)(), D)
+            self.assertSameResult(analysis.vamean_float(), analysis.amean_float(), D)
+            self.assertSameResult(analysis.vamean_float(1), analysis.amean_float(1), D)
+            self.assertSameResult(analysis.vsum_ratio_float(0, 1),
+                                  analysis.sum_ratio_float(0, 1), D)
+
+    def test_order_statistics(self):
+        D = _captures(101, seed=3)
+        values = sorted(float(value) for value in D[0])
+        mean = sum(values) / len(values)
+
+        self.assertEqual(analysis.median_float()(D=D), values[50])
+        self.assertEqual(analysis.percentile_float(0)(D=D), values[0])
+        self.assertEqual(analysis.percentile_float([50, 100])(D=D), [values[50], values[100]])
+        self.assertAlmostEqual(analysis.stddev_float()(D=D),
+                               math.sqrt(sum((v - mean) ** 2 for v in values) / len(values)))
+        self.assertAlmostEqual(analysis.trimmed_amean_float(0.1)(D=D),
+                               sum(values[10:91]) / 81.0)
+        self.assertAlmostEqual(analysis.trimmed_amean_float(0.0)(D=D), mean)
+
+    def test_empty(self):
+        D = [[], []]
+        for factory in [analysis.vsum_float, analysis.vmax_float, analysis.vmin_float,
+                        analysis.vamean_float, analysis.median_float]:
+            self.assertRaises(analysis.AnalysisError, factory(), D=D)
+            self.assertEqual(factory(empty_def=-1.0)(D=D), -1.0)
+        self.assertRaises(analysis.AnalysisError, analysis.rate_float(), D=[["1"], ["0"]])
+
+    def test_capture_data_converts_once(self):
+        D = analysis.CaptureData(_captures(10, seed=4))
+        self.assertIs(analysis.as_array(D, 0), analysis.as_array(D, 0))
+        self.assertIsNot(analysis.as_array(D, 0), analysis.as_array(D, 1))
+        self.assertAlmostEqual(analysis.vsum_float()(D=D), analysis.sum_float()(D=D))
+
+    def test_rate(self):
+        D = [["1", "2", "3"], ["10.0", "11.0", "12.0"]]
+        self.assertEqual(analysis.rate_float(0, 1)(D=D), 3.0)
+        self.assertEqual(analysis.rate_float(None, 1)(D=D), 1.0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+"""
+Tests of the columnar dataoutput (logan.dataoutput.columnar): datasets read
+back with load match the datasource.
+
+Run from the repository root with: python -m pytest tests
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "lib", "python"))
+
+import logan.main
+import logan.dataoutput.columnar
+from logan.dataoutput.columnar import load
+import gridsource
+
+class ColumnarTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        logan_config = logan.main.LoganConfig(
+                ["-s", "base", "-o", "columnar", "-O", self.tmp_dir,
+                 "--loglevel", "warning"])
+        logan.main.load_base_modules()
+        logan.main.register_module_arguments(logan_config,
+                logan_config.get_datasource_module(),
+                logan_config.get_dataoutput_modules())
+        logan_config.parse_args()
+
+        grids = dict(gridsource.GRIDS)
+        grids['empty'] = (None, None, None, None)
+        self.data_source = gridsource.DataSource(logan_config, grids)
+        self.assertTrue(logan.dataoutput.columnar.DataOutput(logan_config).generate(
+            self.data_source))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _load(self, dataset, mmap_mode="r"):
+        return load(os.path.join(self.tmp_dir, dataset + ".columnar"), mmap_mode)
+
+    def test_round_trip(self):
+        for dataset in ["flat", "stacked", "surface"]:
+            for mmap_mode in ["r", None]:
+                ds = self._load(dataset, mmap_mode)
+                self.assertEqual(ds.dataset, dataset)
+                self.assertEqual(ds.hints, {'type' : 'bar'})
+                self.assertEqual(ds.header['xlabel'], "Threads")
+                for x, z, cluster, stack, data_point in self.data_source.query_grid(dataset):
+                    index = ds.index(x=x, z=z if ds.keys['z'] is not None else None,
+                                     cluster=cluster, stack=stack)
+                    self.assertEqual(float(ds.y[index].reshape(-1)[0]), data_point.y)
+                    self.assertEqual(float(ds.y_err_lo[index].reshape(-1)[0]),
+                                     data_point.y_err[0])
+                    self.assertEqual(float(ds.y_err_hi[index].reshape(-1)[0]),
+                                     data_point.y_err[1])
+
+    def test_index(self):
+        ds = self._load("stacked")
+        self.assertEqual(ds.y.shape, (2, 1, 2, 2))
+        self.assertEqual(ds.keys['z'], None)
+        self.assertEqual(ds.names['cluster'], ["Config A", "Config B"])
+        self.assertEqual(ds.index(x=2, cluster="b", stack="sys"),
+                         (1, slice(None), 1, 1))
+
+        # Keys which are not given select the whole dimension.
+        self.assertEqual(ds.y[ds.index(x=1, stack="user")].reshape(-1).tolist(),
+                         [gridsource.point("stacked", 1, cluster=cluster, stack="user").y
+                          for cluster in ["a", "b"]])
+        self.assertRaises(ValueError, ds.index, x=3)
+
+        ds = self._load("surface")
+        self.assertEqual(ds.y.shape, (2, 2, 1, 1))
+        self.assertEqual(float(ds.y[ds.index(x=2, z=20, cluster="a")][0]),
+                         gridsource.point("surface", 2, 20, "a").y)
+
+    def test_empty(self):
+        ds = self._load("empty")
+        self.assertEqual(ds.y.shape, (0, 1, 1, 1))
+        self.assertEqual(ds.keys['x'], None)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+"""
+Tests of the CSV dataoutput (logan.dataoutput.csv), in particular of the
+columns of the long format.
+
+Run from the repository root with: python -m pytest tests
+"""
+
+import os
+import sys
+import csv
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "lib", "python"))
+
+import logan.main
+import logan.dataoutput.csv
+import gridsource
+
+class CSVTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _generate(self, argv):
+        """
+        @return: dict mapping datasets to the rows of their CSV file.
+        """
+        logan_config = logan.main.LoganConfig(
+                ["-s", "base", "-o", "csv", "-O", self.tmp_dir,
+                 "--loglevel", "warning"] + argv)
+        logan.main.load_base_modules()
+        logan.main.register_module_arguments(logan_config,
+                logan_config.get_datasource_module(),
+                logan_config.get_dataoutput_modules())
+        logan_config.parse_args()
+
+        data_source = gridsource.DataSource(logan_config)
+        self.assertTrue(logan.dataoutput.csv.DataOutput(logan_config).generate(data_source))
+
+        rows = {}
+        for dataset in data_source.get_dataset_keys():
+            with open(os.path.join(self.tmp_dir, dataset + ".csv"), "r") as f:
+                rows[dataset] = list(csv.reader(f, delimiter=";"))
+        return rows
+
+    def test_long(self):
+        rows = self._generate(["--csv-format", "long"])
+        columns = logan.dataoutput.csv.LONG_FORMAT_COLUMNS
+        for dataset, dataset_rows in rows.items():
+            self.assertEqual(dataset_rows[0], columns)
+            self.assertTrue(all(len(row) == len(columns) for row in dataset_rows))
+
+        # A row per point of the grid, in the order of query_grid.
+        flat = [dict(zip(columns, row)) for row in rows['flat'][1:]]
+        self.assertEqual([(row['x'], row['cluster']) for row in flat],
+                         [(x, cluster) for x in ["1", "2", "4"]
+                          for cluster in ["Config A", "Config B"]])
+        self.assertEqual(flat[0], {
+            'dataset' : "flat", 'x' : "1", 'cluster' : "Config A", 'stack' : "",
+            'ztick' : "", 'y' : "10.3", 'y_err_lo' : "0.5", 'y_err_hi' : "0.25",
+            'z' : "", 'z_err_lo' : "", 'z_err_hi' : ""})
+
+        # Values are formatted consistently, without representation artifacts.
+        self.assertNotEqual(repr(gridsource.point("flat", 1, cluster="a").y), "10.3")
+        self.assertEqual([row['y'] for row in flat],
+                         ["10.3", "10.4", "20.3", "20.4", "40.3", "40.4"])
+
+        stacked = [dict(zip(columns, row)) for row in rows['stacked'][1:]]
+        self.assertEqual(len(stacked), 2 * 2 * 2)
+        self.assertEqual([row['stack'] for row in stacked[:2]], ["user", "sys"])
+        self.assertEqual([row['y'] for row in stacked[:2]], ["10.3", "1010.3"])
+
+        # The z-tick and the z value of each point.
+        surface = [dict(zip(columns, row)) for row in rows['surface'][1:]]
+        self.assertEqual([(row['x'], row['ztick'], row['z']) for row in surface],
+                         [("1", "10", "15"), ("1", "20", "30"),
+                          ("2", "10", "15"), ("2", "20", "30")])
+        self.assertEqual((surface[0]['y'], surface[0]['z_err_lo'], surface[0]['z_err_hi']),
+                         ("20.3", "0.1", "0.2"))
+
+    def test_wide(self):
+        rows = self._generate([])
+        self.assertEqual(rows['flat'], [
+            ["Threads", "Config A", "Config B"],
+            ["1", "10.300", "10.400"],
+            ["2", "20.300", "20.400"],
+            ["4", "40.300", "40.400"]])
+        self.assertEqual(rows['stacked'][1],
+            ["1", "10.300[user]+1010.300[sys]=1020.600",
+             "10.400[user]+1010.400[sys]=1020.800"])
+
+if __name__ == "__main__":
+    unittest.main()
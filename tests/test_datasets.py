@@ -0,0 +1,103 @@
+"""
+Tests of the selection of datasets (--datasets): unselected datasets are not
+extracted.
+
+Run from the repository root with: python -m pytest tests
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "lib", "python"))
+
+import logan.main
+import logan.datasource.base
+from logan.datasource import cfopen, extract_data_from_files, regexinfo, synthetic
+from logan.benchmark import generator
+
+def _fail(D=None, **kwargs):
+    raise AssertionError("unselected dataset computed")
+
+class ExtractSelectTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "stdout")
+        with open(self.path, "w") as f:
+            f.write("a: 1\nb: 2\na: 3\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _extract(self, datasets, select):
+        datafiles = [cfopen(self.path)]
+        try:
+            return extract_data_from_files(datafiles, datasets, select=select,
+                                           error_set=set())
+        finally:
+            datafiles[0]['f'].close()
+
+    def test_select(self):
+        datasets = {
+            'a' : {'regexes' : [regexinfo("stdout", r"^a: (\d+)")],
+                   'compute' : lambda D=None, **kwargs: len(D[0])},
+            # Neither compiled (the regex is invalid) nor computed.
+            'b' : {'regexes' : [regexinfo("stdout", r"^b: (\d+")],
+                   'compute' : _fail}
+        }
+        self.assertEqual(self._extract(datasets, lambda dataset: dataset == 'a'), {'a' : 2})
+
+    def test_depends(self):
+        datasets = {
+            'a' : {'regexes' : [regexinfo("stdout", r"^a: (\d+)")],
+                   'compute' : lambda D=None, **kwargs: len(D[0])},
+            'b' : {'regexes' : [regexinfo("stdout", r"^b: (\d+)")],
+                   'compute' : lambda D=None, R=None, **kwargs: int(D[0][0]) + R['a'],
+                   'depends' : ['a']},
+            'c' : {'regexes' : [regexinfo("stdout", r"^c: (\d+")],
+                   'compute' : _fail}
+        }
+        self.assertEqual(self._extract(datasets, lambda dataset: dataset == 'b'),
+                         {'a' : 2, 'b' : 4})
+
+class SyntheticSelectTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        generator.generate_tree(self.tmp_dir, benchmarks=2, threads=[1, 2],
+                                reps=1, lines=200)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _make_logan_config(self, argv):
+        logan_config = logan.main.LoganConfig(
+                ["-s", "synthetic", "-S", self.tmp_dir, "-o", "base",
+                 "-O", os.path.join(self.tmp_dir, "out"),
+                 "--loglevel", "warning"] + argv)
+        logan.main.load_base_modules()
+        logan.main.register_module_arguments(logan_config,
+                logan_config.get_datasource_module(),
+                logan_config.get_dataoutput_modules())
+        logan_config.parse_args()
+        return logan_config
+
+    def test_datasets(self):
+        full = synthetic.DataSource(self._make_logan_config([]))
+        self.assertTrue(full.process())
+
+        logan_config = self._make_logan_config(["--datasets", "latency*"])
+        data_source = synthetic.DataSource(logan_config)
+        self.assertTrue(data_source.process())
+        self.assertEqual(sorted(data_source.results), ["latency", "latency_p99"])
+        for dataset in data_source.results:
+            self.assertEqual(data_source.results[dataset], full.results[dataset])
+
+        selection = logan.main.select_datasets(logan_config, data_source)
+        self.assertIsInstance(selection, logan.datasource.base.DatasetSelection)
+        self.assertEqual(sorted(selection.get_dataset_keys()), ["latency", "latency_p99"])
+
+if __name__ == "__main__":
+    unittest.main()
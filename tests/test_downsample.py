@@ -0,0 +1,104 @@
+"""
+Tests of the downsampling of series by the matplotlib dataoutput: the kept
+points include the endpoints and the extremes.
+
+Run from the repository root with: python -m pytest tests
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "lib", "python"))
+
+import numpy as np
+
+from logan.dataoutput.matplotlib import downsample_minmax, downsample_lttb, \
+        downsample_pixels
+
+def _random_walk(count, seed):
+    rng = np.random.RandomState(seed)
+    x = np.cumsum(rng.uniform(0.1, 1.0, count))
+    y = np.cumsum(rng.normal(0.0, 1.0, count))
+    return x, y
+
+class DownsampleTest(unittest.TestCase):
+    def assertSortedIndices(self, kept, count):
+        self.assertTrue(np.all(np.diff(kept) > 0))
+        self.assertEqual(kept[0], 0)
+        self.assertEqual(kept[-1], count - 1)
+
+    def test_minmax(self):
+        x, y = _random_walk(100000, seed=1)
+        columns = 200
+        kept = downsample_minmax(x, y, columns)
+        self.assertSortedIndices(kept, len(x))
+        self.assertLessEqual(len(kept), 4 * columns)
+        self.assertIn(np.argmin(y), kept)
+        self.assertIn(np.argmax(y), kept)
+
+        # Each column is drawn with the same extremes.
+        column = np.minimum(((x - x[0]) * (columns / (x[-1] - x[0]))).astype(np.int64),
+                            columns - 1)
+        for c in np.unique(column):
+            in_column = column == c
+            kept_in_column = kept[column[kept] == c]
+            self.assertEqual(y[kept_in_column].min(), y[in_column].min())
+            self.assertEqual(y[kept_in_column].max(), y[in_column].max())
+            self.assertIn(np.flatnonzero(in_column)[0], kept_in_column)
+            self.assertIn(np.flatnonzero(in_column)[-1], kept_in_column)
+
+    def test_minmax_small(self):
+        x, y = _random_walk(100, seed=2)
+        self.assertEqual(downsample_minmax(x, y, 25).tolist(), list(range(100)))
+
+        # All points at the same x.
+        x = np.zeros(1000)
+        y = np.sin(np.arange(1000))
+        kept = downsample_minmax(x, y, 10)
+        self.assertSortedIndices(kept, len(x))
+        self.assertEqual(sorted(kept.tolist()),
+                         sorted(set([0, 999, int(np.argmin(y)), int(np.argmax(y))])))
+
+    def test_lttb(self):
+        x, y = _random_walk(10000, seed=3)
+        spike = 5000
+        y[spike] = y.max() + 1000.0
+        threshold = 100
+        kept = downsample_lttb(x, y, threshold)
+        self.assertEqual(len(kept), threshold)
+        self.assertSortedIndices(kept, len(x))
+        self.assertIn(spike, kept)
+
+        # A point of each bucket.
+        every = (len(x) - 2) / float(threshold - 2)
+        for i, index in enumerate(kept[1:-1]):
+            self.assertGreaterEqual(index, int(i * every) + 1)
+            self.assertLess(index, int((i + 1) * every) + 1)
+
+    def test_lttb_small(self):
+        x, y = _random_walk(50, seed=4)
+        self.assertEqual(downsample_lttb(x, y, 50).tolist(), list(range(50)))
+        self.assertEqual(downsample_lttb(x, y, 2).tolist(), list(range(50)))
+
+    def test_pixels(self):
+        x, y = _random_walk(10000, seed=5)
+        limits = ((x.min(), x.max()), (y.min(), y.max()))
+        kept = downsample_pixels(x, y, limits, (20, 10))
+        self.assertTrue(np.all(np.diff(kept) > 0))
+        self.assertEqual(kept[0], 0)
+        self.assertLessEqual(len(kept), 20 * 10)
+
+        # The first point of each cell.
+        cells = set()
+        for index in range(len(x)):
+            cell = (min(int((x[index] - limits[0][0]) * 20 / (limits[0][1] - limits[0][0])), 19),
+                    min(int((y[index] - limits[1][0]) * 10 / (limits[1][1] - limits[1][0])), 9))
+            if cell not in cells:
+                cells.add(cell)
+                self.assertIn(index, kept)
+        self.assertEqual(len(kept), len(cells))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+"""
+Tests of incremental extraction (--follow): ExtractState, and the update of
+the synthetic datasource.
+
+Run from the repository root with: python -m pytest tests
+"""
+
+import os
+import sys
+import shutil
+import random
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "lib", "python"))
+
+import logan.main
+from logan.datasource import ExtractState, cfopen, extract_data_from_files, synthetic
+from logan.benchmark import generator
+
+def _extract(path, state=None):
+    """
+    @return: Results of path; datasets without captures are left out.
+    """
+    datafiles = [cfopen(path)]
+    try:
+        return extract_data_from_files(datafiles, synthetic.DATASETS, state=state,
+                                       error_set=set())
+    finally:
+        datafiles[0]['f'].close()
+
+class ExtractStateTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, generator.DATAFILE)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write(self, lines, mode="w"):
+        with open(self.path, mode) as f:
+            f.write("".join(lines))
+
+    def test_append(self):
+        state = ExtractState()
+        self._write(["throughput: 1.0\n", "latency_us: 10.0\n"])
+        self.assertEqual(_extract(self.path, state), _extract(self.path))
+        self.assertEqual(state.changed, set(synthetic.DATASETS))
+
+        _extract(self.path, state)
+        self.assertEqual(state.changed, set())
+        self.assertTrue(state.file_unchanged(self.path, self.path))
+
+        # An incomplete line is extracted as without state, and read again
+        # once complete.
+        self._write(["throughput: 3.0\n", "latency_us: 2"], mode="a")
+        self.assertFalse(state.file_unchanged(self.path, self.path))
+        self.assertEqual(_extract(self.path, state), _extract(self.path))
+        self.assertEqual(state.result['throughput'], 2.0)
+        self.assertEqual(state.result['latency'], 6.0)
+        _extract(self.path, state)
+        self.assertEqual(state.changed, set())
+        self._write(["0.0\n"], mode="a")
+        self.assertEqual(_extract(self.path, state), _extract(self.path))
+        self.assertEqual(state.result['latency'], 15.0)
+        self.assertEqual(state.changed, set(['latency', 'latency_p99']))
+
+    def test_incomplete_first_read(self):
+        self._write(["throughput: 1.0\n", "throughput: 3.0"])
+        state = ExtractState()
+        self.assertEqual(_extract(self.path, state), _extract(self.path))
+        self.assertEqual(state.result['throughput'], 2.0)
+
+    def test_truncate(self):
+        state = ExtractState()
+        self._write(["throughput: 1.0\n"] * 10)
+        _extract(self.path, state)
+        self._write(["throughput: 5.0\n"])
+        self.assertEqual(_extract(self.path, state), _extract(self.path))
+        self.assertEqual(state.result['throughput'], 5.0)
+
+    def test_replace(self):
+        state = ExtractState()
+        self._write(["throughput: 1.0\n"])
+        _extract(self.path, state)
+        os.rename(self.path, self.path + ".1")
+        self._write(["throughput: 7.0\n", "throughput: 9.0\n"])
+        self.assertEqual(_extract(self.path, state), _extract(self.path))
+        self.assertEqual(state.result['throughput'], 8.0)
+
+class SyntheticFollowTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.tree = generator.generate_tree(self.tmp_dir, benchmarks=2, threads=[1, 2],
+                                            reps=2, lines=500)['root']
+        argv = ["-s", "synthetic", "-S", self.tmp_dir, "-o", "base",
+                "-O", os.path.join(self.tmp_dir, "out"), "--follow", "1",
+                "--loglevel", "warning"]
+        self.logan_config = logan.main.LoganConfig(argv)
+        logan.main.load_base_modules()
+        logan.main.register_module_arguments(self.logan_config,
+                self.logan_config.get_datasource_module(),
+                self.logan_config.get_dataoutput_modules())
+        self.logan_config.parse_args()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _run_path(self, params):
+        return os.path.join(self.tree, generator.run_dirname(params))
+
+    def assertProcessed(self, data_source):
+        fresh = synthetic.DataSource(self.logan_config)
+        self.assertTrue(fresh.process())
+        self.assertEqual(data_source.results, fresh.results)
+
+    def test_update(self):
+        data_source = synthetic.DataSource(self.logan_config)
+        self.assertTrue(data_source.process())
+        self.assertEqual(data_source.update(), [])
+
+        run_path = self._run_path({'benchmark' : "b0", 'threads' : 2, 'rep' : 1})
+        with open(os.path.join(run_path, generator.DATAFILE), "a") as f:
+            f.write("throughput: 1.0 ops/s\n" * 100)
+        # Appended to the last iteration
+        self.assertEqual(data_source.update(), ['throughput'])
+        self.assertProcessed(data_source)
+
+        # New run
+        params = {'benchmark' : "b2", 'threads' : 1, 'rep' : 0}
+        generator.generate_run(self._run_path(params), dict(params, benchmark_index=2),
+                               100, generator.parse_line_mix(generator.DEFAULT_LINE_MIX),
+                               2, None, random.Random(0))
+        self.assertEqual(data_source.update(), sorted(synthetic.DATASETS))
+        self.assertIn("b2", data_source.results['throughput'])
+        self.assertProcessed(data_source)
+
+        # Truncated run
+        with open(os.path.join(run_path, generator.DATAFILE), "w") as f:
+            f.write("throughput: 5.0 ops/s\nlatency_us: 5.0\n")
+        self.assertEqual(data_source.update(), sorted(synthetic.DATASETS))
+        self.assertProcessed(data_source)
+
+        # Removed run
+        shutil.rmtree(self._run_path(params))
+        self.assertEqual(data_source.update(), sorted(synthetic.DATASETS))
+        self.assertNotIn("b2", data_source.results['throughput'])
+        self.assertProcessed(data_source)
+
+if __name__ == "__main__":
+    unittest.main()
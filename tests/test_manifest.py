@@ -0,0 +1,131 @@
+"""
+Tests of the output manifests (logan.dataoutput.base): outputs whose data did
+not change are skipped, unless --dout-rebuild is given.
+
+Run from the repository root with: python -m pytest tests
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "lib", "python"))
+
+import logan.main
+import logan.dataoutput.base
+from logan.datasource import synthetic
+from logan.benchmark import generator
+
+# Modification time set on outputs, to tell whether they were written again.
+OLD_MTIME = 1000000000
+
+class ManifestTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.dout_path = os.path.join(self.tmp_dir, "out")
+        generator.generate_tree(self.tmp_dir, benchmarks=2, threads=[1, 2],
+                                reps=1, lines=200)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _make_logan_config(self, argv=[]):
+        logan_config = logan.main.LoganConfig(
+                ["-s", "synthetic", "-S", self.tmp_dir, "-o", "csv", "table",
+                 "-O", self.dout_path, "-f", "csv", "md",
+                 "--loglevel", "warning"] + argv)
+        logan.main.load_base_modules()
+        logan.main.register_module_arguments(logan_config,
+                logan_config.get_datasource_module(),
+                logan_config.get_dataoutput_modules())
+        logan_config.parse_args()
+        return logan_config
+
+    def _generate(self, argv=[]):
+        """
+        Generates the outputs with new dataoutputs and datasource.
+
+        @return: Names of the outputs which were written.
+        """
+        logan_config = self._make_logan_config(argv)
+        data_source = synthetic.DataSource(logan_config)
+        self.assertTrue(data_source.process())
+        for data_output in logan.main.make_data_outputs(
+                logan_config, logan_config.get_dataoutput_modules()):
+            self.assertTrue(data_output.generate(data_source))
+
+        written = set()
+        for name in os.listdir(self.dout_path):
+            if name.startswith("."):
+                continue
+            path = os.path.join(self.dout_path, name)
+            if os.stat(path).st_mtime != OLD_MTIME:
+                written.add(name)
+                os.utime(path, (OLD_MTIME, OLD_MTIME))
+        return written
+
+    def test_unchanged(self):
+        outputs = self._generate()
+        self.assertEqual(len(outputs), 3 * len(synthetic.DATASETS))
+        self.assertIn("latency.csv", outputs)
+        self.assertIn("latency.table.md", outputs)
+
+        self.assertEqual(self._generate(), set())
+
+        # Missing outputs are generated again.
+        os.remove(os.path.join(self.dout_path, "latency.csv"))
+        self.assertEqual(self._generate(), set(["latency.csv"]))
+
+        # Outputs of which the options changed are generated again.
+        self.assertEqual(self._generate(["--csv-format", "long"]),
+                         set(dataset + ".csv" for dataset in synthetic.DATASETS))
+
+    def test_rebuild(self):
+        outputs = self._generate()
+        self.assertEqual(self._generate(["--dout-rebuild"]), outputs)
+        self.assertEqual(self._generate(), set())
+
+class DatasetDigestTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        generator.generate_tree(self.tmp_dir, benchmarks=1, threads=[1, 2],
+                                reps=1, lines=100)
+        logan_config = logan.main.LoganConfig(
+                ["-s", "synthetic", "-S", self.tmp_dir, "-o", "base",
+                 "--loglevel", "warning"])
+        logan.main.load_base_modules()
+        logan.main.register_module_arguments(logan_config,
+                logan_config.get_datasource_module(),
+                logan_config.get_dataoutput_modules())
+        logan_config.parse_args()
+        self.data_source = synthetic.DataSource(logan_config)
+        self.assertTrue(self.data_source.process())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_memoised(self):
+        queried = []
+        query_grid = self.data_source.query_grid
+        def _query_grid(dataset):
+            queried.append(dataset)
+            return query_grid(dataset)
+        self.data_source.query_grid = _query_grid
+
+        digest = logan.dataoutput.base.dataset_digest
+        csv_digest = digest(self.data_source, "latency", "csv")
+        self.assertNotEqual(digest(self.data_source, "latency", "table"), csv_digest)
+        self.assertNotEqual(digest(self.data_source, "throughput", "csv"), csv_digest)
+        self.assertEqual(digest(self.data_source, "latency", "csv"), csv_digest)
+        self.assertEqual(queried, ["latency", "throughput"])
+
+        # Data of a new generation is hashed again.
+        self.data_source.generation += 1
+        self.assertEqual(digest(self.data_source, "latency", "csv"), csv_digest)
+        self.assertEqual(queried, ["latency", "throughput", "latency"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+"""
+Tests of the ProgressJournal of launch_scripts/ARCHER/mpi_tf_worker.py: the
+completed tasks are recovered from the snapshot and journal after the master
+was interrupted, also after compactions.
+
+Run from the repository root with: python -m pytest tests
+"""
+
+import os
+import sys
+import json
+import pickle
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "lib", "python"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "lib", "launch_scripts", "ARCHER"))
+
+import mpi_tf_worker
+from mpi_tf_worker import ProgressJournal
+
+class ProgressJournalTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.snapshot_path = os.path.join(self.tmp_dir, ".running")
+        self.compact_min = mpi_tf_worker.JOURNAL_COMPACT_MIN
+        mpi_tf_worker.JOURNAL_COMPACT_MIN = 4
+
+    def tearDown(self):
+        mpi_tf_worker.JOURNAL_COMPACT_MIN = self.compact_min
+        shutil.rmtree(self.tmp_dir)
+
+    def _journal_tids(self):
+        with open(self.snapshot_path + ".journal", "r") as f:
+            return [json.loads(line) for line in f]
+
+    def _snapshot_tids(self):
+        with open(self.snapshot_path, "rb") as f:
+            return pickle.load(f)
+
+    def _resume(self):
+        """
+        @return: ProgressJournal loaded as by a restarted master.
+        """
+        journal = ProgressJournal(self.snapshot_path)
+        self.assertTrue(journal.load())
+        return journal
+
+    def test_new(self):
+        journal = ProgressJournal(self.snapshot_path)
+        self.assertFalse(journal.load())
+        journal.open()
+        self.assertEqual(self._snapshot_tids(), set())
+        self.assertEqual(self._journal_tids(), [])
+
+    def test_replay_after_compaction(self):
+        journal = ProgressJournal(self.snapshot_path)
+        journal.load()
+        journal.open()
+        for tid in range(10):
+            journal.add(tid)
+
+        # Compacted after 4 entries, and again after 4 more (the journal
+        # grows as long as the snapshot before the next compaction).
+        self.assertEqual(self._snapshot_tids(), set(range(8)))
+        self.assertEqual(self._journal_tids(), [8, 9])
+
+        # Interrupted: the snapshot and the replayed journal.
+        resumed = self._resume()
+        self.assertEqual(resumed.complete, set(range(10)))
+
+        # Resuming compacts the loaded state.
+        resumed.open()
+        self.assertEqual(self._snapshot_tids(), set(range(10)))
+        self.assertEqual(self._journal_tids(), [])
+        for tid in range(10, 13):
+            resumed.add(tid)
+        self.assertEqual(self._resume().complete, set(range(13)))
+
+        resumed.remove()
+        self.assertFalse(os.path.exists(self.snapshot_path))
+        self.assertFalse(os.path.exists(self.snapshot_path + ".journal"))
+        self.assertFalse(ProgressJournal(self.snapshot_path).load())
+
+    def test_incomplete_entry(self):
+        journal = ProgressJournal(self.snapshot_path)
+        journal.load()
+        journal.open()
+        journal.add("a")
+        journal.add("b")
+
+        # Interrupted while appending an entry.
+        with open(self.snapshot_path + ".journal", "a") as f:
+            f.write('"c')
+        self.assertEqual(self._resume().complete, set(["a", "b"]))
+
+    def test_interrupted_compaction(self):
+        journal = ProgressJournal(self.snapshot_path)
+        journal.load()
+        journal.open()
+        for tid in range(3):
+            journal.add(tid)
+
+        # Interrupted after writing the snapshot, before truncating the
+        # journal: entries replayed again are harmless.
+        with open(self.snapshot_path, "wb") as f:
+            pickle.dump(set(range(3)), f)
+        self.assertEqual(self._resume().complete, set(range(3)))
+
+        # Without a journal (e.g. snapshot of the old format).
+        os.remove(self.snapshot_path + ".journal")
+        self.assertEqual(self._resume().complete, set(range(3)))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+"""
+Tests of logan.datasource.resultindex: re-indexing of result trees whose
+directories changed.
+
+Run from the repository root with: python -m pytest tests
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "lib", "python"))
+
+from logan.datasource import resultindex
+
+class ResultIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmp_dir, "results")
+        # Outside the tree, so that saving it does not modify the tree.
+        self.index_path = os.path.join(self.tmp_dir, "index.pickle.gz")
+        # Directories are only trusted if modified well before the scan (see
+        # MTIME_SLACK), so modifications are backdated.
+        self.mtime = time.time() - 3600.0
+        for threads in [1, 2]:
+            self._write("bench+threads={}".format(threads), "stdout.gz")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _index(self):
+        return resultindex.ResultIndex(self.root, self.index_path)
+
+    def _modified(self, path):
+        self.mtime += 1.0
+        os.utime(path, (self.mtime, self.mtime))
+
+    def _write(self, run, name):
+        path = os.path.join(self.root, run)
+        if not os.path.exists(path):
+            os.makedirs(path)
+            self._modified(self.root)
+        open(os.path.join(path, name), "w").close()
+        self._modified(path)
+
+    def _remove(self, run):
+        shutil.rmtree(os.path.join(self.root, run))
+        self._modified(self.root)
+
+    def _runs(self, index):
+        return dict((run.path, (run.params, run.datafiles)) for run in index.runs())
+
+    def test_refresh(self):
+        index = self._index()
+        self.assertEqual(index.refresh(), 3)
+        self.assertEqual(self._runs(index), {
+            "bench+threads=1" : ({'threads' : 1}, {'stdout' : 'gz'}),
+            "bench+threads=2" : ({'threads' : 2}, {'stdout' : 'gz'})})
+
+        # Unchanged directories are not listed again, also when loaded.
+        self.assertEqual(index.refresh(), 0)
+        self.assertEqual(self._index().refresh(), 0)
+
+    def test_mtime_change(self):
+        index = self._index()
+        index.refresh()
+
+        # Only the modified run is listed again.
+        self._write("bench+threads=2", "stderr")
+        self.assertEqual(index.refresh(), 1)
+        self.assertEqual(self._runs(index)["bench+threads=2"][1],
+                         {'stdout' : 'gz', 'stderr' : None})
+
+        # New and removed runs change the mtime of their parent.
+        self._write("bench+threads=4", "stdout")
+        self._remove("bench+threads=1")
+        self.assertEqual(index.refresh(), 2)
+        self.assertEqual(sorted(self._runs(index)), ["bench+threads=2", "bench+threads=4"])
+        self.assertEqual([run.path for run in index.query(threads=[1, 4])],
+                         ["bench+threads=4"])
+
+        # The saved index reflects the changes.
+        loaded = self._index()
+        self.assertEqual(loaded.refresh(), 0)
+        self.assertEqual(self._runs(loaded), self._runs(index))
+
+    def test_recent_mtime_rescanned(self):
+        index = self._index()
+        index.refresh()
+
+        # A directory modified within MTIME_SLACK of the scan may be modified
+        # again within the mtime granularity, so it is always listed.
+        now = time.time()
+        os.utime(os.path.join(self.root, "bench+threads=1"), (now, now))
+        self.assertEqual(index.refresh(), 1)
+        self.assertEqual(index.refresh(), 1)
+
+if __name__ == "__main__":
+    unittest.main()
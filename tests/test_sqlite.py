@@ -0,0 +1,102 @@
+"""
+Tests of the SQLite dataoutput (logan.dataoutput.sqlite): runs appended to
+the same database, and updates of a run with --follow.
+
+Run from the repository root with: python -m pytest tests
+"""
+
+import os
+import sys
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "lib", "python"))
+
+import logan.main
+import logan.dataoutput.sqlite
+import gridsource
+
+class SQLiteTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.database_path = os.path.join(self.tmp_dir, "results.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _make_data_output(self, argv):
+        logan_config = logan.main.LoganConfig(
+                ["-s", "base", "-o", "sqlite", "-O", self.tmp_dir,
+                 "--sqlite-db", self.database_path, "--loglevel", "warning"] + argv)
+        logan.main.load_base_modules()
+        logan.main.register_module_arguments(logan_config,
+                logan_config.get_datasource_module(),
+                logan_config.get_dataoutput_modules())
+        logan_config.parse_args()
+        return logan.dataoutput.sqlite.DataOutput(logan_config)
+
+    def _query(self, sql, *args):
+        connection = sqlite3.connect(self.database_path)
+        try:
+            return connection.execute(sql, args).fetchall()
+        finally:
+            connection.close()
+
+    def test_append_runs(self):
+        data_source = gridsource.DataSource()
+        self.assertTrue(self._make_data_output(["-t", "first"]).generate(data_source))
+        self.assertTrue(self._make_data_output(["-t", "second", "-m", "rerun"]).generate(
+            data_source))
+
+        runs = self._query("SELECT id, tag, message, created FROM runs ORDER BY id")
+        self.assertEqual([run[:3] for run in runs],
+                         [(1, "first", None), (2, "second", "rerun")])
+        self.assertRegex(runs[0][3], r"^\d{4}-\d\d-\d\dT\d\d:\d\d:\d\dZ$")
+
+        point_count = sum(len(list(data_source.query_grid(dataset)))
+                          for dataset in data_source.get_dataset_keys())
+        for run_id in [1, 2]:
+            self.assertEqual(self._query("SELECT COUNT(*) FROM points WHERE run_id = ?",
+                                         run_id), [(point_count,)])
+            self.assertEqual(self._query("SELECT dataset FROM datasets WHERE run_id = ? "
+                                         "ORDER BY dataset", run_id),
+                             [(dataset,) for dataset in data_source.get_dataset_keys()])
+
+        # Points of both runs, queried as in the module documentation.
+        self.assertEqual(self._query(
+            "SELECT runs.tag, points.x, points.y FROM points "
+            "JOIN runs ON runs.id = points.run_id "
+            "WHERE points.dataset = 'flat' AND points.cluster = 'b' AND points.x = 2 "
+            "ORDER BY runs.id"),
+            [("first", 2, gridsource.point("flat", 2, cluster="b").y),
+             ("second", 2, gridsource.point("flat", 2, cluster="b").y)])
+
+        surface = self._query("SELECT z, z_name, stack FROM points "
+                              "WHERE run_id = 1 AND dataset = 'surface' ORDER BY x, z")
+        self.assertEqual(surface, [(10, "10", None), (20, "20", None)] * 2)
+
+    def test_update(self):
+        # With --follow, the dataoutput is called again for changed datasets.
+        data_output = self._make_data_output(["-t", "follow"])
+        self.assertTrue(data_output.generate(gridsource.DataSource()))
+
+        grids = dict(gridsource.GRIDS)
+        grids['flat'] = ([1, 2], None, ["a"], None)
+        data_source = gridsource.DataSource(grids=grids)
+        self.assertTrue(data_output.generate_dataset(data_source, "flat"))
+        self.assertTrue(data_output.generate_finish(data_source))
+
+        self.assertEqual(self._query("SELECT id, tag FROM runs"), [(1, "follow")])
+        self.assertEqual(self._query("SELECT x, cluster FROM points "
+                                     "WHERE dataset = 'flat' ORDER BY x"),
+                         [(1, "a"), (2, "a")])
+        self.assertEqual(self._query("SELECT COUNT(*) FROM datasets WHERE dataset = 'flat'"),
+                         [(1,)])
+        self.assertEqual(self._query("SELECT COUNT(*) FROM points WHERE dataset = 'stacked'"),
+                         [(8,)])
+
+if __name__ == "__main__":
+    unittest.main()
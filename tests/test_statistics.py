@@ -0,0 +1,139 @@
+"""
+Tests of logan.datasource.statistics and the sketch functions of
+logan.datasource.analysis.
+
+Run from the repository root with: python -m pytest tests
+"""
+
+import os
+import sys
+import random
+import bisect
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "lib", "python"))
+
+from logan.datasource import statistics, analysis
+
+def _exact_rank(sorted_values, value):
+    return bisect.bisect_right(sorted_values, value) / float(len(sorted_values))
+
+def _values(n, seed):
+    rng = random.Random(seed)
+    # Mix of distributions, so that the quantiles are not evenly spaced.
+    return [rng.lognormvariate(0.0, 1.0) if i % 3 else rng.uniform(0.0, 100.0)
+            for i in range(n)]
+
+QUANTILES = [i / 100.0 for i in range(1, 100)]
+
+class KLLSketchTest(unittest.TestCase):
+    def assertRankError(self, sketch, sorted_values):
+        for q, value in zip(QUANTILES, sketch.quantiles(QUANTILES)):
+            error = abs(_exact_rank(sorted_values, value) - q)
+            self.assertLessEqual(error, sketch.error_bound,
+                                 "k={} q={}: rank error {}".format(sketch.k, q, error))
+
+    def test_rank_error(self):
+        values = _values(50000, seed=1)
+        sorted_values = sorted(values)
+        for k in [16, 50, 200, 800]:
+            sketch = statistics.KLLSketch(k=k)
+            for value in values:
+                sketch.append(value)
+            self.assertEqual(len(sketch), len(values))
+            self.assertEqual(sketch.quantile(0.0), sorted_values[0])
+            self.assertEqual(sketch.quantile(1.0), sorted_values[-1])
+            self.assertRankError(sketch, sorted_values)
+
+    def test_extend_matches_append(self):
+        values = _values(20000, seed=2)
+        appended = statistics.KLLSketch(k=100)
+        for value in values:
+            appended.append(value)
+        extended = statistics.KLLSketch(k=100)
+        extended.extend(values)
+        self.assertRankError(extended, sorted(values))
+        self.assertEqual(len(extended), len(appended))
+
+    def test_from_error(self):
+        sketch = statistics.KLLSketch.from_error(0.01)
+        self.assertLessEqual(sketch.error_bound, 0.01)
+
+    def test_merge_matches_single_stream(self):
+        values = _values(40000, seed=3)
+        sorted_values = sorted(values)
+        for k in [50, 200]:
+            single = statistics.KLLSketch(k=k)
+            single.extend(values)
+
+            parts = []
+            for start in range(0, len(values), 3000):
+                part = statistics.KLLSketch(k=k)
+                part.extend(values[start:start + 3000])
+                parts.append(part)
+            merged = parts[0]
+            for part in parts[1:]:
+                merged = statistics.merge_sketches(merged, part)
+
+            self.assertEqual(len(merged), len(single))
+            self.assertEqual(merged.min, single.min)
+            self.assertEqual(merged.max, single.max)
+            self.assertRankError(merged, sorted_values)
+            for q, a, b in zip(QUANTILES, merged.quantiles(QUANTILES),
+                               single.quantiles(QUANTILES)):
+                self.assertLessEqual(abs(_exact_rank(sorted_values, a) -
+                                         _exact_rank(sorted_values, b)),
+                                     2 * single.error_bound, "k={} q={}".format(k, q))
+
+    def test_merge_does_not_modify(self):
+        a = statistics.KLLSketch(k=50)
+        a.extend(range(100))
+        b = statistics.KLLSketch(k=50)
+        b.extend(range(100, 300))
+        quantiles = a.quantiles(QUANTILES)
+
+        merged = statistics.merge_sketches(a, b)
+        self.assertEqual(len(merged), 300)
+        self.assertEqual(len(a), 100)
+        self.assertEqual(len(b), 200)
+        self.assertEqual(a.quantiles(QUANTILES), quantiles)
+
+        # Reducing a sketch with itself (e.g. shared between results) counts
+        # its items twice, as two separate results would.
+        self.assertEqual(len(statistics.merge_sketches(a, a)), 200)
+        self.assertEqual(len(a), 100)
+
+    def test_merge_different_k(self):
+        a = statistics.KLLSketch(k=50)
+        b = statistics.KLLSketch(k=100)
+        b.extend(range(10))
+        self.assertRaises(ValueError, a.merge, b)
+        self.assertRaises(ValueError, statistics.merge_sketches, a, b)
+
+    def test_merge_empty(self):
+        sketch = statistics.KLLSketch(k=50)
+        sketch.extend([1.0, 2.0, 3.0])
+        sketch.merge(statistics.KLLSketch(k=50))
+        self.assertEqual(len(sketch), 3)
+        self.assertEqual(statistics.KLLSketch(k=50).merge(sketch).quantile(0.5), 2.0)
+
+class SketchAnalysisTest(unittest.TestCase):
+    def test_sketch_capture(self):
+        sketch = statistics.KLLSketch(k=50)
+        sketch.extend(range(1, 101))
+        D = analysis.CaptureData([sketch])
+        self.assertEqual(analysis.count()(D=D), 100)
+        result = analysis.quantile_sketch()(D=D)
+        self.assertIsNot(result, sketch)
+        self.assertEqual(result.quantiles(QUANTILES), sketch.quantiles(QUANTILES))
+        self.assertEqual(analysis.sketch_quantile_float(1.0)(D=D), 100.0)
+
+    def test_as_array_rejects_sketch(self):
+        sketch = statistics.KLLSketch(k=50)
+        sketch.extend(range(10))
+        for D in [analysis.CaptureData([sketch]), [sketch]]:
+            self.assertRaises(analysis.AnalysisError, analysis.as_array, D)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,149 @@
+"""
+Tests of logan.dataoutput.table: the CSV, LaTeX, Markdown and HTML tables
+rendered from a single Table of a dataset.
+
+Run from the repository root with: python -m pytest tests
+"""
+
+import os
+import sys
+import io
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "lib", "python"))
+
+import logan.main
+from logan.dataoutput import table
+import gridsource
+
+class _CountingDataSource(gridsource.DataSource):
+    def __init__(self, *args, **kwargs):
+        super(_CountingDataSource, self).__init__(*args, **kwargs)
+        self.queried = []
+
+    def query_grid(self, dataset):
+        self.queried.append(dataset)
+        return super(_CountingDataSource, self).query_grid(dataset)
+
+def _render(t):
+    """
+    @return: dict mapping each format to the rendered table t.
+    """
+    rendered = {}
+    for table_format, (_, writer) in table.FORMATS.items():
+        f = io.StringIO()
+        writer(t, f)
+        rendered[table_format] = f.getvalue()
+    return rendered
+
+class TableTest(unittest.TestCase):
+    def test_flat(self):
+        data_source = _CountingDataSource()
+        t = table.Table(data_source, "flat")
+        rendered = _render(t)
+        self.assertEqual(data_source.queried, ["flat"])
+        self.assertFalse(t.omits_z)
+
+        self.assertEqual(rendered['csv'],
+                         "Threads;Config A;Config B\n"
+                         "1;10.300;10.400\n"
+                         "2;20.300;20.400\n"
+                         "4;40.300;40.400\n")
+        self.assertEqual(rendered['md'],
+                         "| Threads | Config A | Config B |\n"
+                         "|---|--:|--:|\n"
+                         "| 1 | 10.300 | 10.400 |\n"
+                         "| 2 | 20.300 | 20.400 |\n"
+                         "| 4 | 40.300 | 40.400 |\n"
+                         "\nTable: Time [s]\n")
+        self.assertEqual(rendered['html'],
+                         "<table>\n<caption>Time [s]</caption>\n"
+                         "<thead>\n<tr><th>Threads</th><th>Config A</th><th>Config B</th></tr>\n"
+                         "</thead>\n<tbody>\n"
+                         "<tr><th>1</th><td>10.300</td><td>10.400</td></tr>\n"
+                         "<tr><th>2</th><td>20.300</td><td>20.400</td></tr>\n"
+                         "<tr><th>4</th><td>40.300</td><td>40.400</td></tr>\n"
+                         "</tbody>\n</table>\n")
+        self.assertEqual(rendered['tex'],
+                         "\\begin{table}\n\\caption{Time [s]}\n\\begin{tabular}{|l|l|l|}\n"
+                         "\\hline\n"
+                         "Threads &Config A & Config B\\\\\\hline\n"
+                         "1 & \\(10.300\\) & \\(10.400\\)\\\\\\hline\n"
+                         "2 & \\(20.300\\) & \\(20.400\\)\\\\\\hline\n"
+                         "4 & \\(40.300\\) & \\(40.400\\)\\\\\\hline\n"
+                         "\\end{tabular}\n\\end{table}")
+
+    def test_stacked(self):
+        data_source = _CountingDataSource()
+        t = table.Table(data_source, "stacked")
+        rendered = _render(t)
+        self.assertEqual(data_source.queried, ["stacked"])
+        self.assertEqual(t.stack_names, ["user", "sys"])
+        self.assertEqual(t.sums, [["1020.600", "1020.800"], ["1040.600", "1040.800"]])
+
+        self.assertEqual(rendered['csv'].splitlines()[1],
+                         "1;10.300[user]+1010.300[sys]=1020.600;"
+                         "10.400[user]+1010.400[sys]=1020.800")
+        self.assertEqual(rendered['md'].splitlines()[2],
+                         "| 1 | 10.300 (user) + 1010.300 (sys) = 1020.600 | "
+                         "10.400 (user) + 1010.400 (sys) = 1020.800 |")
+        self.assertIn("<tr><th>2</th><td>20.300 (user) + 1020.300 (sys) = 1040.600</td>"
+                      "<td>20.400 (user) + 1020.400 (sys) = 1040.800</td></tr>\n",
+                      rendered['html'])
+        self.assertIn("1 & \\(10.300_\\text{user}+1010.300_\\text{sys} = 1020.600\\)"
+                      " & \\(10.400_\\text{user}+1010.400_\\text{sys} = 1020.800\\)"
+                      "\\\\\\hline\n", rendered['tex'])
+
+    def test_omits_z(self):
+        t = table.Table(gridsource.DataSource(), "surface")
+        self.assertTrue(t.omits_z)
+        # Only the values of the first z-tick.
+        self.assertEqual(t.rows, [[["20.300"]], [["30.300"]]])
+
+    def test_sanitize(self):
+        grids = {'special' : ([1], None, ["a|b<c>&d_e"], None)}
+        class _DataSource(gridsource.DataSource):
+            def map_to_name(self, key):
+                return key if isinstance(key, str) else str(key)
+            def query_data(self, x, z=0, stack=None, cluster=None, dataset=None):
+                return gridsource.point("flat", x)
+        rendered = _render(table.Table(_DataSource(grids=grids), "special"))
+        self.assertIn("a\\|b<c>&d_e", rendered['md'])
+        self.assertIn("a|b&lt;c&gt;&amp;d_e", rendered['html'])
+        self.assertIn("a|b<c>\\&d\\_e", rendered['tex'])
+
+class TableDataOutputTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_generate(self):
+        logan_config = logan.main.LoganConfig(
+                ["-s", "base", "-o", "table", "-O", self.tmp_dir,
+                 "--loglevel", "warning"])
+        logan.main.load_base_modules()
+        logan.main.register_module_arguments(logan_config,
+                logan_config.get_datasource_module(),
+                logan_config.get_dataoutput_modules())
+        logan_config.parse_args()
+
+        data_source = _CountingDataSource()
+        self.assertTrue(table.DataOutput(logan_config).generate(data_source))
+
+        # All formats from one pass over each dataset; query_grid is also
+        # called once per dataset for its digest.
+        self.assertEqual(sorted(data_source.queried),
+                         sorted(data_source.get_dataset_keys() * 2))
+        rendered = _render(table.Table(data_source, "stacked"))
+        for table_format, (extension, _) in table.FORMATS.items():
+            path = os.path.join(self.tmp_dir, "stacked" + table.FILE_SUFFIX + extension)
+            with open(path, "r") as f:
+                self.assertEqual(f.read(), rendered[table_format])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,178 @@
+"""
+Tests of logan.taskfarm, on a single rank and on several ranks with an
+in-process stand-in for the MPI communicator (ranks are threads).
+
+Run from the repository root with: python -m pytest tests
+"""
+
+import os
+import sys
+import pickle
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "lib", "python"))
+
+from logan.taskfarm import TaskFarm, TaskError
+
+class _StubMPI(object):
+    ANY_SOURCE = -1
+    ANY_TAG = -1
+
+    class Status(object):
+        def Get_source(self):
+            return self.source
+
+        def Get_tag(self):
+            return self.tag
+
+class _StubComm(object):
+    """
+    Point-to-point messages and bcast between the ranks of one process; all
+    ranks share condition and messages.
+    """
+    def __init__(self, rank, condition, messages, bcast_values):
+        self.rank = rank
+        self.condition = condition
+        self.messages = messages
+        self.bcast_values = bcast_values
+        self.bcast_count = 0
+
+    def _find(self, source, tag):
+        for index, (m_source, m_dest, m_tag, _) in enumerate(self.messages):
+            if m_dest == self.rank and source in (_StubMPI.ANY_SOURCE, m_source) and \
+                    tag in (_StubMPI.ANY_TAG, m_tag):
+                return index
+        return None
+
+    def send(self, data, dest, tag):
+        with self.condition:
+            # Copied, as MPI would.
+            self.messages.append((self.rank, dest, tag, pickle.loads(pickle.dumps(data))))
+            self.condition.notify_all()
+
+    def Iprobe(self, source, tag):
+        with self.condition:
+            return self._find(source, tag) is not None
+
+    def recv(self, source, tag, status):
+        with self.condition:
+            while self._find(source, tag) is None:
+                self.condition.wait()
+            status.source, _, status.tag, data = self.messages.pop(self._find(source, tag))
+            return data
+
+    def bcast(self, value, root=0):
+        with self.condition:
+            if self.rank == root:
+                self.bcast_values.append(value)
+                self.condition.notify_all()
+            while len(self.bcast_values) <= self.bcast_count:
+                self.condition.wait()
+            self.bcast_count += 1
+            return self.bcast_values[self.bcast_count - 1]
+
+def _make_task_farms(size):
+    condition = threading.Condition()
+    messages = []
+    bcast_values = []
+    task_farms = []
+    for rank in range(size):
+        task_farm = TaskFarm()
+        task_farm.MPI = _StubMPI
+        task_farm.comm = _StubComm(rank, condition, messages, bcast_values)
+        task_farm.rank = rank
+        task_farm.size = size
+        task_farms.append(task_farm)
+    return task_farms
+
+def _run_ranks(task_farms, function):
+    """
+    Calls function with each task farm, on a thread per rank other than 0.
+
+    @return: List of the return values per rank.
+    """
+    results = [None] * len(task_farms)
+    def _run(rank):
+        results[rank] = function(task_farms[rank])
+    threads = [threading.Thread(target=_run, args=(rank,))
+               for rank in range(1, len(task_farms))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    try:
+        _run(0)
+    finally:
+        for thread in threads:
+            thread.join(10)
+    for thread in threads:
+        if thread.is_alive():
+            raise Exception("Rank did not finish")
+    return results
+
+def _square(x):
+    if x < 0:
+        raise ValueError("negative task")
+    return x * x
+
+class TaskFarmTest(unittest.TestCase):
+    def test_single_rank(self):
+        task_farm = TaskFarm()
+        completed = []
+        self.assertEqual(task_farm.map(_square, [1, 2, 3],
+                                       lambda index, result: completed.append((index, result))),
+                         [1, 4, 9])
+        self.assertEqual(completed, [(0, 1), (1, 4), (2, 9)])
+        self.assertEqual(task_farm.bcast("value"), "value")
+        task_farm.cancel()
+
+        # Exceptions of tasks are not wrapped on a single rank.
+        self.assertRaises(ValueError, task_farm.map, _square, [1, -1])
+
+    def test_map(self):
+        tasks = list(range(50))
+        completed = []
+        def _map(task_farm):
+            return task_farm.map(_square, tasks if task_farm.is_root() else None,
+                                 lambda index, result: completed.append(index))
+
+        results = _run_ranks(_make_task_farms(4), _map)
+        self.assertEqual(results[0], [x * x for x in tasks])
+        self.assertEqual(results[1:], [None] * 3)
+        self.assertEqual(sorted(completed), tasks)
+
+    def test_task_error(self):
+        def _map(task_farm):
+            try:
+                return task_farm.map(_square, [1, -1, 2, -2] * 5)
+            except TaskError as e:
+                return e
+
+        results = _run_ranks(_make_task_farms(3), _map)
+        self.assertIsInstance(results[0], TaskError)
+        self.assertIn("10 of 20 tasks failed", str(results[0]))
+        self.assertIn("negative task", str(results[0]))
+        self.assertEqual(results[1:], [None] * 2)
+
+    def test_bcast_cancel(self):
+        def _run(task_farm):
+            # Rank 0 decides to map, but then fails to produce the tasks.
+            if task_farm.bcast(True if task_farm.is_root() else None):
+                if task_farm.is_root():
+                    task_farm.cancel()
+                    return "cancelled"
+                return task_farm.map(_square, None)
+            return "not mapped"
+
+        self.assertEqual(_run_ranks(_make_task_farms(3), _run), ["cancelled", None, None])
+
+        def _map_after_bcast(task_farm):
+            tasks = task_farm.bcast([1, 2, 3] if task_farm.is_root() else None)
+            return task_farm.map(_square, tasks)
+
+        self.assertEqual(_run_ranks(_make_task_farms(3), _map_after_bcast),
+                         [[1, 4, 9], None, None])
+
+if __name__ == "__main__":
+    unittest.main()